@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+from timeit import default_timer
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+
+from api.stats import request_measured, request_stats
+
+
+class MeasuredCursorWrapper(CursorWrapper):
+    """
+    Cursor that appends how long every query it runs takes to `durations`.
+    """
+    def __init__(self, cursor, db, durations):
+        super(MeasuredCursorWrapper, self).__init__(cursor, db)
+        self.durations = durations
+
+    def execute(self, sql, params=None):
+        started_at = default_timer()
+        try:
+            return super(MeasuredCursorWrapper, self).execute(sql, params)
+        finally:
+            self.durations.append(default_timer() - started_at)
+
+    def executemany(self, sql, param_list):
+        started_at = default_timer()
+        try:
+            return super(MeasuredCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            self.durations.append(default_timer() - started_at)
+
+
+def _measure_queries(connection, durations):
+    """
+    Makes every cursor `connection` creates from now on a `MeasuredCursorWrapper` (of the cursor it would create
+    otherwise, so queries are still logged as usual), until `_stop_measuring_queries` is called. Connections are
+    local to their thread, and so is this.
+    """
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: MeasuredCursorWrapper(make_cursor(cursor), connection, durations)
+    connection.make_debug_cursor = lambda cursor: MeasuredCursorWrapper(
+        make_debug_cursor(cursor), connection, durations)
+
+
+def _stop_measuring_queries(connection):
+    del connection.make_cursor
+    del connection.make_debug_cursor
+
+
+class RequestStatsMiddleware(object):
+    """
+    Measures every request to a view (the SQL queries it runs and how long they take, how long rendering its response
+    takes and its whole latency) into `request_stats`, keeping the latest `settings.COMPUTER_REQUEST_STATS_WINDOW`
+    requests per view, and sends `request_measured` along with them.
+
+    Django 1.11 has no hook around the execution of queries (`execute_wrapper` came with 2.0), so the cursors created
+    along the request are wrapped instead. It should be the first middleware for its latency to account for every
+    other one. Streamed responses (i.e. `exec/stream`) are measured until their content is exhausted, since most of
+    their work happens while it's iterated.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.COMPUTER_REQUEST_STATS_WINDOW and not request_measured.has_listeners():
+            return self.get_response(request)
+
+        started_at = default_timer()
+        durations = []
+        response = self._measured(self.get_response, durations, request)
+
+        view = getattr(request, 'stats_view', None)
+        if view is None:
+            return response
+        if response.streaming:
+            response.streaming_content = self._measured_stream(
+                response.streaming_content, request, view, durations, started_at)
+        else:
+            self._record(request, view, durations, started_at)
+        return response
+
+    @staticmethod
+    def _measured(func, durations, *args):
+        """
+        Calls `func`, appending how long every query it runs takes to `durations`.
+        """
+        databases = connections.all()
+        for connection in databases:
+            _measure_queries(connection, durations)
+        try:
+            return func(*args)
+        finally:
+            for connection in databases:
+                _stop_measuring_queries(connection)
+
+    def _measured_stream(self, streaming_content, request, view, durations, started_at):
+        """
+        Yields `streaming_content`, measuring the queries run to get every chunk of it (but not the time the server
+        takes to send them), and records the request once it's exhausted or the client goes away.
+        """
+        iterator = iter(streaming_content)
+        try:
+            while True:
+                try:
+                    chunk = self._measured(next, durations, iterator)
+                except StopIteration:
+                    return
+                yield chunk
+        finally:
+            self._record(request, view, durations, started_at)
+
+    def _record(self, request, view, durations, started_at):
+        measures = {
+            'queries': len(durations),
+            'db_time': sum(durations),
+            'serialization_time': getattr(request, 'stats_serialization_time', 0.0),
+            'latency': default_timer() - started_at,
+        }
+        if settings.COMPUTER_REQUEST_STATS_WINDOW:
+            request_stats.record(view, settings.COMPUTER_REQUEST_STATS_WINDOW, **measures)
+        request_measured.send(sender=self.__class__, view=view, **measures)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Names the view by its viewset and action (i.e. `ComputerViewset.insert`), or by its function otherwise.
+        """
+        actions = getattr(view_func, 'actions', None)
+        if actions and request.method.lower() in actions:
+            request.stats_view = '{}.{}'.format(view_func.cls.__name__, actions[request.method.lower()])
+        else:
+            request.stats_view = view_func.__name__
+
+    def process_template_response(self, request, response):
+        """
+        Times the rendering of responses rendered lazily, such as the ones of REST framework.
+        """
+        render_started_at = default_timer()
+
+        def rendered(response):
+            request.stats_serialization_time = default_timer() - render_started_at
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Fast path for rendering the responses of the hot endpoints of the API (`exec`, `stack/insert`, `stack/pointer` and
+`debug`): JSON byte for byte the same as REST framework's, with less work per response, and MessagePack for clients
+that ask for it (`Accept: application/msgpack`). Every other default renderer (i.e. the browsable API) is kept after
+the JSON one.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import msgpack
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.functional import Promise
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Same as `JSONRenderer`, but encoding with a single encoder built once, instead of one per response, unless the
+    client asked for an indented response (i.e. `Accept: application/json; indent=4`).
+    """
+    encoder = encoders.JSONEncoder(
+        ensure_ascii=JSONRenderer.ensure_ascii, allow_nan=not JSONRenderer.strict,
+        separators=(',', ':') if JSONRenderer.compact else (', ', ': '))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if accepted_media_type != self.media_type or (renderer_context or {}).get('indent') is not None:
+            return super(FastJSONRenderer, self).render(
+                data, accepted_media_type=accepted_media_type, renderer_context=renderer_context)
+        if data is None:
+            return bytes()
+        ret = self.encoder.encode(data)
+        # Same as `JSONRenderer`: escaped so the output is also valid JavaScript
+        if isinstance(ret, six.text_type):
+            ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+            return bytes(ret.encode('utf-8'))
+        return ret
+
+
+def _msgpack_default(value):
+    """
+    Returns `value` as something MessagePack can encode: lazy text as text, and ints beyond 64 bits as their decimal
+    text.
+    """
+    if isinstance(value, Promise):
+        return force_text(value)
+    if isinstance(value, six.integer_types):
+        return '{}'.format(value)
+    raise TypeError('{!r} is not serializable as MessagePack'.format(value))
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders the same data as `FastJSONRenderer` as MessagePack, a compact binary equivalent of JSON. Ints beyond 64
+    bits (i.e. the output of programs that multiply large numbers) can't be encoded as such, so they are sent as their
+    decimal text instead.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        return msgpack.packb(data, use_bin_type=True, default=_msgpack_default)
+
+
+def fast_renderer_classes(default_renderer_classes):
+    """
+    Returns the renderers of the hot endpoints: `FastJSONRenderer` first, in place of `JSONRenderer`, followed by every
+    other one of `default_renderer_classes` and by `MessagePackRenderer`.
+
+    :param default_renderer_classes: The renderers of every other endpoint
+    :return: tuple
+    """
+    renderer_classes = (FastJSONRenderer,) + tuple(
+        renderer_class for renderer_class in default_renderer_classes
+        if renderer_class not in (JSONRenderer, FastJSONRenderer))
+    return renderer_classes + (MessagePackRenderer,)
+
+
+FAST_RENDERER_CLASSES = fast_renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES)
+
+
+class FastContentNegotiation(DefaultContentNegotiation):
+    """
+    Same as `DefaultContentNegotiation`, but selecting the first renderer right away when the client accepts anything
+    or just its media type, as most clients do.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        accept = request.META.get('HTTP_ACCEPT', '*/*')
+        if (format_suffix is None and accept in ('*/*', renderers[0].media_type) and
+                api_settings.URL_FORMAT_OVERRIDE not in request.query_params):
+            return renderers[0], renderers[0].media_type
+        return super(FastContentNegotiation, self).select_renderer(request, renderers, format_suffix=format_suffix)
@@ -3,17 +3,38 @@
 
 from __future__ import print_function, unicode_literals
 
+import copy
+from collections import OrderedDict
+
 from rest_framework import serializers
 
-from computer.models import Computer
-from computer.enums import ComputerInstruction
+from django.conf import settings
+
+from computer.models import Computer, ExecutionJob, ExecutionSnapshot, Instruction
+from computer.enums import ComputerEngine, ComputerInstruction
+
+
+class PrecomputedFieldsMixin(object):
+    """
+    Mixin for flat serializers of hot endpoints, whose fields are deep-copied from their declaration once per class
+    instead of once per instance (which builds their validators and lazy error messages all over again), so every
+    instance only binds shallow copies of them.
+    """
+    def get_fields(self):
+        fields = type(self).__dict__.get('_precomputed_fields')
+        if fields is None:
+            fields = super(PrecomputedFieldsMixin, self).get_fields()
+            type(self)._precomputed_fields = fields
+        return OrderedDict((field_name, copy.copy(field)) for field_name, field in fields.items())
 
 
 class ComputerSerializer(serializers.ModelSerializer):
     """
     Serializer to manage `Computer` instances.
     """
-    stack = serializers.IntegerField(label='stack', write_only=True, help_text="Size of the computer's program stack.")
+    stack = serializers.IntegerField(
+        label='stack', write_only=True, max_value=Computer.MAX_ADDRESS,
+        help_text="Size of the computer's program stack.")
     debug_data = serializers.DictField(read_only=True, source='debug')
 
     class Meta:
@@ -28,32 +49,203 @@ class ComputerSerializer(serializers.ModelSerializer):
         return super(ComputerSerializer, self).create(validated_data)
 
 
-class ComputerPointerSerializer(serializers.Serializer):
+class ComputerPointerSerializer(PrecomputedFieldsMixin, serializers.Serializer):
     """
     Serializer to manage arguments passed to `Computer` pointer.
     """
     addr = serializers.IntegerField(
-        label='addr', write_only=True, help_text='The address to set the program stack pointer to.')
+        label='addr', write_only=True, max_value=Computer.MAX_ADDRESS,
+        help_text='The address to set the program stack pointer to.')
 
 
-class ComputerInsertSerializer(serializers.Serializer):
+class ComputerInsertSerializer(PrecomputedFieldsMixin, serializers.Serializer):
     """
     Serializer to manage arguments passed to `Computer` instructions.
     """
-    arg = serializers.IntegerField(label='arg', write_only=True, default=None, help_text='Required when using PUSH.')
-    addr = serializers.IntegerField(label='addr', write_only=True, default=None, help_text='Required when using CALL.')
+    arg = serializers.IntegerField(
+        label='arg', write_only=True, default=None, min_value=Instruction.MIN_ARG, max_value=Instruction.MAX_ARG,
+        help_text='Required when using PUSH.')
+    addr = serializers.IntegerField(
+        label='addr', write_only=True, default=None, min_value=Instruction.MIN_ARG, max_value=Instruction.MAX_ARG,
+        help_text='Required when using CALL.')
+
+    REQUIRED_ARG_ERRORS = ComputerInstruction.REQUIRED_ARG_ERRORS
 
     def validate_arg(self, value):
         if self.context['instruction'] == ComputerInstruction.PUSH and not value:
-            raise serializers.ValidationError('You must provide this value when using PUSH.')
+            raise serializers.ValidationError(self.REQUIRED_ARG_ERRORS[ComputerInstruction.PUSH])
         return value
 
     def validate_addr(self, value):
         if self.context['instruction'] == ComputerInstruction.CALL and not value:
-            raise serializers.ValidationError('You must provide this value when using CALL.')
+            raise serializers.ValidationError(self.REQUIRED_ARG_ERRORS[ComputerInstruction.CALL])
         return value
 
     def validate(self, data):
         if self.context['instruction'] == ComputerInstruction.CALL:
             data['arg'] = data.pop('addr')
         return data
+
+
+class ComputerProgramInstructionSerializer(serializers.Serializer):
+    """
+    Serializer to manage a single instruction of a program uploaded to `Computer` at once.
+    """
+    addr = serializers.IntegerField(
+        label='addr', max_value=Computer.MAX_ADDRESS, help_text='The address to insert the instruction at.')
+    instruction = serializers.CharField(label='instruction', help_text='The instruction to insert.')
+    arg = serializers.IntegerField(
+        label='arg', default=None, min_value=Instruction.MIN_ARG, max_value=Instruction.MAX_ARG,
+        help_text='Required when using PUSH (the value) or CALL (the address).')
+
+    def validate_instruction(self, value):
+        instruction = ComputerInstruction.get_value(value)
+        if not instruction:
+            raise serializers.ValidationError('You must provide a valid instruction')
+        return instruction
+
+    def validate(self, data):
+        required_arg_error = ComputerInsertSerializer.REQUIRED_ARG_ERRORS.get(data['instruction'])
+        if required_arg_error and not data['arg']:
+            raise serializers.ValidationError({'arg': [required_arg_error]})
+        return data
+
+
+class ComputerProgramSerializer(serializers.Serializer):
+    """
+    Serializer to manage a whole program uploaded to `Computer` at once.
+    """
+    program = ComputerProgramInstructionSerializer(
+        many=True, write_only=True, help_text='List of instructions, each one with its `addr` and optional `arg`.')
+
+
+class ComputerRunSerializer(PrecomputedFieldsMixin, serializers.Serializer):
+    """
+    Serializer to manage the query params shared by every way of running the program of a `Computer`: its engine and
+    its budgets.
+    """
+    max_steps = serializers.IntegerField(
+        label='max_steps', required=False, min_value=1, help_text='Budget of instructions to execute.')
+    timeout = serializers.FloatField(
+        label='timeout', required=False, min_value=0.001, help_text='Budget of seconds to execute for.')
+    engine = serializers.ChoiceField(
+        label='engine', required=False, default=ComputerEngine.COMPILED,
+        choices=(
+            ComputerEngine.REFERENCE, ComputerEngine.COMPILED, ComputerEngine.OPTIMIZED, ComputerEngine.IMAGE,
+            ComputerEngine.GENERATED),
+        help_text='Engine to execute the program with.')
+
+    def validate_max_steps(self, value):
+        return min(value, settings.COMPUTER_EXECUTION_MAX_STEPS)
+
+    def validate_timeout(self, value):
+        return min(value, settings.COMPUTER_EXECUTION_TIMEOUT)
+
+    def validate(self, data):
+        data.setdefault('max_steps', settings.COMPUTER_EXECUTION_MAX_STEPS)
+        data.setdefault('timeout', settings.COMPUTER_EXECUTION_TIMEOUT)
+        return data
+
+
+class ComputerExecuteSerializer(ComputerRunSerializer):
+    """
+    Serializer to manage the query params passed to execute the program of a `Computer`.
+    """
+    profile = serializers.BooleanField(
+        label='profile', required=False, default=False, help_text='Whether to return instrumentation data as well.')
+    suspend = serializers.BooleanField(
+        label='suspend', required=False, default=False,
+        help_text='Whether to suspend the execution into a snapshot once it runs out of its budget, to continue it '
+                  'through `exec/continue`, instead of failing.')
+
+    def get_fields(self):
+        fields = super(ComputerExecuteSerializer, self).get_fields()
+        # `async` is a reserved word in newer versions of Python, so it can't be declared as usual
+        fields['async'] = serializers.BooleanField(
+            label='async', required=False, default=False, help_text='Whether to execute the program as a job.')
+        return fields
+
+
+class ComputerContinueSerializer(ComputerRunSerializer):
+    """
+    Serializer to manage the query params passed to continue a suspended execution of the program of a `Computer`.
+    """
+    snapshot = serializers.CharField(
+        label='snapshot', max_length=16, help_text='ID of the snapshot the execution was suspended into.')
+
+
+class ComputerEditingSessionSerializer(PrecomputedFieldsMixin, serializers.Serializer):
+    """
+    Serializer to manage the editing session given to edit or read a `Computer` within it.
+    """
+    session = serializers.CharField(
+        label='session', required=False, default=None, max_length=16,
+        help_text='ID of the editing session to make the changes in, or to read the computer as edited in.')
+
+
+class ComputerDebugSerializer(PrecomputedFieldsMixin, serializers.Serializer):
+    """
+    Serializer to manage the query params passed to debug a `Computer`.
+    """
+    optimized = serializers.BooleanField(
+        label='optimized', required=False, default=False,
+        help_text='Whether to include the program as rewritten by the optimizer.')
+
+
+class ComputerBatchExecuteSerializer(serializers.Serializer):
+    """
+    Serializer to manage the `Computer`s to execute in a batch.
+    """
+    ids = serializers.ListField(
+        child=serializers.CharField(max_length=7), write_only=True, help_text='IDs of the computers to execute.')
+
+    def validate_ids(self, value):
+        if not value:
+            raise serializers.ValidationError('You must provide at least one ID.')
+        if len(value) > settings.COMPUTER_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                'You cannot execute more than {} computers at once.'.format(settings.COMPUTER_BATCH_MAX_SIZE))
+        return list(OrderedDict.fromkeys(value))
+
+
+class ComputerSweepSerializer(serializers.Serializer):
+    """
+    Serializer to manage the matrix of PUSH args to execute the program of a `Computer` with.
+    """
+    args = serializers.ListField(
+        child=serializers.ListField(
+            child=serializers.IntegerField(min_value=Instruction.MIN_ARG, max_value=Instruction.MAX_ARG)),
+        write_only=True, help_text='Rows of PUSH args, one per execution.')
+    addresses = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=Computer.MAX_ADDRESS), write_only=True, required=False,
+        default=None, help_text='Addresses of the PUSHes whose args are swept; all of them by default, in order.')
+
+    def validate_args(self, value):
+        if not value:
+            raise serializers.ValidationError('You must provide at least one row.')
+        if len(value) > settings.COMPUTER_SWEEP_MAX_ROWS:
+            raise serializers.ValidationError(
+                'You cannot execute more than {} rows at once.'.format(settings.COMPUTER_SWEEP_MAX_ROWS))
+        return value
+
+
+class ExecutionJobSerializer(serializers.ModelSerializer):
+    """
+    Serializer to show `ExecutionJob` instances.
+    """
+    program_output = serializers.ListField(read_only=True)
+
+    class Meta:
+        model = ExecutionJob
+        fields = ('id', 'computer', 'status', 'program_output', 'steps', 'error', 'created_at', 'finished_at')
+        read_only_fields = fields
+
+
+class ExecutionSnapshotSerializer(serializers.ModelSerializer):
+    """
+    Serializer to show `ExecutionSnapshot` instances, leaving their memory out.
+    """
+    class Meta:
+        model = ExecutionSnapshot
+        fields = ('id', 'computer', 'program_counter', 'output_cursor', 'steps', 'created_at', 'updated_at')
+        read_only_fields = fields
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Per-view statistics of the latest requests served by this process (see `api.middleware.RequestStatsMiddleware`): how
+many SQL queries they ran, how long those took, how long rendering their response took and their whole latency.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import threading
+from collections import OrderedDict, deque
+
+from django.dispatch import Signal
+
+# Sent once a request to a view was measured, with the name of the view and every measure of `RequestStats.MEASURES`
+request_measured = Signal(providing_args=['view', 'queries', 'db_time', 'serialization_time', 'latency'])
+
+# Upper bounds of the buckets of every histogram: query counts, and seconds for everything else
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50, 100)
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class RollingHistogram(object):
+    """
+    Distribution of the latest `size` samples of a measure.
+    """
+    __slots__ = ('buckets', 'samples')
+
+    def __init__(self, buckets, size):
+        self.buckets = buckets
+        self.samples = deque(maxlen=size)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def as_dict(self):
+        """
+        Returns a summary of the samples: their count, mean, some percentiles, maximum and how many fall into every
+        bucket (by its upper bound, cumulative as in Prometheus; the last bucket has no bound).
+
+        :return: dict
+        """
+        samples = sorted(self.samples)
+        if not samples:
+            return {'count': 0}
+        percentile = lambda fraction: samples[min(len(samples) - 1, int(fraction * len(samples)))]
+        buckets = []
+        index = 0
+        for bound in self.buckets:
+            while index < len(samples) and samples[index] <= bound:
+                index += 1
+            buckets.append([bound, index])
+        buckets.append([None, len(samples)])
+        return OrderedDict([
+            ('count', len(samples)),
+            ('mean', sum(samples) / float(len(samples))),
+            ('p50', percentile(0.5)),
+            ('p90', percentile(0.9)),
+            ('p99', percentile(0.99)),
+            ('max', samples[-1]),
+            ('buckets', buckets),
+        ])
+
+
+class RequestStats(object):
+    """
+    Process-wide rolling histograms of the measures of the latest `size` requests to every view.
+    """
+    MEASURES = (
+        ('queries', QUERY_BUCKETS),
+        ('db_time', TIME_BUCKETS),
+        ('serialization_time', TIME_BUCKETS),
+        ('latency', TIME_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+
+    def record(self, view, size, **measures):
+        """
+        Adds the measures of a request to the histograms of `view`.
+
+        :param view: The name of the view that served the request
+        :param size: How many requests to keep track of per view
+        :param measures: The value of every measure of `MEASURES`
+        :return: None
+        """
+        with self._lock:
+            histograms = self.views.get(view)
+            if histograms is None or histograms['latency'].samples.maxlen != size:
+                histograms = self.views[view] = {
+                    measure: RollingHistogram(buckets, size) for measure, buckets in self.MEASURES}
+            for measure, _ in self.MEASURES:
+                histograms[measure].add(measures[measure])
+
+    def as_dict(self):
+        """
+        Returns the summary of every histogram, by view and measure.
+
+        :return: dict
+        """
+        with self._lock:
+            return OrderedDict(
+                (view, OrderedDict((measure, histograms[measure].as_dict()) for measure, _ in self.MEASURES))
+                for view, histograms in sorted(self.views.items()))
+
+
+request_stats = RequestStats()
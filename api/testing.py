@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+from contextlib import contextmanager
+
+from api.stats import request_measured
+
+
+class QueryBudgetMixin(object):
+    """
+    Mixin for test cases to assert how many SQL queries requests to every view run, as measured by
+    `RequestStatsMiddleware`, so that queries added to a view (i.e. one per instruction) fail the suite, and so do
+    queries removed from it until its budget is lowered.
+    """
+    @contextmanager
+    def assertQueryBudgets(self, budgets):
+        """
+        Fails if any request made within the block runs more queries than the budget of its view, if its view has no
+        budget at all, or if no request to its view runs as many queries as its budget.
+
+        :param budgets: Dict of view name (i.e. `ComputerViewset.insert`) -> number of queries of its costliest request
+        """
+        measured = []
+
+        def receiver(sender, view, queries, **kwargs):
+            measured.append((view, queries))
+        request_measured.connect(receiver, weak=False, dispatch_uid='query-budget')
+        try:
+            yield
+        finally:
+            request_measured.disconnect(dispatch_uid='query-budget')
+        over_budget = [
+            '{} ran {} queries{}'.format(
+                view, queries, ', but has no budget' if view not in budgets else
+                ' out of a budget of {}'.format(budgets[view]))
+            for view, queries in measured if queries > budgets.get(view, -1)]
+        if over_budget:
+            self.fail('Requests over their query budget: {}'.format('; '.join(over_budget)))
+        most_queries = {}
+        for view, queries in measured:
+            most_queries[view] = max(queries, most_queries.get(view, 0))
+        under_budget = [
+            '{} ran {} queries at most out of a budget of {}'.format(view, queries, budgets[view])
+            for view, queries in sorted(most_queries.items()) if queries < budgets[view]]
+        if under_budget:
+            self.fail('Views under their query budget, which should be lowered: {}'.format('; '.join(under_budget)))
@@ -3,13 +3,65 @@
 
 from __future__ import print_function, unicode_literals
 
+import json
+import time
+from datetime import timedelta
+
 from rest_framework import status
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.test import APIClient, APITestCase
 
+from django.conf import settings
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from api import renderers
+from api.middleware import RequestStatsMiddleware
+from api.stats import request_stats
+from api.testing import QueryBudgetMixin
+from computer import sessions, sweep
+from computer.checks import check_editing_session_cache
+from computer.jobs import STALE_HEARTBEATS, STALE_JOB_ERROR, fail_stale_jobs, run_job
+from computer.models import Computer, ExecutionJob, ExecutionSnapshot
+from computer.sessions import EditingSession, flush_if_idle
+
+# Queries the costliest request to every view runs, within a test: transactions there don't begin (the test already
+# did), while those started by views are savepoints, which take one query to be set and another one to be released
+QUERY_BUDGETS = {
+    # INSERT of the computer
+    'ComputerViewset.create': 1,
+    # SELECT of the computer
+    'ComputerViewset.retrieve': 1,
+    'ComputerViewset.debug': 1,
+    'ComputerViewset.execute': 1,
+    'ComputerViewset.execute_stream': 1,
+    'ComputerViewset.open_session': 1,
+    # SELECT and UPDATE of the computer
+    'ComputerViewset.pointer': 2,
+    # SELECT and UPDATE of the computer, and upsert of the instruction
+    'ComputerViewset.insert': 3,
+    # SELECT and UPDATE of the computer, DELETE and INSERT of the instructions, and a savepoint
+    'ComputerViewset.program': 6,
+    'ComputerViewset.assembly': 6,
+    # The same, plus the UPDATE that checks the version of the computer
+    'ComputerViewset.commit_session': 7,
+    'stats': 0,
+}
+
+
+# Caches as deployed with editing sessions kept in memcached or redis, which run no queries, as a local memory cache
+# does (and within a single process, it's just as shared)
+MEMORY_EDITING_CACHES = dict(settings.CACHES, editing={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'computer-editing-sessions',
+})
 
 
-class ComputerAPITestCase(APITestCase):
+class ComputerAPITestCase(QueryBudgetMixin, APITestCase):
     """
     Test case that check the behavior of the Computer API.
 
@@ -19,11 +71,19 @@ class ComputerAPITestCase(APITestCase):
     def setUp(self):
         self.api = APIClient()
         self.computers_url = reverse('computer-list')
+        self.computers_execute_batch = reverse('computer-execute-batch')
         self.computer_pointer_url = lambda computer_id: reverse('computer-pointer', kwargs={'pk': computer_id})
         self.computer_insert = lambda computer_id, possible_instruction: reverse(
             'computer-insert', kwargs={'pk': computer_id, 'possible_instruction': possible_instruction})
+        self.computer_program = lambda computer_id: reverse('computer-program', kwargs={'pk': computer_id})
         self.computer_execute = lambda computer_id: reverse('computer-execute', kwargs={'pk': computer_id})
+        self.computer_execute_sweep = lambda computer_id: reverse('computer-execute-sweep', kwargs={'pk': computer_id})
+        self.computer_execute_stream = lambda computer_id: reverse(
+            'computer-execute-stream', kwargs={'pk': computer_id})
         self.computer_debug = lambda computer_id: reverse('computer-debug', kwargs={'pk': computer_id})
+        self.computer_execute_continue = lambda computer_id, snapshot_id: '{}?snapshot={}'.format(
+            reverse('computer-execute-continue', kwargs={'pk': computer_id}), snapshot_id)
+        self.job_url = lambda job_id: reverse('executionjob-detail', kwargs={'pk': job_id})
 
     def test_good_program(self):
         """
@@ -100,3 +160,561 @@ class ComputerAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         program_output_data = response.data['program_output']
         self.assertEqual(program_output_data, [49, 49])
+
+    def test_program_upload(self):
+        """
+        The program given originally by the test description can be uploaded at once and produces the expected output,
+        while invalid programs are rejected without touching the `Computer`.
+        """
+        response = self.api.post(self.computers_url, {'stack': 100})
+        computer_id = response.data['id']
+        response = self.api.post(self.computer_program(computer_id), {'program': [
+            {'addr': 6, 'instruction': 'STOP'},
+            {'addr': 0, 'instruction': 'PUSH', 'arg': 1},
+            {'addr': 1, 'instruction': 'CALL'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.api.post(self.computer_program(computer_id), {'program': [
+            {'addr': 101, 'instruction': 'STOP'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.api.post(self.computer_debug(computer_id)).data['program_stack'], [])
+
+        response = self.api.post(self.computer_program(computer_id), {'program': [
+            {'addr': 50, 'instruction': 'MULT'},
+            {'addr': 51, 'instruction': 'PRINT'},
+            {'addr': 52, 'instruction': 'RET'},
+            {'addr': 0, 'instruction': 'PUSH', 'arg': 1009},
+            {'addr': 1, 'instruction': 'PRINT'},
+            {'addr': 2, 'instruction': 'PUSH', 'arg': 6},
+            {'addr': 3, 'instruction': 'PUSH', 'arg': 101},
+            {'addr': 4, 'instruction': 'PUSH', 'arg': 10},
+            {'addr': 5, 'instruction': 'CALL', 'arg': 50},
+            {'addr': 6, 'instruction': 'STOP'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['program_stack']), 10)
+        response = self.api.post(self.computer_execute(computer_id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['program_output'], [1009, 1010])
+
+    def test_assembly_upload(self):
+        """
+        Programs can be uploaded as assembly text with labels, while sources with errors are rejected with their lines
+        without touching the `Computer`.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 100}).data['id']
+        assembly_url = reverse('computer-assembly', kwargs={'pk': computer_id})
+        response = self.api.post(assembly_url, 'PUSH 1\nCALL\n.org 101\n', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['source'], [
+            'Line 2: CALL takes an arg', 'Line 3: .org needs an address between 0 and 100'])
+        self.assertEqual(self.api.post(self.computer_debug(computer_id)).data['program_stack'], [])
+
+        source = (
+            '.org 50\nprint_tenten: MULT\nPRINT\nRET\n'
+            '.org 0\nPUSH 1009\nPRINT\nPUSH after\nPUSH 101\nPUSH 10\nCALL print_tenten\nafter: STOP\n')
+        response = self.api.post(assembly_url, source, content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'instructions': 10, 'labels': {'print_tenten': 50, 'after': 6}})
+        response = self.api.post(self.computer_execute(computer_id))
+        self.assertEqual(response.data['program_output'], [1009, 1010])
+
+    @override_settings(COMPUTER_JOB_WORKERS=0)
+    def test_runaway_program(self):
+        """
+        A program that never ends (growing its memory forever, so it never repeats itself) is stopped once it runs out
+        of its budget, both when executed within the request and when executed as a job.
+        """
+        response = self.api.post(self.computers_url, {'stack': 10})
+        computer_id = response.data['id']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 7})
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 7})
+        self.api.post(self.computer_insert(computer_id, 'CALL'), {'addr': 2})
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+        response = self.api.post(self.computer_execute(computer_id) + '?max_steps=50')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['program_output'], [7])
+        self.assertEqual(response.data['steps'], 50)
+
+        with self.settings(COMPUTER_JOB_MAX_STEPS=1000):
+            response = self.api.post(self.computer_execute(computer_id) + '?async=1')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.api.get(self.job_url(response.data['id']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertEqual(response.data['program_output'], [7])
+        self.assertEqual(response.data['steps'], 1000)
+
+    def test_cached_program_budget(self):
+        """
+        Outputs served from the execution cache still have to fit the budget of the request, so a request fails the
+        same way whether the program was executed before or not.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 7})
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.post(self.computer_insert(computer_id, 'STOP'))
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+        self.assertEqual(self.api.post(self.computer_execute(computer_id)).data, {'program_output': [7]})
+        response = self.api.post(self.computer_execute(computer_id) + '?max_steps=2')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual((response.data['program_output'], response.data['steps']), ([7], 2))
+        response = self.api.post(self.computer_execute(computer_id) + '?max_steps=3')
+        self.assertEqual(response.data, {'program_output': [7]})
+
+    def test_stale_job(self):
+        """
+        Jobs left behind by a process that stopped (so they missed their heartbeats) are failed, and never run.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+        stale_at = timezone.now() - timedelta(seconds=settings.COMPUTER_JOB_HEARTBEAT_INTERVAL * STALE_HEARTBEATS + 1)
+        running_job = ExecutionJob.objects.create(
+            computer_id=computer_id, status=ExecutionJob.RUNNING, heartbeat_at=stale_at)
+        pending_job = ExecutionJob.objects.create(computer_id=computer_id, heartbeat_at=stale_at)
+        live_job = ExecutionJob.objects.create(computer_id=computer_id, heartbeat_at=timezone.now())
+
+        response = self.api.get(self.job_url(running_job.pk))
+        self.assertEqual((response.data['status'], response.data['error']), ('failed', STALE_JOB_ERROR))
+        self.assertEqual(fail_stale_jobs(), 1)
+        run_job(pending_job.pk)
+        self.assertEqual(ExecutionJob.objects.get(pk=pending_job.pk).status, ExecutionJob.FAILED)
+        self.assertEqual(self.api.get(self.job_url(live_job.pk)).data['status'], 'pending')
+
+    def test_suspended_program(self):
+        """
+        Executions can be suspended into a snapshot once they run out of their budget, and continued by later requests
+        for as long as the program stays the same, getting only the values printed since then.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+        for arg in (1, 2, 3):
+            self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': arg})
+            self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.post(self.computer_insert(computer_id, 'STOP'))
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+        response = self.api.post(self.computer_execute(computer_id) + '?suspend=1&max_steps=3')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['program_output'], [1])
+        snapshot = response.data['snapshot']
+        self.assertEqual((snapshot['program_counter'], snapshot['output_cursor'], snapshot['steps']), (3, 1, 3))
+
+        response = self.api.post(self.computer_execute_continue(computer_id, snapshot['id']) + '&max_steps=3')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['program_output'], [2, 3])
+        self.assertEqual(response.data['snapshot']['output_cursor'], 3)
+        response = self.api.post(self.computer_execute_continue(computer_id, snapshot['id']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'program_output': []})
+        response = self.api.post(self.computer_execute_continue(computer_id, snapshot['id']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.api.post(self.computer_execute(computer_id) + '?suspend=1&max_steps=1')
+        snapshot = response.data['snapshot']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 4})
+        response = self.api.post(self.computer_execute_continue(computer_id, snapshot['id']))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_expired_snapshot(self):
+        """
+        Snapshots not continued for long enough expire: they can't be continued anymore, and are deleted on request or
+        along with the next execution of their computer that's suspended.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 1})
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+        suspend = lambda: self.api.post(self.computer_execute(computer_id) + '?suspend=1&max_steps=1').data['snapshot']
+        expire = lambda *snapshot_ids: ExecutionSnapshot.objects.filter(pk__in=snapshot_ids).update(
+            updated_at=timezone.now() - timedelta(seconds=settings.COMPUTER_SNAPSHOT_TTL + 1))
+
+        snapshot_id = suspend()['id']
+        expire(snapshot_id)
+        response = self.api.post(self.computer_execute_continue(computer_id, snapshot_id))
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertFalse(ExecutionSnapshot.objects.filter(pk=snapshot_id).exists())
+
+        expired_ids = [suspend()['id'], suspend()['id']]
+        expire(*expired_ids)
+        snapshot_id = suspend()['id']
+        self.assertEqual(list(ExecutionSnapshot.objects.values_list('pk', flat=True)), [snapshot_id])
+
+        expire(snapshot_id)
+        output = StringIO()
+        call_command('prune_snapshots', stdout=output)
+        self.assertEqual(output.getvalue(), 'Deleted 1 snapshots\n')
+        self.assertFalse(ExecutionSnapshot.objects.exists())
+
+    def test_streamed_program(self):
+        """
+        The output of a program can be streamed as lines of JSON, followed by its error if it fails.
+        """
+        response = self.api.post(self.computers_url, {'stack': 10})
+        computer_id = response.data['id']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 7})
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 49})
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.post(self.computer_insert(computer_id, 'STOP'))
+        response = self.api.post(self.computer_execute_stream(computer_id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(b''.join(response.streaming_content), b'7\n49\n')
+
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 4})
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        response = self.api.post(self.computer_execute_stream(computer_id))
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(lines[:2], [b'7', b'49'])
+        self.assertIn(b'Unexpected error', lines[2])
+
+    def test_batch_execution(self):
+        """
+        Many computers can be executed at once, each one of them with its own output or error.
+        """
+        computer_ids = []
+        for arg in (7, 49, None):
+            computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+            if arg:
+                self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': arg})
+            self.api.post(self.computer_insert(computer_id, 'PRINT'))
+            self.api.post(self.computer_insert(computer_id, 'STOP'))
+            computer_ids.append(computer_id)
+        response = self.api.post(self.computers_execute_batch, {'ids': computer_ids + ['missing']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual(results[computer_ids[0]], {'program_output': [7]})
+        self.assertEqual(results[computer_ids[1]], {'program_output': [49]})
+        self.assertIn('Unexpected error', results[computer_ids[2]]['detail'])
+        self.assertEqual(results['missing'], {'detail': 'Not found.'})
+
+    def test_swept_program(self):
+        """
+        The program can be executed once per row of a matrix of PUSH args, in lockstep or not, with the output (or
+        error) of every row, including products that overflow 64 bits.
+        """
+        response = self.api.post(self.computers_url, {'stack': 100})
+        computer_id = response.data['id']
+        self.api.post(self.computer_program(computer_id), {'program': [
+            {'addr': 50, 'instruction': 'MULT'},
+            {'addr': 51, 'instruction': 'PRINT'},
+            {'addr': 52, 'instruction': 'RET'},
+            {'addr': 0, 'instruction': 'PUSH', 'arg': 1009},
+            {'addr': 1, 'instruction': 'PRINT'},
+            {'addr': 2, 'instruction': 'PUSH', 'arg': 6},
+            {'addr': 3, 'instruction': 'PUSH', 'arg': 101},
+            {'addr': 4, 'instruction': 'PUSH', 'arg': 10},
+            {'addr': 5, 'instruction': 'CALL', 'arg': 50},
+            {'addr': 6, 'instruction': 'STOP'},
+        ]}, format='json')
+        args = [[101, 10], [3, 5], [2 ** 62, 4], [0, 10]]
+        numpy = sweep.numpy
+        # Without NumPy every row is executed on its own
+        for lanes_numpy in (numpy, None):
+            sweep.numpy = lanes_numpy
+            try:
+                response = self.api.post(
+                    self.computer_execute_sweep(computer_id), {'args': args, 'addresses': [3, 4]}, format='json')
+            finally:
+                sweep.numpy = numpy
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                response.data['program_outputs'], [[1009, 1010], [1009, 15], [1009, 2 ** 64], None])
+            self.assertEqual(response.data['details'][:3], [None, None, None])
+            self.assertIn('Unexpected error', response.data['details'][3])
+
+        response = self.api.post(self.computer_execute_sweep(computer_id), {'args': [[1, 2]]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.api.post(
+            self.computer_execute_sweep(computer_id), {'args': [[1]], 'addresses': [1]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_profiled_program(self):
+        """
+        Profiled executions return how many times every instruction ran, and are aggregated into the metrics.
+        """
+        response = self.api.post(self.computers_url, {'stack': 10})
+        computer_id = response.data['id']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 7})
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 7})
+        self.api.post(self.computer_insert(computer_id, 'MULT'))
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.post(self.computer_insert(computer_id, 'STOP'))
+        response = self.api.post(self.computer_execute(computer_id) + '?profile=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['program_output'], [49])
+        profile = response.data['profile']
+        self.assertEqual(profile['instructions'], {'PUSH': 2, 'MULT': 1, 'PRINT': 1, 'STOP': 1, 'CALL': 0, 'RET': 0})
+        self.assertEqual((profile['steps'], profile['memory_high_water'], profile['output_size']), (5, 2, 1))
+
+        response = self.api.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'computer_instructions_executed_total{instruction="MULT"}', response.content)
+
+    def test_conditional_get(self):
+        """
+        Computers and their debug data are tagged with an `ETag` that changes along with them, so polling an unchanged
+        computer with `If-None-Match` is answered with a `304` after a single query.
+        """
+        response = self.api.post(self.computers_url, {'stack': 10})
+        computer_id = response.data['id']
+        computer_url = reverse('computer-detail', kwargs={'pk': computer_id})
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 7})
+        response = self.api.get(computer_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['debug_data']['program_stack'], [(0, ('push', 7))])
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.api.get(computer_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        with self.assertNumQueries(1):
+            response = self.api.get(self.computer_debug(computer_id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.api.get(self.computer_debug(computer_id) + '?optimized=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('optimized_program_stack', response.data)
+
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        response = self.api.get(computer_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['debug_data']['program_stack'], [(0, ('push', 7)), (1, ('print', None))])
+        self.assertNotEqual(response['ETag'], etag)
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 5})
+        response = self.api.get(self.computer_debug(computer_id), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['program_stack_pointer'], '5')
+
+    @override_settings(COMPUTER_EDITING_SESSION_IDLE_TIMEOUT=0, CACHES=MEMORY_EDITING_CACHES)
+    def test_editing_session(self):
+        """
+        Changes made within an editing session are buffered, shown only within it, and written at once when it's
+        committed (or flushed once idle), unless the program changed in the meantime.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+        computer_url = reverse('computer-detail', kwargs={'pk': computer_id})
+        response = self.api.post(reverse('computer-session', kwargs={'pk': computer_id}))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        session = '?session={}'.format(response.data['session'])
+        self.api.post(self.computer_insert(computer_id, 'PUSH') + session, {'arg': 7})
+        with self.assertNumQueries(1):
+            response = self.api.post(self.computer_insert(computer_id, 'PRINT') + session)
+        self.assertEqual(response.data['program_stack'], [(0, ('push', 7)), (1, ('print', None))])
+        self.assertEqual(response.data['program_stack_pointer'], '2')
+        self.api.patch(self.computer_pointer_url(computer_id) + session, {'addr': 5})
+        self.api.post(self.computer_insert(computer_id, 'STOP') + session)
+        self.assertEqual(self.api.get(computer_url).data['debug_data']['program_stack'], [])
+        response = self.api.get(computer_url + session)
+        self.assertEqual(len(response.data['debug_data']['program_stack']), 3)
+        self.assertEqual(response.data['debug_data']['program_stack_pointer'], '6')
+
+        response = self.api.post(reverse('computer-session-commit', kwargs={'pk': computer_id}) + session)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.api.get(computer_url).data['debug_data'], response.data)
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+        self.assertEqual(self.api.post(self.computer_execute(computer_id)).data['program_output'], [7])
+        response = self.api.get(computer_url + session)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        session = '?session={}'.format(
+            self.api.post(reverse('computer-session', kwargs={'pk': computer_id})).data['session'])
+        self.api.post(self.computer_insert(computer_id, 'PUSH') + session, {'arg': 8})
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 9})
+        response = self.api.post(reverse('computer-session-commit', kwargs={'pk': computer_id}) + session)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        session_id = self.api.post(reverse('computer-session', kwargs={'pk': computer_id})).data['session']
+        self.api.post(self.computer_insert(computer_id, 'PRINT') + '?session={}'.format(session_id))
+        flush_if_idle(session_id)
+        self.assertEqual(self.api.get(computer_url).data['debug_data']['program_stack'][1], (1, ('print', None)))
+
+    @override_settings(COMPUTER_EDITING_SESSION_IDLE_TIMEOUT=0)
+    def test_concurrent_editing_session(self):
+        """
+        Changes made at once within the same session, by requests served by any worker, are all kept, and sessions
+        are only kept in caches shared by every worker.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+        session_id = self.api.post(reverse('computer-session', kwargs={'pk': computer_id})).data['session']
+        computer = Computer.objects.get(pk=computer_id)
+        session, other_session = EditingSession.get(session_id), EditingSession.get(session_id)
+        session.apply(computer).insert('push', 7)
+        other_computer = Computer.objects.get(pk=computer_id)
+        other_session.apply(other_computer).set_address(5).insert('print')
+        session.update(computer)
+        other_session.update(other_computer)
+        self.assertEqual(EditingSession.get(session_id).instructions, {0: ('push', 7), 5: ('print', None)})
+
+        with EditingSession._lock(session_id):
+            self.addCleanup(setattr, sessions, 'LOCK_WAIT', sessions.LOCK_WAIT)
+            sessions.LOCK_WAIT = 0
+            response = self.api.post(self.computer_insert(computer_id, 'STOP') + '?session={}'.format(session_id))
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.api.post(reverse('computer-session-commit', kwargs={'pk': computer_id}) + '?session={}'.format(
+            session_id))
+        self.assertEqual(response.data['program_stack'], [(0, ('push', 7)), (5, ('print', None))])
+
+        self.assertEqual(check_editing_session_cache(None), [])
+        with self.settings(CACHES=MEMORY_EDITING_CACHES):
+            self.assertEqual([error.id for error in check_editing_session_cache(None)], ['computer.E001'])
+
+    @override_settings(COMPUTER_EDITING_SESSION_IDLE_TIMEOUT=60, CACHES=MEMORY_EDITING_CACHES)
+    def test_idle_editing_session(self):
+        """
+        Sessions that have been idle for long enough are committed by the `flush_sessions` command, or by the first
+        request that finds them, even if the process whose timer should have committed them is gone.
+        """
+        def edit():
+            computer_id = self.api.post(self.computers_url, {'stack': 10}).data['id']
+            session_id = self.api.post(reverse('computer-session', kwargs={'pk': computer_id})).data['session']
+            self.api.post(self.computer_insert(computer_id, 'PRINT') + '?session={}'.format(session_id))
+            return computer_id, session_id
+
+        def make_idle(session_id):
+            cache, key = EditingSession._cache(), EditingSession._key(session_id)
+            cache.set(key, dict(cache.get(key), touched_at=time.time() - 60))
+
+        def program_stack(computer_id):
+            return Computer.objects.get(pk=computer_id).program_stack
+
+        def cancel_timers():
+            for session_id in list(sessions._timers):
+                sessions._timers.pop(session_id).cancel()
+
+        self.addCleanup(cancel_timers)
+        computer_id, session_id = edit()
+        other_computer_id, other_session_id = edit()
+        self.assertEqual(EditingSession.open_ids(), {session_id, other_session_id})
+        make_idle(session_id)
+        output = StringIO()
+        call_command('flush_sessions', stdout=output)
+        self.assertEqual(output.getvalue(), 'Committed 1 sessions\n')
+        self.assertEqual(program_stack(computer_id), {0: ('print', None)})
+        self.assertEqual((program_stack(other_computer_id), EditingSession.open_ids()), ({}, {other_session_id}))
+
+        make_idle(other_session_id)
+        response = self.api.get(reverse('computer-detail', kwargs={'pk': other_computer_id}) + '?session={}'.format(
+            other_session_id))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual((program_stack(other_computer_id), EditingSession.open_ids()), ({0: ('print', None)}, set()))
+
+        with self.settings(COMPUTER_EDITING_SESSION_IDLE_TIMEOUT=0):
+            output = StringIO()
+            call_command('flush_sessions', stdout=output)
+            self.assertEqual(output.getvalue(), 'Editing sessions are only committed on request\n')
+
+    @override_settings(COMPUTER_EDITING_SESSION_IDLE_TIMEOUT=0, CACHES=MEMORY_EDITING_CACHES)
+    def test_query_budgets(self):
+        """
+        Every request stays within the query budget of its view, and its measures are served from `/stats`.
+        """
+        request_stats.reset()
+        with self.assertQueryBudgets(QUERY_BUDGETS):
+            computer_id = self.api.post(self.computers_url, {'stack': 100}).data['id']
+            self.api.patch(self.computer_pointer_url(computer_id), {'addr': 50})
+            self.api.post(self.computer_insert(computer_id, 'MULT'))
+            self.api.post(self.computer_insert(computer_id, 'PRINT'))
+            self.api.post(self.computer_insert(computer_id, 'RET'))
+            self.api.post(self.computer_program(computer_id), {'program': [
+                {'addr': 0, 'instruction': 'PUSH', 'arg': 1009}, {'addr': 1, 'instruction': 'PRINT'},
+                {'addr': 2, 'instruction': 'PUSH', 'arg': 6}, {'addr': 3, 'instruction': 'PUSH', 'arg': 101},
+            ]}, format='json')
+            self.api.post(
+                reverse('computer-assembly', kwargs={'pk': computer_id}), '.org 4\nPUSH 10\nCALL 50\n',
+                content_type='text/plain')
+            session = '?session={}'.format(
+                self.api.post(reverse('computer-session', kwargs={'pk': computer_id})).data['session'])
+            self.api.post(self.computer_insert(computer_id, 'STOP') + session)
+            self.api.post(reverse('computer-session-commit', kwargs={'pk': computer_id}) + session)
+            self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+            self.assertEqual(self.api.post(self.computer_execute(computer_id)).data['program_output'], [1009, 1010])
+            response = self.api.post(self.computer_execute_stream(computer_id) + '?max_steps=1000')
+            self.assertEqual(b''.join(response.streaming_content), b'1009\n1010\n')
+            self.api.get(reverse('computer-detail', kwargs={'pk': computer_id}))
+            self.api.get(self.computer_debug(computer_id))
+            response = self.api.get(reverse('stats'))
+
+        stats = json.loads(response.content.decode('utf-8'))
+        insert_queries = stats['ComputerViewset.insert']['queries']
+        self.assertEqual(insert_queries['max'], QUERY_BUDGETS['ComputerViewset.insert'])
+        # Only the insert within the session ran a single query (by bucket: at most 1 query -> number of requests)
+        self.assertEqual(insert_queries['buckets'][1], [1, 1])
+        self.assertEqual(stats['ComputerViewset.pointer']['queries']['max'], QUERY_BUDGETS['ComputerViewset.pointer'])
+        self.assertGreater(stats['ComputerViewset.execute']['latency']['max'], 0)
+        self.assertGreater(stats['ComputerViewset.execute']['serialization_time']['max'], 0)
+        self.assertGreater(stats['ComputerViewset.execute']['db_time']['max'], 0)
+
+    def test_streamed_request_stats(self):
+        """
+        Queries run while a streamed response is iterated count against the budget of its view, which is measured once
+        its content is exhausted.
+        """
+        def get_response(request):
+            request.stats_view = 'stream'
+            return StreamingHttpResponse('{}\n'.format(Computer.objects.count()) for _ in range(2))
+
+        with self.assertQueryBudgets({'stream': 2}):
+            response = RequestStatsMiddleware(get_response)(RequestFactory().get('/'))
+            self.assertEqual(b''.join(response.streaming_content), b'0\n0\n')
+
+    def test_fast_responses(self):
+        """
+        The hot endpoints respond with the same JSON as every other one, byte for byte, and with MessagePack if asked
+        to (and it's installed).
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 100}).data['id']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 2 ** 62})
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 2 ** 62})
+        self.api.post(self.computer_insert(computer_id, 'MULT'))
+        self.api.post(self.computer_insert(computer_id, 'PRINT'))
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+        for response in (
+                self.api.post(self.computer_execute(computer_id)),
+                self.api.get(self.computer_debug(computer_id)),
+                self.api.post(self.computer_execute(computer_id), HTTP_ACCEPT='application/json; indent=2')):
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(
+                response.content,
+                JSONRenderer().render(response.data, response.accepted_media_type, response.renderer_context))
+        data = {'detail': 'Line\u2028separator', 'program_output': [None, 2 ** 124, -1]}
+        self.assertEqual(
+            renderers.FastJSONRenderer().render(data, 'application/json'), JSONRenderer().render(data, 'application/json'))
+
+        # Every other default renderer is kept after the JSON one
+        self.assertEqual(
+            renderers.fast_renderer_classes((JSONRenderer, BrowsableAPIRenderer))[:2],
+            (renderers.FastJSONRenderer, BrowsableAPIRenderer))
+
+    def test_msgpack_responses(self):
+        """
+        The hot endpoints respond with MessagePack if asked to, sending ints beyond 64 bits as text, and tagged apart
+        from their JSON responses.
+        """
+        computer_id = self.api.post(self.computers_url, {'stack': 100}).data['id']
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 2 ** 62})
+        self.api.post(self.computer_insert(computer_id, 'PUSH'), {'arg': 2 ** 62})
+        self.api.post(self.computer_insert(computer_id, 'MULT'))
+        response = self.api.post(
+            self.computer_insert(computer_id, 'PRINT'), HTTP_ACCEPT=renderers.MessagePackRenderer.media_type)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(response.content, raw=False)['program_stack_pointer'], '4')
+        self.api.patch(self.computer_pointer_url(computer_id), {'addr': 0})
+
+        response = self.api.post(self.computer_execute(computer_id), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(
+            renderers.msgpack.unpackb(response.content, raw=False), {'program_output': ['{}'.format(2 ** 124)]})
+
+        response = self.api.get(self.computer_debug(computer_id), HTTP_ACCEPT='application/msgpack')
+        json_response = self.api.get(self.computer_debug(computer_id))
+        self.assertEqual(
+            renderers.msgpack.unpackb(response.content, raw=False)['program_stack'],
+            json.loads(json_response.content.decode('utf-8'))['program_stack'])
+        self.assertNotEqual(response['ETag'], json_response['ETag'])
+        response = self.api.get(
+            self.computer_debug(computer_id), HTTP_ACCEPT='application/msgpack', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('Accept', response['Vary'])
+        response = self.api.get(self.computer_debug(computer_id), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -5,7 +5,8 @@ from __future__ import print_function, unicode_literals
 
 from rest_framework.routers import DefaultRouter
 
-from api.views import ComputerViewset
+from api.views import ComputerViewset, ExecutionJobViewset
 
 router = DefaultRouter()
 router.register(r'computers', ComputerViewset)
+router.register(r'jobs', ExecutionJobViewset)
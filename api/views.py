@@ -3,16 +3,39 @@
 
 from __future__ import print_function, unicode_literals
 
+import json
+
 from rest_framework import mixins, status
-from rest_framework.decorators import detail_route
-from rest_framework.exceptions import APIException
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 from rest_framework.viewsets import GenericViewSet
 
-from api.serializers import ComputerInsertSerializer, ComputerPointerSerializer, ComputerSerializer
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+
+from api.renderers import FAST_RENDERER_CLASSES, FastContentNegotiation
+from api.serializers import (
+    ComputerBatchExecuteSerializer, ComputerContinueSerializer, ComputerDebugSerializer, ComputerEditingSessionSerializer,
+    ComputerExecuteSerializer, ComputerInsertSerializer, ComputerPointerSerializer, ComputerProgramSerializer,
+    ComputerSerializer, ComputerSweepSerializer, ExecutionJobSerializer, ExecutionSnapshotSerializer)
+from api.stats import request_stats
+from computer.assembler import assemble
+from computer.batch import execute_batch
+from computer.cache import execution_cache, program_cache
+from computer.engine import ExecutionProfile
 from computer.enums import ComputerInstruction
-from computer.models import Computer
+from computer.exceptions import (
+    ComputerAssemblyError, ComputerException, ComputerExecutionLimitExceeded, ComputerSessionConflict,
+    ComputerSnapshotConflict, ComputerSnapshotExpired)
+from computer.jobs import fail_if_stale, submit_job
+from computer.metrics import execution_metrics
+from computer.models import Computer, ExecutionJob, ExecutionSnapshot
+from computer.sessions import EditingSession
 
 
 class ComputerViewset(mixins.CreateModelMixin, mixins.RetrieveModelMixin, GenericViewSet):
@@ -23,55 +46,352 @@ class ComputerViewset(mixins.CreateModelMixin, mixins.RetrieveModelMixin, Generi
     Creates a new `Computer` with the given stack size.
 
     retrieve:
-    Returns all data about the `Computer` with the given ID.
+    Returns all data about the `Computer` with the given ID, or a `304` if it didn't change since the `ETag` given in
+    `If-None-Match`. Within an editing session (`?session=`), it's shown as edited.
     """
     queryset = Computer.objects.all()
     serializer_class = ComputerSerializer
+    content_negotiation_class = FastContentNegotiation
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Responses are rendered as negotiated through `Accept`, so caches must tell them apart by it
+        response = super(ComputerViewset, self).finalize_response(request, response, *args, **kwargs)
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        computer = self.get_object()
+        session = self._editing_session(request, computer)
+        if session is not None:
+            return Response(self.get_serializer(session.apply(computer)).data)
+        etag = self._etag(request, computer.etag())
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return Response(self.get_serializer(computer).data, headers={'ETag': etag})
+
+    @staticmethod
+    def _etag(request, tag):
+        """
+        Returns the `ETag` of the representation of `tag` rendered as negotiated, since every one is different.
+        """
+        return quote_etag('{}.{}'.format(tag, request.accepted_renderer.format))
+
+    @staticmethod
+    def _not_modified(request, etag):
+        """
+        Returns a `304` if the client of a GET request already has the representation tagged with `etag`, or None.
+        """
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+        return response
+
+    @staticmethod
+    def _editing_session(request, computer):
+        """
+        Returns the editing session of `computer` given through `?session=`, or None if none was given.
+        """
+        serializer = ComputerEditingSessionSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        session_id = serializer.validated_data['session']
+        if session_id is None:
+            return None
+        session = EditingSession.get(session_id, computer=computer)
+        if session is None:
+            raise NotFound('There is no editing session {} for this computer.'.format(session_id))
+        return session
 
     @detail_route(
-        methods=['patch'], serializer_class=ComputerPointerSerializer, url_path='stack/pointer', url_name='pointer')
+        methods=['patch'], serializer_class=ComputerPointerSerializer, renderer_classes=FAST_RENDERER_CLASSES,
+        url_path='stack/pointer', url_name='pointer')
     def pointer(self, request, pk=None):
         """
-        Sets the address of the program stack of a `Computer`.
+        Sets the address of the program stack of a `Computer`, or of its editing session (`?session=`).
         """
         serializer = self.get_serializer_class()(data=request.data)
         serializer.is_valid(raise_exception=True)
         computer = self.get_object()
-        computer.set_address(serializer.validated_data['addr'], save=True)
+        session = self._editing_session(request, computer)
+        if session is None:
+            computer.set_address(serializer.validated_data['addr'], save=True)
+        else:
+            session.apply(computer).set_address(serializer.validated_data['addr'])
+            try:
+                session.update(computer)
+            except ComputerSessionConflict, e:
+                return Response({'detail': '{}'.format(e)}, status=status.HTTP_409_CONFLICT)
         return Response(computer.debug())
 
     @detail_route(
-        methods=['post'], serializer_class=ComputerInsertSerializer,
+        methods=['post'], serializer_class=ComputerInsertSerializer, renderer_classes=FAST_RENDERER_CLASSES,
         url_path='stack/insert/(?P<possible_instruction>[^/.]+)', url_name='insert')
     def insert(self, request, pk=None, possible_instruction=None):
         """
-        Inserts the given instruction, with its optional argument, in a `Computer`.
+        Inserts the given instruction, with its optional argument, in a `Computer`, or in its editing session
+        (`?session=`).
         """
         instruction = ComputerInstruction.get_value(possible_instruction)
         if instruction:
             serializer = self.get_serializer_class()(data=request.data, context={'instruction': instruction})
             serializer.is_valid(raise_exception=True)
             computer = self.get_object()
-            computer.insert(instruction, instruction_arg=serializer.validated_data['arg'], save=True)
+            session = self._editing_session(request, computer)
+            if session is None:
+                computer.insert(instruction, instruction_arg=serializer.validated_data['arg'], save=True)
+            else:
+                session.apply(computer).insert(instruction, instruction_arg=serializer.validated_data['arg'])
+                try:
+                    session.update(computer)
+                except ComputerSessionConflict, e:
+                    return Response({'detail': '{}'.format(e)}, status=status.HTTP_409_CONFLICT)
             return Response(computer.debug())
         return Response({'detail': 'You must provide a valid instruction'}, status=status.HTTP_400_BAD_REQUEST)
 
-    @detail_route(methods=['post'], serializer_class=Serializer, url_path='exec', url_name='execute')
+    @detail_route(
+        methods=['post'], serializer_class=ComputerProgramSerializer, url_path='stack/program', url_name='program')
+    def program(self, request, pk=None):
+        """
+        Inserts a whole program, given as a list of instructions with their addresses, in a `Computer` at once.
+        """
+        serializer = self.get_serializer_class()(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        program = [
+            (instruction['addr'], instruction['instruction'], instruction['arg'])
+            for instruction in serializer.validated_data['program']
+        ]
+        with transaction.atomic():
+            computer = self.get_object()
+            try:
+                computer.load_program(program, save=True)
+            except ComputerException as e:
+                raise ValidationError({'program': ['{}'.format(e)]})
+        return Response(computer.debug())
+
+    @detail_route(methods=['post'], serializer_class=Serializer, url_path='stack/assembly', url_name='assembly')
+    def assembly(self, request, pk=None):
+        """
+        Assembles the source of a program sent as the body of the request (see `computer.assembler`), reading it one
+        line at a time, and inserts it in a `Computer` at once, returning the address of every label.
+        """
+        computer = self.get_object()
+        try:
+            program, labels = assemble(request.stream or [], size=computer.program_stack_size)
+        except ComputerAssemblyError, e:
+            raise ValidationError({'source': ComputerAssemblyError.messages_of(e.errors)})
+        with transaction.atomic():
+            computer.load_program(program, save=True)
+        return Response({'instructions': len(program), 'labels': labels})
+
+    @detail_route(methods=['post'], serializer_class=Serializer, url_path='session', url_name='session')
+    def open_session(self, request, pk=None):
+        """
+        Opens an editing session of a `Computer`: the changes made within it (through `?session=`) are only written
+        once it's committed, or once it's been idle for a while.
+        """
+        computer = self.get_object()
+        session = EditingSession.open(computer)
+        return Response({'session': session.id, 'version': session.version}, status=status.HTTP_201_CREATED)
+
+    @detail_route(methods=['post'], serializer_class=Serializer, url_path='session/commit', url_name='session-commit')
+    def commit_session(self, request, pk=None):
+        """
+        Writes the changes made within an editing session (`?session=`) of a `Computer` at once, unless its program
+        changed since the session was opened.
+        """
+        computer = self.get_object()
+        session = self._editing_session(request, computer)
+        if session is None:
+            raise ValidationError({'session': ['You must provide the editing session to commit.']})
+        try:
+            computer = session.commit()
+        except ComputerSessionConflict, e:
+            return Response({'detail': '{}'.format(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(computer.debug())
+
+    @detail_route(
+        methods=['post'], serializer_class=Serializer, renderer_classes=FAST_RENDERER_CLASSES, url_path='exec',
+        url_name='execute')
     def execute(self, request, pk=None):
         """
         Executes the current program of a `Computer`.
         """
+        serializer = ComputerExecuteSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
         computer = self.get_object()
+        if serializer.validated_data['async']:
+            job = submit_job(computer)
+            return Response(ExecutionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        if serializer.validated_data['suspend']:
+            return self._execute_suspendable(computer, serializer.validated_data)
+        profile = ExecutionProfile() if serializer.validated_data['profile'] else None
         try:
-            program_output = computer.execute()
+            program_output = computer.execute(
+                engine=serializer.validated_data['engine'], use_cache=True,
+                max_steps=serializer.validated_data['max_steps'], timeout=serializer.validated_data['timeout'],
+                profile=profile)
+            if profile is not None:
+                execution_metrics.record(profile)
+                return Response({'program_output': program_output, 'profile': profile.as_dict()})
             return Response({'program_output': program_output})
+        except ComputerExecutionLimitExceeded, e:
+            return Response(
+                {'detail': '{}'.format(e), 'program_output': e.state.output, 'steps': e.state.steps},
+                status=status.HTTP_400_BAD_REQUEST)
+        except Exception, e:
+            raise APIException("Unexpected error when executing the program: {}".format(e))
+
+    @detail_route(methods=['post'], serializer_class=Serializer, url_path='exec/continue', url_name='execute-continue')
+    def execute_continue(self, request, pk=None):
+        """
+        Continues the execution of the program of a `Computer` suspended into a snapshot (see `exec?suspend=1`),
+        returning the values printed since then.
+        """
+        serializer = ComputerContinueSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        computer = self.get_object()
+        snapshot = get_object_or_404(ExecutionSnapshot, pk=serializer.validated_data['snapshot'], computer=computer)
+        return self._execute_suspendable(computer, serializer.validated_data, snapshot=snapshot)
+
+    @detail_route(
+        methods=['post'], serializer_class=ComputerSweepSerializer, url_path='exec/sweep', url_name='execute-sweep')
+    def execute_sweep(self, request, pk=None):
+        """
+        Executes the current program of a `Computer` once per row of the given matrix of PUSH args, returning the
+        output (or error) of every row.
+        """
+        serializer = self.get_serializer_class()(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        computer = self.get_object()
+        try:
+            program_outputs, details = computer.execute_sweep(
+                serializer.validated_data['args'], addresses=serializer.validated_data['addresses'],
+                max_steps=settings.COMPUTER_EXECUTION_MAX_STEPS, timeout=settings.COMPUTER_EXECUTION_TIMEOUT)
+        except ComputerException, e:
+            raise ValidationError({'args': ['{}'.format(e)]})
+        return Response({'program_outputs': program_outputs, 'details': details})
+
+    @staticmethod
+    def _execute_suspendable(computer, options, snapshot=None):
+        """
+        Executes the program of `computer` from the beginning or from `snapshot`, answering with a `202` along with
+        the snapshot to continue from if it's suspended again.
+        """
+        try:
+            program_output, snapshot = computer.execute_suspendable(
+                snapshot=snapshot, engine=options['engine'], max_steps=options['max_steps'],
+                timeout=options['timeout'])
+        except ComputerSnapshotExpired, e:
+            return Response({'detail': '{}'.format(e)}, status=status.HTTP_410_GONE)
+        except ComputerSnapshotConflict, e:
+            return Response({'detail': '{}'.format(e)}, status=status.HTTP_409_CONFLICT)
+        except ComputerExecutionLimitExceeded, e:
+            return Response(
+                {'detail': '{}'.format(e), 'program_output': e.state.output, 'steps': e.state.steps},
+                status=status.HTTP_400_BAD_REQUEST)
         except Exception, e:
             raise APIException("Unexpected error when executing the program: {}".format(e))
+        if snapshot is None:
+            return Response({'program_output': program_output})
+        return Response(
+            {'program_output': program_output, 'snapshot': ExecutionSnapshotSerializer(snapshot).data},
+            status=status.HTTP_202_ACCEPTED)
+
+    @detail_route(methods=['post'], serializer_class=Serializer, url_path='exec/stream', url_name='execute-stream')
+    def execute_stream(self, request, pk=None):
+        """
+        Executes the current program of a `Computer`, streaming every printed value as a line of JSON as soon as it's
+        available. Errors are streamed as a last line with their `detail`.
+        """
+        serializer = ComputerExecuteSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        computer = self.get_object()
+        program_output = computer.iter_execute(
+            max_steps=serializer.validated_data['max_steps'], timeout=serializer.validated_data['timeout'])
+        return StreamingHttpResponse(self._stream_lines(program_output), content_type='application/x-ndjson')
 
-    @detail_route(methods=['post'], serializer_class=Serializer, url_path='debug')
+    @staticmethod
+    def _stream_lines(program_output):
+        try:
+            for value in program_output:
+                yield '{}\n'.format(json.dumps(value))
+        except ComputerExecutionLimitExceeded, e:
+            yield '{}\n'.format(json.dumps({'detail': '{}'.format(e)}))
+        except Exception, e:
+            yield '{}\n'.format(json.dumps({'detail': 'Unexpected error when executing the program: {}'.format(e)}))
+
+    @detail_route(
+        methods=['get', 'post'], serializer_class=Serializer, renderer_classes=FAST_RENDERER_CLASSES, url_path='debug')
     def debug(self, request, pk=None):
         """
-        Returns all debug data from a `Computer`.
+        Returns all debug data from a `Computer`, or a `304` if it didn't change since the `ETag` given in
+        `If-None-Match` (GET only). Within an editing session (`?session=`), it's shown as edited.
         """
+        serializer = ComputerDebugSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
         computer = self.get_object()
-        return Response(computer.debug())
+        session = self._editing_session(request, computer)
+        if session is not None:
+            return Response(session.apply(computer).debug(optimized=serializer.validated_data['optimized']))
+        etag = self._etag(request, computer.etag(optimized=serializer.validated_data['optimized']))
+        not_modified = self._not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return Response(computer.debug(optimized=serializer.validated_data['optimized']), headers={'ETag': etag})
+
+    @list_route(
+        methods=['post'], serializer_class=ComputerBatchExecuteSerializer, url_path='exec-batch',
+        url_name='execute-batch')
+    def execute_batch(self, request):
+        """
+        Executes the current programs of many `Computer`s at once, returning the output (or error) of each one of them
+        by ID.
+        """
+        serializer = self.get_serializer_class()(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = execute_batch(
+            serializer.validated_data['ids'], max_steps=settings.COMPUTER_EXECUTION_MAX_STEPS,
+            timeout=settings.COMPUTER_EXECUTION_TIMEOUT, batch_timeout=settings.COMPUTER_BATCH_TIMEOUT)
+        return Response({'results': results})
+
+    @list_route(methods=['get'], serializer_class=Serializer, url_path='exec/cache', url_name='execution-cache')
+    def execution_cache(self, request):
+        """
+        Returns the hit/miss counters of the cache of program outputs, along with the ones of the cache of loaded
+        programs of this worker.
+        """
+        stats = execution_cache.stats()
+        stats['programs'] = program_cache.stats()
+        return Response(stats)
+
+
+def metrics(request):
+    """
+    Returns the aggregated data of profiled executions in the Prometheus text format.
+    """
+    return HttpResponse(execution_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def stats(request):
+    """
+    Returns the rolling histograms of the SQL queries, DB time, serialization time and latency of the latest requests
+    to every view served by this worker (see `RequestStatsMiddleware`).
+    """
+    return JsonResponse(request_stats.as_dict())
+
+
+class ExecutionJobViewset(mixins.RetrieveModelMixin, GenericViewSet):
+    """
+    API view to follow the asynchronous executions of `Computer` programs.
+
+    retrieve:
+    Returns the status, output so far and steps executed so far of the job with the given ID. Jobs left behind by a
+    worker that stopped are shown as failed.
+    """
+    queryset = ExecutionJob.objects.all()
+    serializer_class = ExecutionJobSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(fail_if_stale(self.get_object())).data)
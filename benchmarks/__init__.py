@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the `Computer` interpreter and of the API around it.
+
+Run them with `python -m benchmarks run --output results.json` and compare two runs with
+`python -m benchmarks compare baseline.json results.json`.
+"""
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import json
+import os
+import sys
+from collections import OrderedDict
+
+
+def _setup_django():
+    """
+    Sets Django up against a throwaway test database, returning the callable that destroys it.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'deviget.settings')
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def run(options):
+    teardown = _setup_django()
+    try:
+        import benchmarks.suite  # noqa: registers the benchmarks
+        from benchmarks.harness import run_benchmarks
+
+        results = run_benchmarks(options.only, repeat=options.repeat, log=lambda line: print(line, file=sys.stderr))
+    finally:
+        teardown()
+    if options.output:
+        with io.open(options.output, 'w', encoding='utf-8') as output:
+            output.write(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+def compare(options):
+    from benchmarks.harness import compare as compare_results
+
+    with io.open(options.baseline, encoding='utf-8') as baseline, io.open(options.current, encoding='utf-8') as current:
+        comparison = compare_results(
+            json.load(baseline, object_pairs_hook=OrderedDict), json.load(current, object_pairs_hook=OrderedDict),
+            threshold=options.threshold)
+    for row in comparison:
+        print('{:<45} {:>14.1f} -> {:>14.1f} ops/sec  x{:.2f}{}'.format(
+            row['name'], row['baseline_ops_per_sec'], row['ops_per_sec'], row['ratio'],
+            '  REGRESSION' if row['regression'] else ''))
+    return 1 if any(row['regression'] for row in comparison) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='Runs the benchmarks and writes their results as JSON.')
+    run_parser.add_argument('--output', '-o', help='File to write the results to (stdout by default).')
+    run_parser.add_argument('--repeat', '-r', type=int, default=20, help='Samples to take of every benchmark.')
+    run_parser.add_argument(
+        '--only', nargs='*', help='Only run the benchmarks whose names start with these prefixes (i.e. execute api.exec).')
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='Compares two results, exiting with an error if any benchmark regressed.')
+    compare_parser.add_argument('baseline', help='Results to compare against.')
+    compare_parser.add_argument('current', help='New results.')
+    compare_parser.add_argument(
+        '--threshold', '-t', type=float, default=0.1,
+        help='Fraction of ops/sec a benchmark can lose before it is flagged as a regression (0.1 by default).')
+    compare_parser.set_defaults(handler=compare)
+
+    options = parser.parse_args(argv)
+    return options.handler(options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
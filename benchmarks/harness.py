@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import platform
+import time
+from collections import OrderedDict
+from timeit import default_timer
+
+# Registry of benchmarks, by name, in the order they were defined
+BENCHMARKS = OrderedDict()
+
+
+class Benchmark(object):
+    """
+    A named workload: `setup` is called once and returns the operation to time, which is then called `number` times
+    per sample.
+    """
+    def __init__(self, name, setup, number):
+        self.name = name
+        self.setup = setup
+        self.number = number
+
+    def run(self, repeat):
+        """
+        Times the operation `repeat` times.
+
+        :param repeat: How many samples to take
+        :return: list of seconds per operation, one per sample
+        """
+        operation = self.setup()
+        operation()  # Warm up
+        samples = []
+        for _ in range(repeat):
+            start = default_timer()
+            for _ in range(self.number):
+                operation()
+            samples.append((default_timer() - start) / self.number)
+        return samples
+
+
+def benchmark(name, number=1):
+    """
+    Decorator that registers a setup function as a benchmark.
+
+    :param name: Unique name of the benchmark, dotted by area (i.e. `execute.readme.compiled`)
+    :param number: How many times the operation is called per sample
+    :return: function
+    """
+    def register(setup):
+        if name in BENCHMARKS:
+            raise ValueError('There is already a benchmark named {}'.format(name))
+        BENCHMARKS[name] = Benchmark(name, setup, number)
+        return setup
+    return register
+
+
+def percentile(sorted_samples, fraction):
+    """
+    Returns the value at `fraction` of `sorted_samples`, interpolating between the closest ones.
+    """
+    position = (len(sorted_samples) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_samples) - 1)
+    return sorted_samples[lower] + (sorted_samples[upper] - sorted_samples[lower]) * (position - lower)
+
+
+def summarize(samples):
+    """
+    Returns the stats of a list of samples (in seconds per operation).
+
+    :return: dict
+    """
+    samples = sorted(samples)
+    mean = sum(samples) / len(samples)
+    return OrderedDict([
+        ('ops_per_sec', 1 / mean if mean else None),
+        ('mean', mean),
+        ('min', samples[0]),
+        ('p50', percentile(samples, 0.5)),
+        ('p90', percentile(samples, 0.9)),
+        ('p99', percentile(samples, 0.99)),
+        ('max', samples[-1]),
+        ('samples', len(samples)),
+    ])
+
+
+def run_benchmarks(names=None, repeat=20, log=None):
+    """
+    Runs the registered benchmarks whose name starts with any of `names` (or all of them).
+
+    :param names: Optional list of name prefixes to filter benchmarks by
+    :param repeat: How many samples to take of every benchmark
+    :param log: Optional callable to report progress to
+    :return: dict, ready to be dumped as JSON
+    """
+    results = OrderedDict()
+    for name, bench in BENCHMARKS.items():
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        results[name] = summarize(bench.run(repeat))
+        if log is not None:
+            log('{:<45} {:>14.1f} ops/sec  p50 {:.6f}s  p99 {:.6f}s'.format(
+                name, results[name]['ops_per_sec'], results[name]['p50'], results[name]['p99']))
+    return OrderedDict([
+        ('meta', OrderedDict([
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('timestamp', int(time.time())),
+            ('repeat', repeat),
+        ])),
+        ('benchmarks', results),
+    ])
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compares the ops/sec of two runs, flagging the benchmarks that got slower than `threshold` allows.
+
+    :param baseline: Results of the run to compare against
+    :param current: Results of the new run
+    :param threshold: Fraction of ops/sec that can be lost before it's considered a regression
+    :return: list of dicts, one per benchmark present in both runs
+    """
+    comparison = []
+    for name, stats in current['benchmarks'].items():
+        baseline_stats = baseline['benchmarks'].get(name)
+        if baseline_stats is None:
+            continue
+        ratio = stats['ops_per_sec'] / baseline_stats['ops_per_sec']
+        comparison.append(OrderedDict([
+            ('name', name),
+            ('baseline_ops_per_sec', baseline_stats['ops_per_sec']),
+            ('ops_per_sec', stats['ops_per_sec']),
+            ('ratio', ratio),
+            ('regression', ratio < 1 - threshold),
+        ]))
+    return comparison
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Programs used as workloads, as (program stack size, list of (address, instruction, arg)).
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+
+def readme_program():
+    """
+    The program given originally by the test description: prints 1009 and 1010.
+    """
+    return 100, [
+        (50, 'MULT', None), (51, 'PRINT', None), (52, 'RET', None),
+        (0, 'PUSH', 1009), (1, 'PRINT', None), (2, 'PUSH', 6), (3, 'PUSH', 101), (4, 'PUSH', 10), (5, 'CALL', 50),
+        (6, 'STOP', None),
+    ]
+
+
+def call_chain_program(depth=1000):
+    """
+    A chain of `depth` nested subroutines, each one calling the next one and returning once it returns.
+    """
+    first = 10
+    program = [(0, 'PUSH', 3), (1, 'CALL', first), (3, 'STOP', None)]
+    for level in range(depth):
+        begin = first + 3 * level
+        program += [(begin, 'PUSH', begin + 2), (begin + 1, 'CALL', begin + 3), (begin + 2, 'RET', None)]
+    program.append((first + 3 * depth, 'RET', None))
+    return first + 3 * depth, program
+
+
+def bignum_program(multiplications=1000):
+    """
+    Multiplies 3 by itself `multiplications` times, growing a big number, and prints it.
+    """
+    program = [(0, 'PUSH', 3)]
+    for index in range(multiplications):
+        program += [(1 + 2 * index, 'PUSH', 3), (2 + 2 * index, 'MULT', None)]
+    size = 1 + 2 * multiplications
+    program += [(size, 'PRINT', None), (size + 1, 'STOP', None)]
+    return size + 1, program
+
+
+def subroutine_program(calls=200, multiplications=16):
+    """
+    A subroutine multiplying its argument by `multiplications` large constants and printing it, called `calls` times
+    with one of only 4 different arguments, each time right after another subroutine that logs the call.
+    """
+    log = 5 * calls + 1
+    begin = log + 3
+    program = []
+    for index in range(calls):
+        program += [
+            (5 * index, 'PUSH', 5 * index + 5), (5 * index + 1, 'PUSH', 2 + index % 4),
+            (5 * index + 2, 'PUSH', 5 * index + 4), (5 * index + 3, 'CALL', log), (5 * index + 4, 'CALL', begin)]
+    program += [(5 * calls, 'STOP', None), (log, 'PUSH', 0), (log + 1, 'PRINT', None), (log + 2, 'RET', None)]
+    for index in range(multiplications):
+        program += [(begin + 2 * index, 'PUSH', 7 ** 20 + index), (begin + 2 * index + 1, 'MULT', None)]
+    program += [(begin + 2 * multiplications, 'PRINT', None), (begin + 2 * multiplications + 1, 'RET', None)]
+    return begin + 2 * multiplications + 1, program
+
+
+def sparse_program(size=32767):
+    """
+    A couple of instructions at both ends of a large address space, with nothing but empty addresses in between.
+    """
+    return size, [(0, 'PUSH', 1), (1, 'PRINT', None), (size - 1, 'PUSH', 2), (size, 'PRINT', None)]
+
+
+def straight_program(length=1000):
+    """
+    `length` instructions pushing and printing values, one after the other.
+    """
+    program = []
+    for index in range(0, length - 1, 2):
+        program += [(index, 'PUSH', index + 1), (index + 1, 'PRINT', None)]
+    program.append((length - 1, 'STOP', None))
+    return length, program
+
+
+def build_computer(program, save=False):
+    """
+    Returns a `Computer` loaded with `program`, ready to be executed.
+    """
+    from computer.models import Computer
+
+    size, instructions = program
+    computer = Computer(program_stack_size=size)
+    computer.load_program(instructions)
+    computer.set_address(0)
+    if save:
+        computer.save()
+    return computer
+
+
+def as_api_payload(program):
+    """
+    Returns `program` as the payload expected by the endpoint that uploads whole programs.
+    """
+    return {'program': [
+        {'addr': addr, 'instruction': instruction, 'arg': arg} for addr, instruction, arg in program[1]
+    ]}
+
+
+def as_assembly(program):
+    """
+    Returns `program` as the source expected by the assembler, with an `.org` wherever it skips addresses.
+    """
+    lines = []
+    next_addr = 0
+    for addr, instruction, arg in sorted(program[1]):
+        if addr != next_addr:
+            lines.append('.org {}'.format(addr))
+        lines.append(instruction if arg is None else '{} {}'.format(instruction, arg))
+        next_addr = addr + 1
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Definition of every benchmark. It needs Django to be set up, with a database to write to.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import os
+import subprocess
+import sys
+import tempfile
+from itertools import count
+
+from rest_framework.test import APIClient
+
+from django.core.urlresolvers import reverse
+
+from benchmarks.harness import benchmark
+from benchmarks.programs import (
+    as_api_payload, as_assembly, bignum_program, build_computer, call_chain_program, readme_program, sparse_program,
+    straight_program, subroutine_program)
+from computer.cache import execution_cache
+from computer.enums import ComputerEngine
+from computer.models import Computer
+
+EXECUTE_WORKLOADS = (
+    ('readme', readme_program, 1000),
+    ('call_chain', call_chain_program, 20),
+    ('bignum', bignum_program, 20),
+    ('subroutine', subroutine_program, 20),
+    ('sparse', sparse_program, 5),
+)
+
+
+def _register_execute(workload, program, number, engine):
+    @benchmark('execute.{}.{}'.format(workload, engine), number=number)
+    def setup():
+        computer = build_computer(program())
+        return lambda: computer.execute(engine=engine)
+
+
+# The reference engine walks every empty address one at a time, so it's left out of these
+LARGE_EXECUTE_WORKLOADS = (
+    ('sparse_large', lambda: sparse_program(Computer.MAX_ADDRESS), 1000),
+)
+
+for _workload, _program, _number in EXECUTE_WORKLOADS:
+    for _engine in (
+            ComputerEngine.GENERATED, ComputerEngine.OPTIMIZED, ComputerEngine.COMPILED, ComputerEngine.IMAGE,
+            ComputerEngine.REFERENCE):
+        _register_execute(_workload, _program, _number, _engine)
+
+for _workload, _program, _number in LARGE_EXECUTE_WORKLOADS:
+    for _engine in (ComputerEngine.GENERATED, ComputerEngine.OPTIMIZED, ComputerEngine.COMPILED, ComputerEngine.IMAGE):
+        _register_execute(_workload, _program, _number, _engine)
+
+
+@benchmark('execute.compile.straight', number=20)
+def compile_straight():
+    computer = build_computer(straight_program())
+
+    def operation():
+        computer._invalidate()
+        computer.compile()
+    return operation
+
+
+@benchmark('execute.append.bignum', number=20)
+def execute_append_bignum():
+    """
+    The bignum program without its STOP, executed again after every couple of instructions appended to it.
+    """
+    size, instructions = bignum_program()
+    computer = build_computer((size + 1000, instructions[:-1]))
+    computer.set_address(size)
+    computer.execute()
+
+    def operation():
+        computer.insert('PUSH', 7).insert('PRINT')
+        computer.execute()
+    return operation
+
+
+@benchmark('execute.optimize.straight', number=20)
+def optimize_straight():
+    computer = build_computer(straight_program())
+    computer.compile()
+
+    def operation():
+        computer._optimized_program = None
+        computer.optimize()
+    return operation
+
+
+@benchmark('execute.sweep.readme', number=5)
+def execute_sweep_readme():
+    """
+    The README program executed once per pair of args of its MULT, 1000 pairs at once.
+    """
+    computer = build_computer(readme_program())
+    rows = [[101 + index, 10 + index % 7] for index in range(1000)]
+    return lambda: computer.execute_sweep(rows, addresses=[3, 4])
+
+
+@benchmark('insert.memory.straight', number=20)
+def insert_memory_straight():
+    size, instructions = straight_program()
+
+    def operation():
+        computer = Computer(program_stack_size=size)
+        for addr, instruction, arg in instructions:
+            computer.insert(instruction, instruction_arg=arg)
+    return operation
+
+
+@benchmark('insert.db.single', number=50)
+def insert_db_single():
+    computer = build_computer(straight_program(), save=True)
+    addresses = count()
+
+    def operation():
+        computer.set_address(next(addresses) % computer.program_stack_size).insert('PUSH', 7, save=True)
+    return operation
+
+
+@benchmark('insert.db.bulk', number=5)
+def insert_db_bulk():
+    program = straight_program()
+
+    def operation():
+        computer = Computer(program_stack_size=program[0])
+        computer.save()
+        computer.load_program(program[1], save=True)
+    return operation
+
+
+@benchmark('debug.straight', number=50)
+def debug_straight():
+    computer = build_computer(straight_program())
+    return computer.debug
+
+
+def _api_computer(api, program):
+    computer_id = api.post(reverse('computer-list'), {'stack': program[0]}).data['id']
+    api.post(reverse('computer-program', kwargs={'pk': computer_id}), as_api_payload(program), format='json')
+    return computer_id
+
+
+@benchmark('api.create', number=50)
+def api_create():
+    api = APIClient()
+    return lambda: api.post(reverse('computer-list'), {'stack': 100})
+
+
+@benchmark('api.retrieve', number=50)
+def api_retrieve():
+    api = APIClient()
+    url = reverse('computer-detail', kwargs={'pk': _api_computer(api, readme_program())})
+    return lambda: api.get(url)
+
+
+@benchmark('api.retrieve.not_modified', number=50)
+def api_retrieve_not_modified():
+    api = APIClient()
+    url = reverse('computer-detail', kwargs={'pk': _api_computer(api, straight_program())})
+    etag = api.get(url)['ETag']
+    return lambda: api.get(url, HTTP_IF_NONE_MATCH=etag)
+
+
+@benchmark('api.debug.straight', number=50)
+def api_debug_straight():
+    api = APIClient()
+    url = reverse('computer-debug', kwargs={'pk': _api_computer(api, straight_program())})
+    return lambda: api.get(url)
+
+
+@benchmark('api.pointer', number=50)
+def api_pointer():
+    api = APIClient()
+    url = reverse('computer-pointer', kwargs={'pk': _api_computer(api, readme_program())})
+    return lambda: api.patch(url, {'addr': 0})
+
+
+@benchmark('api.insert', number=50)
+def api_insert():
+    api = APIClient()
+    computer_id = _api_computer(api, readme_program())
+    api.patch(reverse('computer-pointer', kwargs={'pk': computer_id}), {'addr': 90})
+    url = reverse('computer-insert', kwargs={'pk': computer_id, 'possible_instruction': 'PUSH'})
+
+    def operation():
+        api.patch(reverse('computer-pointer', kwargs={'pk': computer_id}), {'addr': 90})
+        api.post(url, {'arg': 7})
+    return operation
+
+
+@benchmark('api.debug', number=50)
+def api_debug():
+    api = APIClient()
+    url = reverse('computer-debug', kwargs={'pk': _api_computer(api, readme_program())})
+    return lambda: api.post(url)
+
+
+@benchmark('api.exec.readme', number=50)
+def api_exec_readme():
+    api = APIClient()
+    url = reverse('computer-execute', kwargs={'pk': _api_computer(api, readme_program())})
+    return lambda: api.post(url)
+
+
+@benchmark('api.exec.readme_msgpack', number=50)
+def api_exec_readme_msgpack():
+    # Answered with a `406` unless `msgpack` is installed
+    api = APIClient()
+    url = reverse('computer-execute', kwargs={'pk': _api_computer(api, readme_program())})
+    return lambda: api.post(url, HTTP_ACCEPT='application/msgpack')
+
+
+@benchmark('api.exec.readme_uncached', number=50)
+def api_exec_readme_uncached():
+    api = APIClient()
+    url = reverse('computer-execute', kwargs={'pk': _api_computer(api, readme_program())})
+
+    def operation():
+        execution_cache.cache.clear()
+        api.post(url)
+    return operation
+
+
+@benchmark('api.program.straight', number=5)
+def api_program_straight():
+    api = APIClient()
+    program = straight_program()
+    computer_id = api.post(reverse('computer-list'), {'stack': program[0]}).data['id']
+    url = reverse('computer-program', kwargs={'pk': computer_id})
+    payload = as_api_payload(program)
+    return lambda: api.post(url, payload, format='json')
+
+
+def _build_readme_program(api, computer_id, query=''):
+    """
+    Builds the README program one instruction per request, sending `query` along with every one of them.
+    """
+    pointer_url = reverse('computer-pointer', kwargs={'pk': computer_id}) + query
+    insert_url = lambda instruction: reverse(
+        'computer-insert', kwargs={'pk': computer_id, 'possible_instruction': instruction}) + query
+    api.patch(pointer_url, {'addr': 50})
+    api.post(insert_url('MULT'))
+    api.post(insert_url('PRINT'))
+    api.post(insert_url('RET'))
+    api.patch(pointer_url, {'addr': 0})
+    api.post(insert_url('PUSH'), {'arg': 1009})
+    api.post(insert_url('PRINT'))
+    api.post(insert_url('PUSH'), {'arg': 6})
+    api.post(insert_url('PUSH'), {'arg': 101})
+    api.post(insert_url('PUSH'), {'arg': 10})
+    api.post(insert_url('CALL'), {'addr': 50})
+    api.post(insert_url('STOP'))
+    api.patch(pointer_url, {'addr': 0})
+
+
+@benchmark('api.assembly.straight', number=5)
+def api_assembly_straight():
+    """
+    The straight program, uploaded as assembly text.
+    """
+    api = APIClient()
+    program = straight_program()
+    computer_id = api.post(reverse('computer-list'), {'stack': program[0]}).data['id']
+    url = reverse('computer-assembly', kwargs={'pk': computer_id})
+    source = as_assembly(program)
+    return lambda: api.post(url, source, content_type='text/plain')
+
+
+@benchmark('api.round_trips.readme', number=5)
+def api_round_trips_readme():
+    """
+    The README program, built and executed one request at a time.
+    """
+    api = APIClient()
+
+    def operation():
+        computer_id = api.post(reverse('computer-list'), {'stack': 100}).data['id']
+        _build_readme_program(api, computer_id)
+        api.post(reverse('computer-execute', kwargs={'pk': computer_id}))
+    return operation
+
+
+@benchmark('api.round_trips.readme_session', number=5)
+def api_round_trips_readme_session():
+    """
+    The README program, built one request at a time within an editing session, committed and executed.
+    """
+    api = APIClient()
+
+    def operation():
+        computer_id = api.post(reverse('computer-list'), {'stack': 100}).data['id']
+        session = api.post(reverse('computer-session', kwargs={'pk': computer_id})).data['session']
+        _build_readme_program(api, computer_id, query='?session={}'.format(session))
+        api.post(reverse('computer-session-commit', kwargs={'pk': computer_id}) + '?session={}'.format(session))
+        api.post(reverse('computer-execute', kwargs={'pk': computer_id}))
+    return operation
+
+
+def _cold_start(command):
+    """
+    Returns the operation that runs `command` in a new Python process, from the root of the project.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable] + command
+    return lambda: subprocess.check_output(command, cwd=root)
+
+
+@benchmark('cli.cold_start.readme')
+def cli_cold_start_readme():
+    """
+    The README program, assembled and executed by `python -m computer.run` in a new process.
+    """
+    fd, path = tempfile.mkstemp(suffix='.asm')
+    with os.fdopen(fd, 'w') as source:
+        source.write(as_assembly(readme_program()))
+    return _cold_start(['-m', 'computer.run', path])
+
+
+@benchmark('cli.cold_start.django')
+def cli_cold_start_django():
+    """
+    What any Django process takes to get to the point of executing the same program: setting Django up and importing
+    the models.
+    """
+    return _cold_start(['-c', 'import django; django.setup(); import computer.models'])
@@ -4,6 +4,7 @@
 from __future__ import print_function, unicode_literals
 
 from django.apps import AppConfig
+from django.core import checks
 
 
 class ComputerConfig(AppConfig):
@@ -11,3 +12,7 @@ class ComputerConfig(AppConfig):
     Config values for the `computer` app.
     """
     name = 'computer'
+
+    def ready(self):
+        from computer.checks import check_editing_session_cache
+        checks.register(check_editing_session_cache)
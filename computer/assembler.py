@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Assembler of programs written as text, one instruction per line, as in the README:
+
+    .org 50                 ; the next instruction goes to address 50
+    print_tenten: MULT      ; `print_tenten` is the address of this instruction
+                  PRINT
+                  RET
+    .org 0
+    PUSH 1009
+    PRINT
+    PUSH after              ; labels can be used as args as well, before they're defined
+    PUSH 101
+    PUSH 10
+    CALL print_tenten
+    after: STOP
+
+Instructions are case-insensitive, labels are not, and comments start with `;` or `#`. Args are decimal or hex (`0x`)
+ints, or labels, and can't be 0, just as when inserting instructions one at a time.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import numbers
+import re
+
+from computer.core import MAX_ADDRESS, MAX_ARG, MIN_ARG
+from computer.enums import ComputerInstruction
+from computer.exceptions import ComputerAssemblyError
+
+# Errors reported at most for a single source; assembling stops once there are as many
+MAX_ASSEMBLY_ERRORS = 100
+
+_COMMENT = re.compile(r'[;#].*')
+_LABEL = re.compile(r'([A-Za-z_][A-Za-z0-9_.]*)\s*:\s*')
+_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_.]*$')
+_NUMBER = re.compile(r'-?(0[xX][0-9a-fA-F]+|[0-9]+)$')
+
+_INSTRUCTIONS_WITH_ARG = (ComputerInstruction.PUSH, ComputerInstruction.CALL)
+
+
+def _parse_number(token):
+    if not _NUMBER.match(token):
+        return None
+    return int(token, 16) if 'x' in token.lower() else int(token)
+
+
+def assemble(lines, size=MAX_ADDRESS):
+    """
+    Assembles a program, reading its source one line at a time: a first pass over the lines places every instruction
+    and label, and a second one over the instructions resolves the labels they reference.
+
+    :param lines: Iterable of lines of source, as text or UTF-8 bytes (i.e. a file)
+    :param size: The size of the program stack the program must fit into
+    :return: tuple of (list of (address, instruction, instruction_arg), dict of label -> address)
+    :raises ComputerAssemblyError: With every error found (up to `MAX_ASSEMBLY_ERRORS`), along with their line number
+    """
+    errors = []
+    labels = {}
+    instructions = []
+    lines_by_address = {}
+    address = 0
+    for line_number, line in enumerate(lines, 1):
+        if len(errors) >= MAX_ASSEMBLY_ERRORS:
+            break
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                errors.append((line_number, 'It is not valid UTF-8'))
+                continue
+        line = _COMMENT.sub('', line).strip()
+        label = _LABEL.match(line)
+        while label is not None:
+            if label.group(1) in labels:
+                errors.append((line_number, 'Label {} is already defined'.format(label.group(1))))
+            labels[label.group(1)] = address
+            line = line[label.end():]
+            label = _LABEL.match(line)
+        if not line:
+            continue
+
+        tokens = line.split()
+        if tokens[0].lower() == '.org':
+            value = _parse_number(tokens[1]) if len(tokens) == 2 else None
+            if value is None or not 0 <= value <= size:
+                errors.append((line_number, '.org needs an address between 0 and {}'.format(size)))
+            else:
+                address = value
+            continue
+        instruction = ComputerInstruction.get_value(tokens[0])
+        if not instruction:
+            errors.append((line_number, 'Unknown instruction {}'.format(tokens[0])))
+            continue
+        expected_tokens = 2 if instruction in _INSTRUCTIONS_WITH_ARG else 1
+        if len(tokens) != expected_tokens:
+            errors.append((line_number, '{} takes {} arg'.format(
+                instruction.upper(), 'an' if expected_tokens == 2 else 'no')))
+            continue
+        instruction_arg = None
+        if expected_tokens == 2:
+            instruction_arg = _parse_number(tokens[1])
+            if instruction_arg is None:
+                if not _NAME.match(tokens[1]):
+                    errors.append((line_number, '{} is neither a number nor a label'.format(tokens[1])))
+                    continue
+                # Resolved once every label is known
+                instruction_arg = tokens[1]
+            elif not MIN_ARG <= instruction_arg <= MAX_ARG:
+                errors.append((line_number, '{} does not fit in 64 bits'.format(tokens[1])))
+                continue
+            elif not instruction_arg:
+                errors.append((line_number, ComputerInstruction.REQUIRED_ARG_ERRORS[instruction]))
+                continue
+        if address > size:
+            errors.append((line_number, 'Address {} is beyond the program stack, which only has {}'.format(
+                address, size)))
+            continue
+        if address in lines_by_address:
+            errors.append((line_number, 'Address {} already holds the instruction of line {}'.format(
+                address, lines_by_address[address])))
+            continue
+        lines_by_address[address] = line_number
+        instructions.append((address, instruction, instruction_arg))
+        address += 1
+
+    program = []
+    for address, instruction, instruction_arg in instructions:
+        if not isinstance(instruction_arg, (numbers.Integral, type(None))):
+            if instruction_arg not in labels:
+                errors.append((lines_by_address[address], 'Unknown label {}'.format(instruction_arg)))
+                continue
+            instruction_arg = labels[instruction_arg]
+            if not instruction_arg:
+                errors.append((lines_by_address[address], ComputerInstruction.REQUIRED_ARG_ERRORS[instruction]))
+                continue
+        program.append((address, instruction, instruction_arg))
+    if errors:
+        raise ComputerAssemblyError(sorted(errors)[:MAX_ASSEMBLY_ERRORS])
+    return program, labels
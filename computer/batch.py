@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.pool import RUN
+
+from django.conf import settings
+
+from computer.cache import execution_cache
+from computer.engine import CompiledProgram, ExecutionState, execute_compiled, execute_reference
+from computer.exceptions import ComputerExecutionLimitExceeded
+from computer.models import Computer
+
+BATCH_TIMEOUT_ERROR = 'The batch ran out of its time budget before this program finished'
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """
+    Returns the pool of processes that run batches in this process, starting it the first time it's needed, and again
+    if it was terminated or started by the process this one was forked from (i.e. by the master of the web server).
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid() or _pool._state != RUN:
+            _pool = multiprocessing.Pool(settings.COMPUTER_BATCH_WORKERS)
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def _discard_pool(pool):
+    """
+    Terminates `pool`, so the next batch starts a new one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.terminate()
+
+
+def _execute(payload):
+    """
+    Executes a single program of a batch; it only gets plain data, so it can run in any process.
+
+    :param payload: Tuple of (compiled program data or program stack, program stack size, program counter, budgets)
+    :return: tuple of (program output, steps it took, error detail)
+    """
+    compiled_program, program_stack, program_stack_size, program_counter, max_steps, timeout = payload
+    state = ExecutionState(program_counter)
+    try:
+        if compiled_program is None:
+            execute_reference(
+                program_stack, program_stack_size, program_counter, max_steps=max_steps, timeout=timeout,
+                state=state)
+        else:
+            execute_compiled(
+                CompiledProgram(*compiled_program), program_counter, max_steps=max_steps, timeout=timeout,
+                state=state)
+        return state.output, state.steps, None
+    except ComputerExecutionLimitExceeded as e:
+        return None, None, '{}'.format(e)
+    except Exception as e:
+        return None, None, 'Unexpected error when executing the program: {}'.format(e)
+
+
+def execute_batch(computer_ids, max_steps=None, timeout=None, batch_timeout=None):
+    """
+    Executes the programs of many `Computer`s at once, spreading them across a pool of processes.
+
+    Programs are loaded with two queries no matter how many they are, and those that were executed before within the
+    budget are served from the execution cache. Programs that didn't finish by the time the whole batch runs out of
+    its budget are reported as timed out, and the pool is started again, since it may still be busy with them (or
+    some of its processes may have died along with their programs).
+
+    :param computer_ids: IDs of the `Computer`s to execute
+    :param max_steps: Optional budget of instructions to execute, per program
+    :param timeout: Optional budget of seconds to execute for, per program
+    :param batch_timeout: Optional budget of seconds to execute the whole batch for
+    :return: dict of ID -> dict with either its `program_output` or the `detail` of its error
+    """
+    deadline = None if batch_timeout is None else time.time() + batch_timeout
+    computers = Computer.objects.in_bulk(computer_ids)
+    Computer.load_programs(computers.values())
+    results = {}
+    pending = []
+    for computer_id in computer_ids:
+        computer = computers.get(computer_id)
+        if computer is None:
+            results[computer_id] = {'detail': 'Not found.'}
+            continue
+        program_output = execution_cache.get(computer.execution_key, max_steps=max_steps)
+        if program_output is not None:
+            results[computer_id] = {'program_output': program_output}
+            continue
+        compiled_program = computer.compile()
+        pending.append((computer, (
+            None if compiled_program is None else
+            (compiled_program.opcodes, compiled_program.args, compiled_program.size),
+            computer.program_stack if compiled_program is None else None,
+            computer.program_stack_size, computer.program_counter, max_steps, timeout,
+        )))
+
+    payloads = [payload for _, payload in pending]
+    outcomes = []
+    if not settings.COMPUTER_BATCH_WORKERS or len(payloads) < 2:
+        for payload in payloads:
+            if deadline is not None and time.time() >= deadline:
+                outcomes.append((None, None, BATCH_TIMEOUT_ERROR))
+            else:
+                outcomes.append(_execute(payload))
+    else:
+        pool = _get_pool()
+        async_results = [pool.apply_async(_execute, (payload,)) for payload in payloads]
+        timed_out = False
+        for async_result in async_results:
+            try:
+                outcomes.append(async_result.get(None if deadline is None else max(0, deadline - time.time())))
+            except multiprocessing.TimeoutError:
+                timed_out = True
+                outcomes.append((None, None, BATCH_TIMEOUT_ERROR))
+        if timed_out:
+            _discard_pool(pool)
+
+    for (computer, _), (program_output, steps, error) in zip(pending, outcomes):
+        if error is None:
+            execution_cache.set(computer.execution_key, program_output, steps)
+            results[computer.pk] = {'program_output': program_output}
+        else:
+            results[computer.pk] = {'detail': error}
+    return results
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Global in-memory store of LRU cache data, keyed by name just like `LocMemCache` does.
+_caches = {}
+_expire_info = {}
+_locks = {}
+
+
+class _ExclusiveLock(object):
+    """
+    Drop-in replacement of the `RWLock` used by `LocMemCache` whose readers are exclusive too, since reading from an
+    LRU cache also reorders its entries.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def reader(self):
+        return self._lock
+
+    def writer(self):
+        return self._lock
+
+
+class LRUMemCache(LocMemCache):
+    """
+    Thread-safe in-memory cache backend that evicts the least recently used entry once `MAX_ENTRIES` is reached,
+    instead of culling a whole fraction of the cache like `LocMemCache` does.
+    """
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        self._cache = _caches.setdefault(name, OrderedDict())
+        self._expire_info = _expire_info.setdefault(name, {})
+        self._lock = _locks.setdefault(name, _ExclusiveLock())
+
+    def get(self, key, default=None, version=None, acquire_lock=True):
+        with self._lock.writer():
+            value = super(LRUMemCache, self).get(key, default=default, version=version, acquire_lock=False)
+            key = self.make_key(key, version=version)
+            if key in self._cache:
+                self._cache[key] = self._cache.pop(key)
+            return value
+
+    def _cull(self):
+        while self._cache and len(self._cache) >= self._max_entries:
+            key = next(iter(self._cache))
+            self._delete(key)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+class ExecutionCache(object):
+    """
+    Content-addressed cache of the outputs of `Computer.execute`, stored in the cache set by
+    `settings.COMPUTER_EXECUTION_CACHE` along with how many steps they took, so they are only reused by executions
+    whose budget they fit. It keeps count of its hits and misses so the cache can be sized.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[settings.COMPUTER_EXECUTION_CACHE]
+
+    def get(self, key, max_steps=None):
+        """
+        Returns the cached output for `key`, or None if it isn't cached or it took more than `max_steps` steps (so the
+        program is executed again, running out of its budget just like it would if it wasn't cached).
+
+        :param key: The execution key of a `Computer`
+        :param max_steps: Optional budget of instructions of the execution
+        :return: list
+        """
+        cached = self.cache.get(key)
+        program_output = None
+        if cached is not None:
+            steps, program_output = cached
+            if max_steps is not None and steps > max_steps:
+                program_output = None
+        with self._lock:
+            if program_output is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return program_output
+
+    def set(self, key, program_output, steps, timeout=DEFAULT_TIMEOUT):
+        """
+        Caches `program_output` for `key`.
+
+        :param key: The execution key of a `Computer`
+        :param program_output: The output of executing it
+        :param steps: How many steps executing it took
+        :return: None
+        """
+        self.cache.set(key, (steps, program_output), timeout=timeout)
+
+    def stats(self):
+        """
+        Returns the hit/miss counters of this process.
+
+        :return: dict
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        stats = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': float(hits) / (hits + misses) if hits + misses else None,
+        }
+        if isinstance(self.cache, LRUMemCache):
+            stats['entries'] = len(self.cache)
+            stats['max_entries'] = self.cache._max_entries
+        return stats
+
+
+class ProgramCacheEntry(object):
+    """
+    Program stack of a `Computer` as loaded at `version`, along with its compiled version once it's compiled, its
+    optimized version once it's optimized (along with the program counter and size it was optimized for, so the calls
+    its subroutines memoized are kept from one request to the next) and its debug data once it's rendered (the
+    optimized one along with the program counter it was optimized for).
+    """
+    __slots__ = (
+        'version', 'program_stack', 'compiled_program', 'optimized_program', 'program_stack_data',
+        'optimized_program_stack_data')
+
+    def __init__(self, version, program_stack):
+        self.version = version
+        self.program_stack = program_stack
+        self.compiled_program = None
+        self.optimized_program = None
+        self.program_stack_data = None
+        self.optimized_program_stack_data = None
+
+
+class ProgramCache(object):
+    """
+    In-process LRU cache of the programs of `Computer`s, keyed by their ID and only valid for the version they were
+    loaded at, so a hit needs nothing but the row of the `Computer`.
+
+    Its size is bounded by the total number of instructions it holds, as set by
+    `settings.COMPUTER_PROGRAM_CACHE_MAX_INSTRUCTIONS`, evicting the least recently used programs first. Entries are
+    shared, so they must never be modified.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.instructions = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, computer_id, version):
+        """
+        Returns the entry of `computer_id` if it was loaded at `version`, or None otherwise.
+
+        :param computer_id: The ID of the `Computer`
+        :param version: Its current version
+        :return: ProgramCacheEntry
+        """
+        with self._lock:
+            entry = self._entries.pop(computer_id, None)
+            if entry is None or entry.version != version:
+                if entry is not None:
+                    self.instructions -= len(entry.program_stack)
+                self.misses += 1
+                return None
+            self._entries[computer_id] = entry
+            self.hits += 1
+            return entry
+
+    def set(self, computer_id, version, program_stack):
+        """
+        Caches `program_stack` as the program of `computer_id` at `version`.
+
+        :param computer_id: The ID of the `Computer`
+        :param version: The version `program_stack` was loaded at
+        :param program_stack: Dict of address -> (instruction, instruction_arg)
+        :return: ProgramCacheEntry
+        """
+        entry = ProgramCacheEntry(version, program_stack)
+        max_instructions = settings.COMPUTER_PROGRAM_CACHE_MAX_INSTRUCTIONS
+        with self._lock:
+            previous_entry = self._entries.pop(computer_id, None)
+            if previous_entry is not None:
+                self.instructions -= len(previous_entry.program_stack)
+            if len(program_stack) > max_instructions:
+                return entry
+            while self._entries and self.instructions + len(program_stack) > max_instructions:
+                _, evicted_entry = self._entries.popitem(last=False)
+                self.instructions -= len(evicted_entry.program_stack)
+            self._entries[computer_id] = entry
+            self.instructions += len(program_stack)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.instructions = 0
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the size of the cache of this process.
+
+        :return: dict
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            entries, instructions = len(self._entries), self.instructions
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': float(hits) / (hits + misses) if hits + misses else None,
+            'entries': entries,
+            'instructions': instructions,
+            'max_instructions': settings.COMPUTER_PROGRAM_CACHE_MAX_INSTRUCTIONS,
+        }
+
+
+execution_cache = ExecutionCache()
+program_cache = ProgramCache()
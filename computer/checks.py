@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error
+
+
+def check_editing_session_cache(app_configs, **kwargs):
+    """
+    Checks that editing sessions are kept in a cache shared by every worker, since any of them may serve the next
+    request of a session.
+    """
+    cache = caches[settings.COMPUTER_EDITING_SESSION_CACHE]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return [Error(
+            'The {} cache used by editing sessions is not shared by every worker.'.format(
+                settings.COMPUTER_EDITING_SESSION_CACHE),
+            hint='Use a shared backend for it, such as the database, memcached or redis.',
+            obj=type(cache).__name__,
+            id='computer.E001',
+        )]
+    return []
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Tier-2 engine: programs are split into basic blocks, starting at every address execution may jump to (the entry, CALL
+and RET targets), and every block is translated into a Python function, compiled once with `compile()` and cached by
+the content of the program, so hot programs run as plain Python code with no dispatch between their instructions.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
+from computer.engine import ExecutionState, _infinite_loop, _iter_slices, run_compiled
+from computer.enums import ComputerOpcode
+from computer.optimizer import _possible_ret_targets, _reachable_addresses
+
+# Largest program worth translating; larger ones are left to the interpreter
+MAX_GENERATED_INSTRUCTIONS = 10 ** 5
+
+# Number of generated programs each process keeps around
+MAX_CACHED_PROGRAMS = 128
+
+_generated_programs = OrderedDict()
+_generated_programs_lock = threading.Lock()
+
+
+class GeneratedProgram(object):
+    """
+    Program translated into Python code: `blocks[addr]` holds the (function, steps, last, tail) of the basic block
+    starting at every address execution may jump to.
+
+    Every function takes (push, pop, extend, output), runs the `steps` instructions of its block and returns the
+    address to go on at, or None if the block ends with a STOP. `last` is the address of the CALL, RET or STOP the
+    block ends with (-1 if it falls through into the next one), and `tail` the address it enters the empty region at
+    the end of the program stack at, if it does. Whatever it can't run is run by its `base` program.
+    """
+    __slots__ = ('blocks', 'size', 'base', 'source')
+
+    def __init__(self, blocks, size, base, source):
+        self.blocks = blocks
+        self.size = size
+        self.base = base
+        self.source = source
+
+
+def _flush(lines, constants):
+    """
+    Pushes the values pushed so far that are still only known by the code generator.
+    """
+    if len(constants) == 1:
+        lines.append('push({!r})'.format(constants[0]))
+    elif constants:
+        lines.append('extend(({},))'.format(', '.join(repr(value) for value in constants)))
+    del constants[:]
+
+
+def _generate_block(program, leader, leaders, sorted_leaders):
+    """
+    Generates the source of the function of the basic block starting at `leader`, folding everything that only depends
+    on values pushed within the block.
+
+    :return: tuple of (source, steps, last, tail)
+    """
+    opcodes, args, size = program.opcodes, program.args, program.size
+    lines = []
+    constants = []
+    steps = 0
+    last = -1
+    tail = None
+    pc = leader
+    while True:
+        if pc > size or (pc != leader and pc in leaders):
+            _flush(lines, constants)
+            lines.append('return {!r}'.format(pc))
+            break
+        opcode = opcodes.get(pc)
+        if opcode is None:
+            populated = program.next_address(pc)
+            if populated > size and tail is None:
+                tail = pc
+            index = bisect_right(sorted_leaders, pc)
+            empty = min(populated, sorted_leaders[index] if index < len(sorted_leaders) else populated) - pc
+            steps += empty
+            pc += empty
+            continue
+        steps += 1
+        if opcode == ComputerOpcode.PUSH:
+            constants.append(args[pc])
+        elif opcode == ComputerOpcode.PRINT:
+            lines.append('output({})'.format(repr(constants.pop()) if constants else 'pop()'))
+        elif opcode == ComputerOpcode.MULT:
+            if len(constants) >= 2:
+                operand1 = constants.pop()
+                operand2 = constants.pop()
+                if operand1 and operand2:
+                    constants.append(operand1 * operand2)
+            elif constants:
+                operand1 = constants.pop()
+                if operand1:
+                    lines.extend(['operand2 = pop()', 'if operand2:', '    push({!r} * operand2)'.format(operand1)])
+                else:
+                    lines.append('pop()')
+            else:
+                lines.extend([
+                    'operand1 = pop()', 'operand2 = pop()', 'if operand1 and operand2:',
+                    '    push(operand1 * operand2)'])
+        elif opcode == ComputerOpcode.CALL:
+            _flush(lines, constants)
+            lines.append('return {!r}'.format(args[pc]))
+            last = pc
+            break
+        elif opcode == ComputerOpcode.RET:
+            if constants:
+                value_to_ret_to = constants.pop()
+                _flush(lines, constants)
+                lines.append('return {!r}'.format(value_to_ret_to if value_to_ret_to else pc))
+            else:
+                lines.extend([
+                    'value_to_ret_to = pop()', 'return value_to_ret_to if value_to_ret_to else {!r}'.format(pc)])
+            last = pc
+            break
+        elif opcode == ComputerOpcode.STOP:
+            _flush(lines, constants)
+            lines.append('return None')
+            last = pc
+            break
+        else:
+            _flush(lines, constants)
+            lines.append('raise faults[{!r}]'.format(pc))
+            break
+        pc += 1
+    source = 'def block_{}(push, pop, extend, output):\n{}\n'.format(
+        leader, '\n'.join('    {}'.format(line) for line in lines))
+    return source, steps, last, tail
+
+
+def generate_program(program, entry, key=None):
+    """
+    Translates a `CompiledProgram` to be executed from `entry` into Python code.
+
+    Programs whose RET targets can't be told beforehand (see `computer.optimizer`) are not translated, since their
+    blocks couldn't be found, and neither are the ones larger than `MAX_GENERATED_INSTRUCTIONS`.
+
+    :param program: The `CompiledProgram` to translate
+    :param entry: The address executions start at
+    :param key: Optional hash of everything the program depends on, to reuse the code generated for it before
+    :return: GeneratedProgram, or None if the program can only be run by the interpreter
+    """
+    if key is not None:
+        with _generated_programs_lock:
+            generated_program = _generated_programs.pop(key, None)
+            if generated_program is not None:
+                _generated_programs[key] = generated_program
+                return generated_program
+
+    if len(program.opcodes) > MAX_GENERATED_INSTRUCTIONS:
+        return None
+    ret_targets = _possible_ret_targets(program)
+    if ret_targets is None:
+        return None
+    reachable = _reachable_addresses(program, entry, ret_targets)
+    # A falsy RET stays where it is, which no block starts at, so the interpreter takes over from there
+    leaders = {entry}
+    leaders.update(
+        program.args[address] for address in reachable if program.opcodes[address] == ComputerOpcode.CALL)
+    leaders.update(ret_targets)
+    leaders = {leader for leader in leaders if 0 <= leader <= program.size}
+    sorted_leaders = sorted(leaders)
+
+    sources = []
+    metadata = {}
+    for leader in sorted_leaders:
+        source, steps, last, tail = _generate_block(program, leader, leaders, sorted_leaders)
+        sources.append(source)
+        metadata[leader] = (steps, last, tail)
+    source = '\n'.join(sources)
+    namespace = {'faults': {
+        address: arg for address, arg in program.args.items() if program.opcodes[address] == ComputerOpcode.FAULT}}
+    exec(compile(source, '<generated program>', 'exec'), namespace)
+    blocks = {
+        leader: (namespace['block_{}'.format(leader)],) + metadata[leader]
+        for leader in leaders
+    }
+    generated_program = GeneratedProgram(blocks, program.size, program, source)
+
+    if key is not None:
+        with _generated_programs_lock:
+            _generated_programs[key] = generated_program
+            while len(_generated_programs) > MAX_CACHED_PROGRAMS:
+                _generated_programs.popitem(last=False)
+    return generated_program
+
+
+def run_generated(program, state, max_steps, budget=None):
+    """
+    Same as `run_compiled`, but running a whole basic block of a `GeneratedProgram` at a time.
+
+    Whenever execution gets somewhere no block starts at, or there are not enough steps left for a whole block, the
+    rest of the slice is run by the `base` program.
+
+    :param program: The `GeneratedProgram` to run
+    :param state: The `ExecutionState` to resume from
+    :param max_steps: How many instructions to run at most
+    :param budget: Optional number of steps left in the budget of the whole execution
+    :return: ExecutionState
+    """
+    blocks = program.blocks
+    size = program.size
+    memory = state.memory
+    push = memory.append
+    pop = memory.pop
+    extend = memory.extend
+    output = state.output.append
+    saved_pc, saved_memory, power, countdown = state.cycle
+
+    pc = state.program_counter
+    remaining = max_steps
+    halted = False
+    fallback = False
+    try:
+        while remaining > 0:
+            if pc > size:
+                halted = True
+                break
+            try:
+                block, steps, last, tail = blocks[pc]
+            except KeyError:
+                fallback = True
+                break
+            if steps > remaining:
+                fallback = True
+                break
+            target = block(push, pop, extend, output)
+            remaining -= steps
+            if tail is not None and state.tail is None:
+                state.tail = tail
+            if target is None:
+                pc = last
+                halted = True
+                break
+            if target <= last:
+                # A back-edge: the machine state is compared with the one saved by Brent's algorithm
+                if target == saved_pc and memory == saved_memory:
+                    pc = target
+                    raise _infinite_loop(state)
+                countdown -= 1
+                if not countdown:
+                    power *= 2
+                    countdown = power
+                    saved_pc, saved_memory = target, memory[:]
+            pc = target
+        else:
+            halted = pc > size
+    finally:
+        state.program_counter = pc
+        state.steps += max_steps - remaining
+        state.halted = halted
+        state.cycle = (saved_pc, saved_memory, power, countdown)
+    if fallback:
+        run_compiled(program.base, state, remaining, budget=None if budget is None else budget - max_steps + remaining)
+    return state
+
+
+def execute_generated(program, program_counter, max_steps=None, timeout=None, progress=None, state=None):
+    """
+    Executes a `GeneratedProgram` starting at `program_counter`.
+
+    :param program: The `GeneratedProgram` to execute
+    :param program_counter: The address to start the execution at
+    :param max_steps: Optional budget of instructions to execute
+    :param timeout: Optional budget of seconds to execute for
+    :param progress: Optional callable that receives the `ExecutionState` after every slice of instructions
+    :param state: Optional `ExecutionState` to resume from instead of `program_counter`, updated along the way
+    :return: list
+    """
+    if state is None:
+        state = ExecutionState(program_counter)
+    for _ in _iter_slices(program, state, max_steps, timeout, runner=run_generated):
+        if progress is not None:
+            progress(state)
+    return state.output
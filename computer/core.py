@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""
+Execution core of `Computer`, which imports no Django code so programs can be executed without setting it up (see
+`computer.run`): `ComputerCore` executes a program stack with any `ComputerEngine`, and `Program` is a program stack
+held in memory. `Computer` is a `ComputerCore` whose program stack is persisted, which keeps what it derives from it
+across requests and workers and resumes executions from their checkpoint.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import json
+
+from computer.codegen import execute_generated, generate_program
+from computer.engine import ExecutionState, compile_program, execute_compiled, execute_reference, iter_compiled
+from computer.enums import ComputerEngine, ComputerOpcode
+from computer.exceptions import ComputerException
+from computer.images import ProgramImage, build_image, execute_image, open_image
+from computer.optimizer import optimize_program
+
+# Highest address of a program stack
+MAX_ADDRESS = 2 ** 31 - 1
+
+# Range of the args of instructions, which are stored as 64-bit ints
+MIN_ARG = -2 ** 63
+MAX_ARG = 2 ** 63 - 1
+
+
+class ComputerCore(object):
+    """
+    Executes the program in `program_stack` (dict of address -> (instruction, instruction_arg)), which can hold up to
+    `program_stack_size` addresses, from the address hold by `program_counter`; all of them are provided by subclasses.
+
+    Everything derived from the program (its compiled, optimized and generated versions, its image and its execution
+    key) is computed the first time it's needed, until `_invalidate` drops it.
+    """
+    _compiled_program = None
+    _optimized_program = None
+    _generated_program = None
+    _image = None
+    _execution_key = None
+
+    def _invalidate(self):
+        """
+        Drops everything derived from the program stack, so it's computed again the next time it's needed.
+        """
+        self._compiled_program = None
+        self._optimized_program = None
+        self._generated_program = None
+        self._image = None
+        self._execution_key = None
+
+    def compile(self):
+        """
+        Returns the compiled version of the program stack, compiling it only if it changed since the last call.
+
+        :return: CompiledProgram, or None if the program can only be run by the reference engine
+        """
+        if self._compiled_program is None:
+            self._compiled_program = compile_program(self.program_stack, self.program_stack_size)
+        return self._compiled_program
+
+    def optimize(self):
+        """
+        Returns the optimized version of the compiled program for the current program counter, optimizing it only if
+        either of them changed since the last call.
+
+        :return: CompiledProgram, or None if the program can only be run by the reference engine
+        """
+        if self._optimized_program is None or self._optimized_program[0] != self.program_counter:
+            compiled_program = self.compile()
+            self._optimized_program = (
+                self.program_counter,
+                optimize_program(compiled_program, self.program_counter) if compiled_program is not None else None,
+            )
+        return self._optimized_program[1]
+
+    def generate(self):
+        """
+        Returns the compiled program translated into Python code for the current program counter, translating it only
+        if either of them changed since the last call and no one translated the very same program before.
+
+        :return: GeneratedProgram, or None if the program can only be run by the other engines
+        """
+        if self._generated_program is None or self._generated_program[0] != self.program_counter:
+            compiled_program = self.compile()
+            self._generated_program = (
+                self.program_counter,
+                generate_program(compiled_program, self.program_counter, key=self.execution_key)
+                if compiled_program is not None else None,
+            )
+        return self._generated_program[1]
+
+    def image(self):
+        """
+        Returns the image of the program stack, building it only if it changed since the last call (or its process
+        closed it to make room for others).
+
+        :return: ProgramImage, or None if the program can only be run by the other engines
+        """
+        if self._image is not None and self._image.closed:
+            self._image = None
+        if self._image is None:
+            data = build_image(self.program_stack, self.program_stack_size)
+            if data is not None:
+                self._image = self._open_image(data)
+        return self._image
+
+    def _open_image(self, data):
+        """
+        Returns the image `data` built out of the program stack as a `ProgramImage`.
+        """
+        return ProgramImage(data)
+
+    def _resume_state(self, max_steps=None):
+        """
+        Returns the `ExecutionState` to execute the program from: its very beginning.
+
+        :param max_steps: Optional budget of instructions of the execution
+        :return: ExecutionState
+        """
+        return ExecutionState(self.program_counter)
+
+    def _save_checkpoint(self, state):
+        """
+        Called with the `ExecutionState` every (not resumed) execution finishes with, to resume the next ones from it.
+
+        :param state: The `ExecutionState` the execution finished with
+        :return: None
+        """
+        pass
+
+    @property
+    def execution_key(self):
+        """
+        Hash of everything the output of `execute` depends on: the program stack, its size and the program counter.
+
+        :return: str
+        """
+        if self._execution_key is None:
+            program = json.dumps(
+                [self.program_stack_size, self.program_counter, sorted(self.program_stack.items())],
+                separators=(',', ':'))
+            self._execution_key = 'computer-execution:{}'.format(hashlib.sha1(program.encode('utf-8')).hexdigest())
+        return self._execution_key
+
+    def execute(
+            self, engine=ComputerEngine.COMPILED, max_steps=None, timeout=None, progress=None, profile=None,
+            state=None):
+        """
+        Executes the stored set of instructions (inside the program stack) starting by the address hold by the program
+        counter. It uses local memory to store temporary data that might result from instructions.
+
+        Programs that exceed `max_steps` or `timeout` are stopped with a `ComputerExecutionLimitExceeded`, and the ones
+        proven to never finish (see `run_compiled`) are stopped right away with a `ComputerInfiniteLoop`, unless the
+        reference engine executes them.
+
+        :param engine: The `ComputerEngine` to use; all of them produce the same output
+        :param max_steps: Optional budget of instructions to execute
+        :param timeout: Optional budget of seconds to execute for
+        :param progress: Optional callable that receives the `ExecutionState` after every slice of instructions
+        :param profile: Optional `ExecutionProfile` to record the execution into; profiled executions skip the
+            optimizer, so every instruction is accounted for
+        :param state: Optional `ExecutionState` to resume from (i.e. one restored from an `ExecutionSnapshot`), updated
+            along the way; resumed executions skip the checkpoint, and can't be profiled
+        :return: list
+        """
+        return self._execute(
+            engine=engine, max_steps=max_steps, timeout=timeout, progress=progress, profile=profile, state=state).output
+
+    def _execute(
+            self, engine=ComputerEngine.COMPILED, max_steps=None, timeout=None, progress=None, profile=None,
+            state=None):
+        """
+        Executes the program just like `execute`, returning the `ExecutionState` it finished with instead, so how many
+        steps it took can be told too.
+
+        :return: ExecutionState
+        """
+        resumed = state is not None
+        # Profiled executions always start from the beginning, so every instruction is accounted for
+        if not resumed and engine != ComputerEngine.REFERENCE and profile is None:
+            state = self._resume_state(max_steps=max_steps)
+        if engine == ComputerEngine.IMAGE and profile is None:
+            image = self.image()
+            if image is not None:
+                execute_image(
+                    image, self.program_counter, max_steps=max_steps, timeout=timeout, progress=progress, state=state)
+                if not resumed:
+                    self._save_checkpoint(state)
+                return state
+        if engine == ComputerEngine.GENERATED and profile is None:
+            generated_program = self.generate()
+            if generated_program is not None:
+                execute_generated(
+                    generated_program, self.program_counter, max_steps=max_steps, timeout=timeout, progress=progress,
+                    state=state)
+                if not resumed:
+                    self._save_checkpoint(state)
+                return state
+        # Optimized programs can only be entered at the program counter, so resumed executions run the compiled one
+        if engine == ComputerEngine.OPTIMIZED and profile is None and not state.steps:
+            compiled_program = self.optimize()
+        elif engine != ComputerEngine.REFERENCE or resumed:
+            compiled_program = self.compile()
+        else:
+            compiled_program = None
+        if compiled_program is None:
+            if resumed:
+                raise ComputerException('Programs that use negative addresses cannot be resumed')
+            state = ExecutionState(self.program_counter)
+            execute_reference(
+                self.program_stack, self.program_stack_size, self.program_counter, max_steps=max_steps,
+                timeout=timeout, profile=profile, state=state)
+            return state
+        checkpointed = state is not None and not resumed
+        if state is None:
+            state = ExecutionState(self.program_counter)
+        execute_compiled(
+            compiled_program, self.program_counter, max_steps=max_steps, timeout=timeout, progress=progress,
+            profile=profile, state=state)
+        if checkpointed:
+            self._save_checkpoint(state)
+        return state
+
+    def iter_execute(self, max_steps=None, timeout=None):
+        """
+        Same as `execute`, but yields the printed values along the way instead of returning them all at the end.
+
+        :param max_steps: Optional budget of instructions to execute
+        :param timeout: Optional budget of seconds to execute for
+        :return: generator
+        """
+        compiled_program = self.compile()
+        if compiled_program is None:
+            return iter(execute_reference(
+                self.program_stack, self.program_stack_size, self.program_counter, max_steps=max_steps,
+                timeout=timeout))
+        return iter_compiled(compiled_program, self.program_counter, max_steps=max_steps, timeout=timeout)
+
+    def execute_sweep(self, rows, addresses=None, max_steps=None, timeout=None):
+        """
+        Executes the program once per row of `rows`, with the args of the PUSHes at `addresses` replaced by the values
+        of the row (see `computer.sweep`).
+
+        :param rows: List of rows of PUSH args, one per execution
+        :param addresses: Optional addresses of the PUSHes to replace the args of, one per column of `rows`; all of
+            them by default, in order
+        :param max_steps: Optional budget of instructions to execute, per row
+        :param timeout: Optional budget of seconds to execute for, for the whole sweep
+        :return: tuple of (list of outputs, list of error details), with one item per row and None where they don't
+            apply
+        """
+        # Sweeps import NumPy, which would take most of the time it takes to start executing anything else
+        from computer.sweep import execute_sweep
+
+        compiled_program = self.compile()
+        if compiled_program is None:
+            raise ComputerException('Programs that use negative addresses cannot be swept')
+        push_addresses = [
+            address for address in compiled_program.addresses
+            if compiled_program.opcodes[address] == ComputerOpcode.PUSH]
+        if addresses is None:
+            addresses = push_addresses
+        elif not set(addresses) <= set(push_addresses):
+            raise ComputerException('Only the args of PUSH instructions can be swept')
+        if any(len(row) != len(addresses) for row in rows):
+            raise ComputerException('Every row must have one arg per swept PUSH ({})'.format(len(addresses)))
+        return execute_sweep(
+            compiled_program, self.program_counter, addresses, rows, max_steps=max_steps, timeout=timeout)
+
+
+class Program(ComputerCore):
+    """
+    Program stack held in memory, either as a dict or as an image read from a file (decoded into a dict only if an
+    engine other than the image one needs it).
+    """
+    def __init__(self, program_stack_size, program_stack=None, program_counter=0):
+        self.program_stack_size = program_stack_size
+        self.program_counter = program_counter
+        self._program_stack = program_stack if program_stack is not None else {}
+
+    @classmethod
+    def from_instructions(cls, instructions, program_stack_size=MAX_ADDRESS, program_counter=0):
+        """
+        Returns the program made of `instructions`, as returned by the assembler.
+
+        :param instructions: Iterable of (address, instruction, instruction_arg)
+        :param program_stack_size: The size of the program stack
+        :param program_counter: The address to execute the program from
+        :return: Program
+        """
+        return cls(
+            program_stack_size, program_counter=program_counter,
+            program_stack={address: (instruction, instruction_arg)
+                           for address, instruction, instruction_arg in instructions})
+
+    @classmethod
+    def from_image(cls, path, program_counter=0):
+        """
+        Returns the program stored in the image at `path`.
+
+        :param path: The path of the image (i.e. one published by a `Computer`)
+        :param program_counter: The address to execute the program from
+        :return: Program
+        """
+        image = open_image(path)
+        program = cls(image.size, program_counter=program_counter)
+        program._program_stack = None
+        program._image = image
+        return program
+
+    @property
+    def program_stack(self):
+        """
+        Dict of address -> (instruction, instruction_arg).
+
+        :return: dict
+        """
+        if self._program_stack is None:
+            self._program_stack = self._image.program_stack()
+        return self._program_stack
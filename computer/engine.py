@@ -0,0 +1,590 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import time
+from bisect import bisect_left
+
+from computer.enums import ComputerInstruction, ComputerOpcode
+from computer.exceptions import ComputerExecutionLimitExceeded, ComputerInfiniteLoop
+
+# How many instructions are executed between checks of the time budget
+SLICE_STEPS = 10000
+
+
+class CompiledProgram(object):
+    """
+    Decoded representation of a program stack: `opcodes[addr]` and `args[addr]` hold the instruction stored at every
+    populated address from 0 to `size`, so executing it needs no int conversions nor string comparisons.
+
+    Empty addresses are left out, and `addresses` indexes the populated ones so every empty region can be walked over
+    at once, no matter how large it is. Optimized programs keep the program they come from as their `base`.
+    """
+    __slots__ = ('opcodes', 'args', 'size', 'addresses', 'base')
+
+    def __init__(self, opcodes, args, size, base=None):
+        self.opcodes = opcodes
+        self.args = args
+        self.size = size
+        self.addresses = sorted(opcodes)
+        self.base = base
+
+    def next_address(self, address):
+        """
+        Returns the first populated address from `address` on, or the one right after the last address if there's none.
+
+        :param address: The address to look from
+        :return: int
+        """
+        index = bisect_left(self.addresses, address)
+        return self.addresses[index] if index < len(self.addresses) else self.size + 1
+
+
+def _decode_instruction(program_stack, address):
+    """
+    Decodes the instruction stored at `address` the same way the reference engine does when it reaches it.
+
+    Anything the reference engine would fail on is compiled as a `FAULT` holding the exception to raise, so programs
+    only fail if (and when) they actually reach that address.
+
+    :return: tuple
+    """
+    try:
+        instruction, instruction_arg = program_stack[address]
+        if instruction_arg:
+            instruction_arg = int(instruction_arg)
+        opcode = ComputerOpcode.get_value(instruction)
+        if opcode == ComputerOpcode.CALL:
+            if instruction_arg is None:
+                raise TypeError("unsupported operand type(s) for +=: 'NoneType' and 'int'")
+            # Every address below 0 is empty, so the program just walks its way up to 0 from there
+            instruction_arg = int(instruction_arg)
+    except Exception as e:
+        return ComputerOpcode.FAULT, e
+    return opcode, instruction_arg
+
+
+def compile_program(program_stack, program_stack_size):
+    """
+    Compiles `program_stack` into a `CompiledProgram`.
+
+    :param program_stack: Dict of address -> (instruction, instruction_arg), as stored by `Computer`
+    :param program_stack_size: The last executable address
+    :return: CompiledProgram, or None if the program can't be compiled (i.e. it uses negative addresses)
+    """
+    if any(address < 0 for address in program_stack):
+        return None
+    opcodes = {}
+    args = {}
+    for address in program_stack:
+        if address > program_stack_size:
+            continue
+        opcode, instruction_arg = _decode_instruction(program_stack, address)
+        # Unknown instructions do nothing, just like empty addresses
+        if opcode != ComputerOpcode.NOP:
+            opcodes[address] = opcode
+            args[address] = instruction_arg
+    return CompiledProgram(opcodes, args, program_stack_size)
+
+
+class ExecutionState(object):
+    """
+    State of a program being executed: where it is, what it has in memory and what it has printed so far.
+
+    `tail` is the address the program entered the empty region at the end of its program stack at, if it did: from
+    there on, it only walks its way to the end.
+
+    `cycle` holds the state of the detection of infinite loops (see `run_compiled`): the program counter and memory
+    saved last, the current power of two and how many back-edges are left until the next save.
+    """
+    __slots__ = ('program_counter', 'memory', 'output', 'steps', 'halted', 'tail', 'cycle')
+
+    def __init__(self, program_counter, memory=None, output=None, steps=0, halted=False):
+        self.program_counter = program_counter
+        self.memory = [] if memory is None else memory
+        self.output = [] if output is None else output
+        self.steps = steps
+        self.halted = halted
+        self.tail = None
+        self.cycle = (None, None, 1, 1)
+
+
+def _infinite_loop(state):
+    return ComputerInfiniteLoop(
+        'The program never finishes: it loops back to address {} with the same memory'.format(state.program_counter),
+        state)
+
+
+def run_compiled(program, state, max_steps, budget=None):
+    """
+    Runs at most `max_steps` instructions of a `CompiledProgram`, resuming from (and updating) `state`.
+
+    `state.halted` is set once the program stops, either by a STOP or by running past its last address.
+
+    Empty regions are walked over at once, counting a step per empty address, as far as `budget` goes (even past
+    `max_steps`, since walking them takes no time). Superinstructions (see `computer.optimizer`) run all of their
+    instructions at once too, unless there are not enough steps left for all of them, in which case the rest of the
+    slice is run by the `base` program. So are memoized subroutines that can't be called at once.
+
+    Infinite loops are detected with Brent's algorithm over the states (program counter and memory) reached through
+    back-edges (jumps to the same address or a lower one), which every loop goes through: since programs can't read what
+    they print, reaching the same state twice proves the program would repeat itself forever.
+
+    :param program: The `CompiledProgram` to run
+    :param state: The `ExecutionState` to resume from
+    :param max_steps: How many instructions to run at most
+    :param budget: Optional number of steps left in the budget of the whole execution
+    :return: ExecutionState
+    """
+    opcodes = program.opcodes
+    args = program.args
+    size = program.size
+    memory = state.memory
+    push = memory.append
+    pop = memory.pop
+    output = state.output.append
+    next_address = program.next_address
+    PUSH, PRINT, MULT, CALL, RET, STOP, FUSED, MEMO = (
+        ComputerOpcode.PUSH, ComputerOpcode.PRINT, ComputerOpcode.MULT, ComputerOpcode.CALL, ComputerOpcode.RET,
+        ComputerOpcode.STOP, ComputerOpcode.FUSED, ComputerOpcode.MEMO)
+
+    saved_pc, saved_memory, power, countdown = state.cycle
+
+    pc = state.program_counter
+    remaining = max_steps
+    halted = False
+    fallback = False
+    try:
+        while remaining > 0:
+            if pc > size:
+                halted = True
+                break
+            remaining -= 1
+            try:
+                opcode = opcodes[pc]
+            except KeyError:
+                # Walking over a whole empty region, as far as the budget goes
+                empty = next_address(pc) - pc
+                if pc + empty > size and state.tail is None:
+                    state.tail = pc
+                if budget is not None:
+                    empty = min(empty, budget - max_steps + remaining + 1)
+                remaining -= empty - 1
+                pc += empty
+                continue
+            if opcode == PUSH:
+                push(args[pc])
+                pc += 1
+            elif opcode == PRINT:
+                output(pop())
+                pc += 1
+            elif opcode == MULT:
+                operand1 = pop()
+                operand2 = pop()
+                if operand1 and operand2:
+                    push(operand1 * operand2)
+                pc += 1
+            elif opcode == CALL:
+                target = args[pc]
+                if target <= pc:
+                    # A back-edge: the machine state is compared with the one saved by Brent's algorithm
+                    if target == saved_pc and memory == saved_memory:
+                        pc = target
+                        raise _infinite_loop(state)
+                    countdown -= 1
+                    if not countdown:
+                        power *= 2
+                        countdown = power
+                        saved_pc, saved_memory = target, memory[:]
+                pc = target
+            elif opcode == RET:
+                value_to_ret_to = pop()
+                if value_to_ret_to:
+                    if value_to_ret_to <= pc:
+                        if value_to_ret_to == saved_pc and memory == saved_memory:
+                            pc = value_to_ret_to
+                            raise _infinite_loop(state)
+                        countdown -= 1
+                        if not countdown:
+                            power *= 2
+                            countdown = power
+                            saved_pc, saved_memory = value_to_ret_to, memory[:]
+                    pc = value_to_ret_to
+            elif opcode == STOP:
+                halted = True
+                break
+            elif opcode == FUSED:
+                superinstruction = args[pc]
+                if superinstruction.steps > remaining + 1:
+                    remaining += 1
+                    fallback = True
+                    break
+                for operation, values in superinstruction.operations:
+                    if operation == PUSH:
+                        memory.extend(values)
+                    elif operation == MULT:
+                        operand1 = pop() if values is None else values[0]
+                        operand2 = pop()
+                        if operand1 and operand2:
+                            push(operand1 * operand2)
+                    elif values is None:
+                        output(pop())
+                    else:
+                        state.output.extend(values)
+                remaining -= superinstruction.steps - 1
+                target = superinstruction.next_pc
+                if target <= pc:
+                    if target == saved_pc and memory == saved_memory:
+                        pc = target
+                        raise _infinite_loop(state)
+                    countdown -= 1
+                    if not countdown:
+                        power *= 2
+                        countdown = power
+                        saved_pc, saved_memory = target, memory[:]
+                pc = target
+            elif opcode == MEMO:
+                subroutine = args[pc]
+                bottom = len(memory) - subroutine.inputs
+                effect = None
+                if subroutine.steps <= remaining + 1 and bottom >= 0:
+                    effect = subroutine.call(memory[bottom:])
+                if effect is None:
+                    # Not enough steps or values left to call it at once, or it doesn't return: the base program runs it
+                    remaining += 1
+                    fallback = True
+                    break
+                values, printed, target = effect
+                if target is None:
+                    # It returns to the value right below its inputs
+                    if not bottom or not memory[bottom - 1]:
+                        remaining += 1
+                        fallback = True
+                        break
+                    bottom -= 1
+                    target = memory[bottom]
+                del memory[bottom:]
+                memory.extend(values)
+                state.output.extend(printed)
+                remaining -= subroutine.steps - 1
+                if target <= pc:
+                    if target == saved_pc and memory == saved_memory:
+                        pc = target
+                        raise _infinite_loop(state)
+                    countdown -= 1
+                    if not countdown:
+                        power *= 2
+                        countdown = power
+                        saved_pc, saved_memory = target, memory[:]
+                pc = target
+            else:
+                raise args[pc]
+        else:
+            halted = pc > size
+    finally:
+        state.program_counter = pc
+        state.steps += max_steps - remaining
+        state.halted = halted
+        state.cycle = (saved_pc, saved_memory, power, countdown)
+    if fallback:
+        run_compiled(
+            program.base, state, remaining, budget=None if budget is None else budget - max_steps + remaining)
+    return state
+
+
+class ExecutionProfile(object):
+    """
+    Instrumentation data of an execution: how many times every instruction ran, the memory high-water mark, how many
+    values were printed and how long it took.
+    """
+    def __init__(self):
+        self.opcode_counts = [0] * (ComputerOpcode.FAULT + 1)
+        self.steps = 0
+        self.memory_high_water = 0
+        self.output_size = 0
+        self.wall_time = 0.0
+
+    @property
+    def instruction_counts(self):
+        """
+        Counts by instruction, leaving out the empty addresses walked over.
+
+        :return: dict
+        """
+        return {
+            instruction: self.opcode_counts[opcode]
+            for opcode, instruction in ComputerOpcode.CHOICES
+        }
+
+    def as_dict(self):
+        return {
+            'instructions': self.instruction_counts,
+            'empty_addresses': self.opcode_counts[ComputerOpcode.NOP],
+            'steps': self.steps,
+            'memory_high_water': self.memory_high_water,
+            'output_size': self.output_size,
+            'wall_time': self.wall_time,
+        }
+
+
+def run_profiled(program, state, max_steps, profile, budget=None):
+    """
+    Same as `run_compiled`, but recording every instruction run and the memory high-water mark into `profile`.
+
+    It's a separate loop so executions that are not profiled don't pay for it.
+
+    :param program: The `CompiledProgram` to run
+    :param state: The `ExecutionState` to resume from
+    :param max_steps: How many instructions to run at most
+    :param profile: The `ExecutionProfile` to record into
+    :param budget: Optional number of steps left in the budget of the whole execution
+    :return: ExecutionState
+    """
+    opcodes = program.opcodes
+    args = program.args
+    size = program.size
+    memory = state.memory
+    push = memory.append
+    pop = memory.pop
+    output = state.output.append
+    next_address = program.next_address
+    counts = profile.opcode_counts
+    high_water = profile.memory_high_water
+    PUSH, NOP, PRINT, MULT, CALL, RET, STOP = (
+        ComputerOpcode.PUSH, ComputerOpcode.NOP, ComputerOpcode.PRINT, ComputerOpcode.MULT, ComputerOpcode.CALL,
+        ComputerOpcode.RET, ComputerOpcode.STOP)
+
+    saved_pc, saved_memory, power, countdown = state.cycle
+
+    pc = state.program_counter
+    remaining = max_steps
+    halted = False
+    output_size = len(state.output)
+    try:
+        while remaining > 0:
+            if pc > size:
+                halted = True
+                break
+            remaining -= 1
+            try:
+                opcode = opcodes[pc]
+            except KeyError:
+                empty = next_address(pc) - pc
+                if budget is not None:
+                    empty = min(empty, budget - max_steps + remaining + 1)
+                counts[NOP] += empty
+                remaining -= empty - 1
+                pc += empty
+                continue
+            counts[opcode] += 1
+            if opcode == PUSH:
+                push(args[pc])
+                if len(memory) > high_water:
+                    high_water = len(memory)
+                pc += 1
+            elif opcode == PRINT:
+                output(pop())
+                pc += 1
+            elif opcode == MULT:
+                operand1 = pop()
+                operand2 = pop()
+                if operand1 and operand2:
+                    push(operand1 * operand2)
+                pc += 1
+            elif opcode == CALL:
+                target = args[pc]
+                if target <= pc:
+                    # A back-edge: the machine state is compared with the one saved by Brent's algorithm
+                    if target == saved_pc and memory == saved_memory:
+                        pc = target
+                        raise _infinite_loop(state)
+                    countdown -= 1
+                    if not countdown:
+                        power *= 2
+                        countdown = power
+                        saved_pc, saved_memory = target, memory[:]
+                pc = target
+            elif opcode == RET:
+                value_to_ret_to = pop()
+                if value_to_ret_to:
+                    if value_to_ret_to <= pc:
+                        if value_to_ret_to == saved_pc and memory == saved_memory:
+                            pc = value_to_ret_to
+                            raise _infinite_loop(state)
+                        countdown -= 1
+                        if not countdown:
+                            power *= 2
+                            countdown = power
+                            saved_pc, saved_memory = value_to_ret_to, memory[:]
+                    pc = value_to_ret_to
+            elif opcode == STOP:
+                halted = True
+                break
+            else:
+                raise args[pc]
+        else:
+            halted = pc > size
+    finally:
+        state.program_counter = pc
+        state.steps += max_steps - remaining
+        state.halted = halted
+        state.cycle = (saved_pc, saved_memory, power, countdown)
+        profile.steps += max_steps - remaining
+        profile.memory_high_water = high_water
+        profile.output_size += len(state.output) - output_size
+    return state
+
+
+def _iter_slices(program, state, max_steps, timeout, profile=None, runner=run_compiled):
+    """
+    Executes a program one slice of instructions at a time from `state` with `runner` (`run_compiled` by default, or
+    `run_profiled` when there's a `profile`), yielding it after every slice and enforcing the given budgets in between.
+    """
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        budget = None if max_steps is None else max_steps - state.steps
+        if budget is not None and budget <= 0:
+            raise ComputerExecutionLimitExceeded(
+                'The program did not finish within {} steps'.format(max_steps), state)
+        slice_steps = SLICE_STEPS if budget is None else min(SLICE_STEPS, budget)
+        if profile is None:
+            runner(program, state, slice_steps, budget=budget)
+        else:
+            run_profiled(program, state, slice_steps, profile, budget=budget)
+        yield state
+        if state.halted:
+            return
+        if deadline is not None and time.time() > deadline:
+            raise ComputerExecutionLimitExceeded(
+                'The program did not finish within {} seconds'.format(timeout), state)
+
+
+def execute_compiled(
+        program, program_counter, max_steps=None, timeout=None, progress=None, profile=None, state=None):
+    """
+    Executes a `CompiledProgram` starting at `program_counter`.
+
+    :param program: The `CompiledProgram` to execute
+    :param program_counter: The address to start the execution at
+    :param max_steps: Optional budget of instructions to execute
+    :param timeout: Optional budget of seconds to execute for
+    :param progress: Optional callable that receives the `ExecutionState` after every slice of instructions
+    :param profile: Optional `ExecutionProfile` to record the execution into
+    :param state: Optional `ExecutionState` to resume from instead of `program_counter`, updated along the way
+    :return: list
+    """
+    if state is None:
+        state = ExecutionState(program_counter)
+    started_at = time.time()
+    try:
+        for _ in _iter_slices(program, state, max_steps, timeout, profile=profile):
+            if progress is not None:
+                progress(state)
+    finally:
+        if profile is not None:
+            profile.wall_time += time.time() - started_at
+    return state.output
+
+
+def iter_compiled(program, program_counter, max_steps=None, timeout=None):
+    """
+    Executes a `CompiledProgram` starting at `program_counter`, yielding every printed value as soon as the slice of
+    instructions that printed it ends, so the output is never held in memory as a whole.
+
+    :param program: The `CompiledProgram` to execute
+    :param program_counter: The address to start the execution at
+    :param max_steps: Optional budget of instructions to execute
+    :param timeout: Optional budget of seconds to execute for
+    :return: generator
+    """
+    state = ExecutionState(program_counter)
+    try:
+        for _ in _iter_slices(program, state, max_steps, timeout):
+            for value in state.output:
+                yield value
+            del state.output[:]
+    except Exception as e:
+        # Whatever was printed by the failing slice still comes first
+        for value in state.output:
+            yield value
+        raise e
+
+
+def execute_reference(
+        program_stack, program_stack_size, program_counter, max_steps=None, timeout=None, profile=None, state=None):
+    """
+    Executes `program_stack` one address at a time, exactly as `Computer.execute` originally did.
+
+    It is kept as the reference every other engine must match.
+
+    :param program_stack: Dict of address -> (instruction, instruction_arg), as stored by `Computer`
+    :param program_stack_size: The last executable address
+    :param program_counter: The address to start the execution at
+    :param max_steps: Optional budget of instructions to execute
+    :param timeout: Optional budget of seconds to execute for
+    :param profile: Optional `ExecutionProfile` to record the execution into; only its output and time are recorded
+    :param state: Optional `ExecutionState` to record the state the execution finished with into (executions can't be
+        resumed by this engine)
+    :return: list
+    """
+    if profile is not None:
+        started_at = time.time()
+        program_output_data = execute_reference(
+            program_stack, program_stack_size, program_counter, max_steps=max_steps, timeout=timeout, state=state)
+        profile.wall_time += time.time() - started_at
+        profile.output_size += len(program_output_data)
+        return program_output_data
+
+    program_output_data = []
+    memory = []
+    steps = 0
+    deadline = time.time() + timeout if timeout else None
+
+    while program_counter <= program_stack_size:
+        if max_steps is not None and steps >= max_steps:
+            raise ComputerExecutionLimitExceeded(
+                'The program did not finish within {} steps'.format(max_steps),
+                ExecutionState(program_counter, memory, program_output_data, steps))
+        if deadline is not None and not steps % SLICE_STEPS and time.time() > deadline:
+            raise ComputerExecutionLimitExceeded(
+                'The program did not finish within {} seconds'.format(timeout),
+                ExecutionState(program_counter, memory, program_output_data, steps))
+        steps += 1
+        instruction, instruction_arg = program_stack.get(program_counter, (None, None))
+        # Making sure args are ints
+        if instruction_arg:
+            instruction_arg = int(instruction_arg)
+
+        if instruction == ComputerInstruction.PUSH:
+            memory.append(instruction_arg)
+
+        elif instruction == ComputerInstruction.PRINT:
+            value_to_print = memory.pop()
+            program_output_data.append(value_to_print)
+
+        elif instruction == ComputerInstruction.CALL:
+            program_counter = instruction_arg
+
+        elif instruction == ComputerInstruction.MULT:
+            operand1 = memory.pop()
+            operand2 = memory.pop()
+            if operand1 and operand2:
+                memory.append(operand1 * operand2)
+
+        elif instruction == ComputerInstruction.RET:
+            value_to_ret_to = memory.pop()
+            if value_to_ret_to:
+                program_counter = value_to_ret_to
+
+        elif instruction == ComputerInstruction.STOP:
+            break
+
+        # Moving forward with our program execution
+        if instruction not in (ComputerInstruction.RET, ComputerInstruction.CALL):
+            program_counter += 1
+
+    if state is not None:
+        state.program_counter, state.memory, state.output = program_counter, memory, program_output_data
+        state.steps, state.halted = steps, True
+    return program_output_data
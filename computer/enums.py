@@ -24,6 +24,12 @@ class ComputerInstruction(object):
         PUSH: PUSH,
     }
 
+    # Instructions whose arg can't be 0 (nor missing), along with the error reported otherwise
+    REQUIRED_ARG_ERRORS = {
+        PUSH: 'You must provide this value when using PUSH.',
+        CALL: 'You must provide this value when using CALL.',
+    }
+
     @classmethod
     def get_value(cls, possible_instruction):
         """
@@ -32,3 +38,81 @@ class ComputerInstruction(object):
         :return:
         """
         return cls._ALL_INTRUCTIONS.get(possible_instruction.lower())
+
+
+class ComputerOpcode(object):
+    """
+    Enum that lists the integer opcodes used by compiled programs.
+
+    `NOP` marks an empty address, `FAULT` an address whose instruction can't be decoded, `FUSED` a superinstruction
+    added by the optimizer and `MEMO` a subroutine memoized by it; none of them can be inserted into a `Computer`.
+    """
+    NOP = 0
+    PUSH = 1
+    PRINT = 2
+    MULT = 3
+    CALL = 4
+    RET = 5
+    STOP = 6
+    FAULT = 7
+    FUSED = 8
+    MEMO = 9
+
+    _BY_INSTRUCTION = {
+        ComputerInstruction.PUSH: PUSH,
+        ComputerInstruction.PRINT: PRINT,
+        ComputerInstruction.MULT: MULT,
+        ComputerInstruction.CALL: CALL,
+        ComputerInstruction.RET: RET,
+        ComputerInstruction.STOP: STOP,
+    }
+
+    _BY_OPCODE = {opcode: instruction for instruction, opcode in _BY_INSTRUCTION.items()}
+
+    CHOICES = sorted((opcode, instruction.upper()) for instruction, opcode in _BY_INSTRUCTION.items())
+
+    @classmethod
+    def get_value(cls, instruction):
+        """
+        Returns the opcode of `instruction`, or `NOP` if it isn't a known instruction.
+        :param instruction: The (cleaned) instruction to translate
+        :return: int
+        """
+        return cls._BY_INSTRUCTION.get(instruction, cls.NOP)
+
+    @classmethod
+    def get_instruction(cls, opcode):
+        """
+        Returns the instruction of `opcode`, or None if it doesn't match any instruction.
+        :param opcode: The opcode to translate
+        :return:
+        """
+        return cls._BY_OPCODE.get(opcode)
+
+
+class ComputerEngine(object):
+    """
+    Enum that lists the available engines to execute programs of a `Computer`.
+    """
+    REFERENCE = 'reference'
+    COMPILED = 'compiled'
+    OPTIMIZED = 'optimized'
+    IMAGE = 'image'
+    GENERATED = 'generated'
+
+    _ALL_ENGINES = {
+        REFERENCE: REFERENCE,
+        COMPILED: COMPILED,
+        OPTIMIZED: OPTIMIZED,
+        IMAGE: IMAGE,
+        GENERATED: GENERATED,
+    }
+
+    @classmethod
+    def get_value(cls, possible_engine):
+        """
+        Returns the cleaned version of `possible_engine`, if available.
+        :param possible_engine: The engine to verify and clean
+        :return:
+        """
+        return cls._ALL_ENGINES.get(possible_engine.lower())
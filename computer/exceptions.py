@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+
+class ComputerException(Exception):
+    """
+    Class that just to customize exceptions generated by `Computer` if needed.
+    """
+    pass
+
+
+class ComputerExecutionLimitExceeded(ComputerException):
+    """
+    Exception raised when a program runs out of its budget of steps or time, along with the state it reached.
+    """
+    def __init__(self, message, state):
+        super(ComputerExecutionLimitExceeded, self).__init__(message)
+        self.state = state
+
+
+class ComputerInfiniteLoop(ComputerExecutionLimitExceeded):
+    """
+    Exception raised when a program is proven to never finish, since it reached the very same state twice.
+    """
+    pass
+
+
+class ComputerSnapshotConflict(ComputerException):
+    """
+    Exception raised when a suspended execution can't be continued, since its program changed or someone else
+    continued it in the meantime.
+    """
+    pass
+
+
+class ComputerSnapshotExpired(ComputerSnapshotConflict):
+    """
+    Exception raised when a suspended execution can't be continued, since it was left unattended for too long.
+    """
+    pass
+
+
+class ComputerSessionConflict(ComputerException):
+    """
+    Exception raised when an editing session can't be committed, since the program changed in the meantime.
+    """
+    pass
+
+
+class ComputerAssemblyError(ComputerException):
+    """
+    Exception raised when the source of a program can't be assembled, along with the (line number, message) of every
+    error found.
+    """
+    def __init__(self, errors):
+        super(ComputerAssemblyError, self).__init__('; '.join(self.messages_of(errors)))
+        self.errors = errors
+
+    @staticmethod
+    def messages_of(errors):
+        return ['Line {}: {}'.format(line_number, message) for line_number, message in errors]
@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Binary program images: a compact, read-only encoding of a program stack that is published once as a file keyed by its
+content hash and memory-mapped by every worker, so all of them share a single copy of it through the page cache.
+
+Every saved `Computer` has a single ref (`refs/{id}`) naming the image of its latest version, replaced whenever a newer
+one is published; images no ref names anymore are removed by `collect_images` (`python manage.py collect_images`).
+
+An image is a header (`HEADER`: magic, program stack size and number of records) followed by one fixed-width record
+(`RECORD`: address, opcode, whether it has an argument and the argument) per populated address, sorted by address.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from computer.engine import ExecutionState, _decode_instruction, _infinite_loop, _iter_slices
+from computer.enums import ComputerOpcode
+
+MAGIC = b'CSIMAGE1'
+HEADER = struct.Struct(str('<8sII'))
+RECORD = struct.Struct(str('<IBBxxq'))
+ADDRESS = struct.Struct(str('<I'))
+
+MIN_ARG = -2 ** 63
+MAX_ARG = 2 ** 63 - 1
+
+# Maximum number of jump targets whose record each process remembers per image
+MAX_CACHED_TARGETS = 4096
+
+# Maximum number of images each process keeps mapped, closing the least recently opened ones beyond it; it should be
+# well above the number of images executed at once by the threads of a process
+MAX_OPEN_IMAGES = 256
+
+# Seconds images are kept after they were last published, even if no ref names them (i.e. while their ref is written)
+IMAGE_GRACE_PERIOD = 60 * 60
+
+# Prefix of the files being written, which are skipped when collecting images
+TEMPORARY_PREFIX = '.tmp'
+
+# Images mapped by this process, by path, from the least to the most recently opened
+_images = OrderedDict()
+_images_lock = threading.Lock()
+
+
+class ProgramImage(object):
+    """
+    Program stack read straight from a memory-mapped image.
+    """
+    __slots__ = ('buffer', 'size', 'count', 'path', 'targets', 'closed')
+
+    def __init__(self, buffer, path=None):
+        magic, self.size, self.count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a program image'.format(path or 'The buffer'))
+        self.buffer = buffer
+        self.path = path
+        self.targets = {}
+        self.closed = False
+
+    def close(self):
+        """
+        Unmaps the image, if it was mapped; it can't be read anymore after this.
+        """
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.closed = True
+
+    def find(self, address):
+        """
+        Returns the index of the first record at `address` or after it.
+
+        :param address: The address to look for
+        :return: int
+        """
+        index = self.targets.get(address)
+        if index is not None:
+            return index
+        unpack_address = ADDRESS.unpack_from
+        buffer = self.buffer
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if unpack_address(buffer, HEADER.size + middle * RECORD.size)[0] < address:
+                low = middle + 1
+            else:
+                high = middle
+        if len(self.targets) < MAX_CACHED_TARGETS:
+            self.targets[address] = low
+        return low
+
+    def program_stack(self):
+        """
+        Decodes the whole image back into a program stack.
+
+        :return: dict of address -> (instruction, instruction_arg)
+        """
+        program_stack = {}
+        for index in range(self.count):
+            address, opcode, has_arg, instruction_arg = RECORD.unpack_from(self.buffer, HEADER.size + index * RECORD.size)
+            program_stack[address] = (ComputerOpcode.get_instruction(opcode), instruction_arg if has_arg else None)
+        return program_stack
+
+
+def build_image(program_stack, program_stack_size):
+    """
+    Encodes `program_stack` as an image.
+
+    :param program_stack: Dict of address -> (instruction, instruction_arg), as stored by `Computer`
+    :param program_stack_size: The last executable address
+    :return: bytes, or None if the program can't be encoded (i.e. it uses negative addresses or args too large)
+    """
+    if any(address < 0 for address in program_stack):
+        return None
+    records = []
+    for address in sorted(program_stack):
+        if address > program_stack_size:
+            break
+        opcode, instruction_arg = _decode_instruction(program_stack, address)
+        if opcode == ComputerOpcode.NOP:
+            continue
+        if opcode == ComputerOpcode.FAULT:
+            # CALLs with no address are the only faults an image can hold: they fail when reached, for lacking one
+            if program_stack[address][1] is not None:
+                return None
+            opcode, instruction_arg = ComputerOpcode.CALL, None
+        if instruction_arg is not None and not MIN_ARG <= instruction_arg <= MAX_ARG:
+            return None
+        records.append(RECORD.pack(
+            address, opcode, instruction_arg is not None, instruction_arg if instruction_arg is not None else 0))
+    return HEADER.pack(MAGIC, program_stack_size, len(records)) + b''.join(records)
+
+
+def _write_atomically(path, data):
+    """
+    Writes `data` into `path` through a temporary file, so no one ever sees it half written.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Someone else created it in the meantime
+            pass
+    fd, temporary_path = tempfile.mkstemp(prefix=TEMPORARY_PREFIX, dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as temporary_file:
+            temporary_file.write(data)
+        os.rename(temporary_path, path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+
+def _image_dir():
+    # Settings are only read when images are published or found, so running images needs no Django
+    from django.conf import settings
+    return settings.COMPUTER_PROGRAM_IMAGE_DIR
+
+
+def _image_path(content_hash):
+    return os.path.join(_image_dir(), '{}.img'.format(content_hash))
+
+
+def _ref_path(computer_id):
+    return os.path.join(_image_dir(), 'refs', '{}'.format(computer_id))
+
+
+def _read_ref(path):
+    """
+    Returns the ref stored in `path`, as a tuple of (version, program stack size, content hash), or None if there's
+    none.
+    """
+    try:
+        with open(path, 'rb') as ref_file:
+            version, program_stack_size, content_hash = ref_file.read().decode('ascii').split()
+        return int(version), int(program_stack_size), content_hash
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def open_image(path):
+    """
+    Returns the image stored in `path`, mapping it into memory only the first time it's opened by this process (or
+    the first time since it was closed to make room for others).
+
+    :param path: The path of the image
+    :return: ProgramImage
+    """
+    with _images_lock:
+        image = _images.pop(path, None)
+        if image is None:
+            with open(path, 'rb') as image_file:
+                buffer = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+            image = ProgramImage(buffer, path=path)
+            while len(_images) >= MAX_OPEN_IMAGES:
+                _images.popitem(last=False)[1].close()
+        _images[path] = image
+        return image
+
+
+def publish_image(data, computer_id=None, version=None):
+    """
+    Publishes the image `data` under its content hash, unless it's already published, and opens it.
+
+    If `computer_id` and `version` are given, the image is also referenced as the one of that version of that
+    `Computer` (instead of the one of the version before, unless the one referenced is newer), so other workers can
+    find it without loading its program stack.
+
+    :param data: The image, as returned by `build_image`
+    :param computer_id: Optional ID of the `Computer` the image belongs to
+    :param version: The version of the `Computer` the image belongs to
+    :return: ProgramImage
+    """
+    content_hash = hashlib.sha1(data).hexdigest()
+    path = _image_path(content_hash)
+    try:
+        # Published again just now, so it's not collected while its ref is written
+        os.utime(path, None)
+    except OSError:
+        _write_atomically(path, data)
+    if computer_id is not None:
+        ref_path = _ref_path(computer_id)
+        ref = _read_ref(ref_path)
+        if ref is None or ref[0] <= version:
+            _, program_stack_size, _ = HEADER.unpack_from(data, 0)
+            _write_atomically(ref_path, '{} {} {}'.format(version, program_stack_size, content_hash).encode('ascii'))
+    return open_image(path)
+
+
+def find_image(computer_id, version, program_stack_size):
+    """
+    Returns the image published for `version` of the `Computer` with `computer_id`, or None if there's none.
+
+    :return: ProgramImage
+    """
+    ref = _read_ref(_ref_path(computer_id))
+    if ref is None or ref[:2] != (version, program_stack_size):
+        return None
+    try:
+        return open_image(_image_path(ref[2]))
+    except (IOError, OSError):
+        return None
+
+
+def collect_images(computer_ids=None):
+    """
+    Removes the images no ref names, unless they were published within the last `IMAGE_GRACE_PERIOD` seconds.
+
+    Processes that mapped a removed image can keep reading it; it's published again the next time it's needed.
+
+    :param computer_ids: Optional set of IDs (as strings) of the `Computer`s that still exist, to also remove the refs
+        of every other one
+    :return: tuple of (number of refs removed, number of images removed)
+    """
+    refs_dir = os.path.join(_image_dir(), 'refs')
+    removed_refs = removed_images = 0
+    referenced = set()
+    for name in (os.listdir(refs_dir) if os.path.isdir(refs_dir) else []):
+        if name.startswith(TEMPORARY_PREFIX):
+            continue
+        path = os.path.join(refs_dir, name)
+        if computer_ids is not None and name not in computer_ids:
+            try:
+                os.remove(path)
+                removed_refs += 1
+            except OSError:
+                pass
+            continue
+        ref = _read_ref(path)
+        if ref is not None:
+            referenced.add(ref[2])
+
+    collect_before = time.time() - IMAGE_GRACE_PERIOD
+    for name in os.listdir(_image_dir()) if os.path.isdir(_image_dir()) else []:
+        content_hash, extension = os.path.splitext(name)
+        if extension != '.img' or content_hash in referenced:
+            continue
+        path = os.path.join(_image_dir(), name)
+        try:
+            if os.path.getmtime(path) < collect_before:
+                os.remove(path)
+                removed_images += 1
+        except OSError:
+            pass
+    return removed_refs, removed_images
+
+
+def run_image(image, state, max_steps, budget=None):
+    """
+    Same as `run_compiled`, but reading every instruction straight from a `ProgramImage`.
+
+    :param image: The `ProgramImage` to run
+    :param state: The `ExecutionState` to resume from
+    :param max_steps: How many instructions to run at most
+    :param budget: Optional number of steps left in the budget of the whole execution
+    :return: ExecutionState
+    """
+    buffer = image.buffer
+    size = image.size
+    count = image.count
+    find = image.find
+    unpack_record = RECORD.unpack_from
+    header_size, record_size = HEADER.size, RECORD.size
+    memory = state.memory
+    push = memory.append
+    pop = memory.pop
+    output = state.output.append
+    PUSH, PRINT, MULT, CALL, RET, STOP = (
+        ComputerOpcode.PUSH, ComputerOpcode.PRINT, ComputerOpcode.MULT, ComputerOpcode.CALL, ComputerOpcode.RET,
+        ComputerOpcode.STOP)
+
+    saved_pc, saved_memory, power, countdown = state.cycle
+
+    pc = state.program_counter
+    index = find(pc)
+    remaining = max_steps
+    halted = False
+    try:
+        while remaining > 0:
+            if pc > size:
+                halted = True
+                break
+            remaining -= 1
+            if index < count:
+                address, opcode, has_arg, arg = unpack_record(buffer, header_size + index * record_size)
+            else:
+                address = size + 1
+            if address != pc:
+                # Walking over a whole empty region, as far as the budget goes
+                empty = address - pc
+                if address > size and state.tail is None:
+                    state.tail = pc
+                if budget is not None:
+                    empty = min(empty, budget - max_steps + remaining + 1)
+                remaining -= empty - 1
+                pc += empty
+                continue
+            if not has_arg:
+                arg = None
+            if opcode == PUSH:
+                push(arg)
+                pc += 1
+                index += 1
+            elif opcode == PRINT:
+                output(pop())
+                pc += 1
+                index += 1
+            elif opcode == MULT:
+                operand1 = pop()
+                operand2 = pop()
+                if operand1 and operand2:
+                    push(operand1 * operand2)
+                pc += 1
+                index += 1
+            elif opcode == CALL:
+                if arg is None:
+                    raise TypeError("unsupported operand type(s) for +=: 'NoneType' and 'int'")
+                if arg <= pc:
+                    # A back-edge: the machine state is compared with the one saved by Brent's algorithm
+                    if arg == saved_pc and memory == saved_memory:
+                        pc = arg
+                        raise _infinite_loop(state)
+                    countdown -= 1
+                    if not countdown:
+                        power *= 2
+                        countdown = power
+                        saved_pc, saved_memory = arg, memory[:]
+                pc = arg
+                index = find(pc)
+            elif opcode == RET:
+                value_to_ret_to = pop()
+                if value_to_ret_to:
+                    if value_to_ret_to <= pc:
+                        if value_to_ret_to == saved_pc and memory == saved_memory:
+                            pc = value_to_ret_to
+                            raise _infinite_loop(state)
+                        countdown -= 1
+                        if not countdown:
+                            power *= 2
+                            countdown = power
+                            saved_pc, saved_memory = value_to_ret_to, memory[:]
+                    pc = value_to_ret_to
+                    index = find(pc)
+            elif opcode == STOP:
+                halted = True
+                break
+        else:
+            halted = pc > size
+    finally:
+        state.program_counter = pc
+        state.steps += max_steps - remaining
+        state.halted = halted
+        state.cycle = (saved_pc, saved_memory, power, countdown)
+    return state
+
+
+def execute_image(image, program_counter, max_steps=None, timeout=None, progress=None, state=None):
+    """
+    Executes a `ProgramImage` starting at `program_counter`.
+
+    :param image: The `ProgramImage` to execute
+    :param program_counter: The address to start the execution at
+    :param max_steps: Optional budget of instructions to execute
+    :param timeout: Optional budget of seconds to execute for
+    :param progress: Optional callable that receives the `ExecutionState` after every slice of instructions
+    :param state: Optional `ExecutionState` to resume from instead of `program_counter`, updated along the way
+    :return: list
+    """
+    if state is None:
+        state = ExecutionState(program_counter)
+    for _ in _iter_slices(image, state, max_steps, timeout, runner=run_image):
+        if progress is not None:
+            progress(state)
+    return state.output
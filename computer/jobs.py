@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.db import DatabaseError, connection, models, transaction
+from django.utils import timezone
+
+from computer.exceptions import ComputerExecutionLimitExceeded
+from computer.models import ExecutionJob
+
+# How often (in seconds) a running job writes its progress to the database
+PROGRESS_INTERVAL = 1
+
+# How many heartbeats in a row a job can miss before it's failed as left behind
+STALE_HEARTBEATS = 3
+
+STALE_JOB_ERROR = 'The process running the job stopped before it finished'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _owner():
+    """
+    Returns the name of this process, as the owner of the jobs submitted to it.
+    """
+    return '{}:{}'.format(socket.gethostname(), os.getpid())[:64]
+
+
+def _get_pool():
+    """
+    Returns the pool of threads that run jobs in this process, starting it (along with its heartbeat) the first time
+    it's needed, once the jobs left behind by processes that stopped are failed.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            fail_stale_jobs()
+            _pool = ThreadPool(settings.COMPUTER_JOB_WORKERS)
+            heartbeat = threading.Thread(target=_beat, name='computer-job-heartbeat')
+            heartbeat.daemon = True
+            heartbeat.start()
+    return _pool
+
+
+def _beat():
+    """
+    Keeps the pending and running jobs of this process alive, failing the ones of processes that stopped, for as long
+    as this process runs.
+    """
+    while True:
+        time.sleep(settings.COMPUTER_JOB_HEARTBEAT_INTERVAL)
+        try:
+            ExecutionJob.objects.filter(owner=_owner(), status__in=ExecutionJob.ACTIVE_STATUSES).update(
+                heartbeat_at=timezone.now())
+            fail_stale_jobs()
+        except DatabaseError:
+            # The next heartbeat may be luckier
+            pass
+        finally:
+            connection.close()
+
+
+def _stale_before():
+    return timezone.now() - timedelta(seconds=settings.COMPUTER_JOB_HEARTBEAT_INTERVAL * STALE_HEARTBEATS)
+
+
+def fail_stale_jobs():
+    """
+    Fails every pending or running job that missed `STALE_HEARTBEATS` heartbeats in a row, since the process it was
+    submitted to stopped (i.e. it was restarted) and it will never finish.
+
+    :return: int, how many jobs were failed
+    """
+    return ExecutionJob.objects.filter(
+        models.Q(heartbeat_at__lt=_stale_before()) | models.Q(heartbeat_at__isnull=True),
+        status__in=ExecutionJob.ACTIVE_STATUSES,
+    ).update(status=ExecutionJob.FAILED, error=STALE_JOB_ERROR, finished_at=timezone.now())
+
+
+def fail_if_stale(job):
+    """
+    Fails `job` if it's pending or running but missed `STALE_HEARTBEATS` heartbeats in a row, so it's never shown as
+    running forever even if no process fails it.
+
+    :param job: The `ExecutionJob` to check
+    :return: ExecutionJob
+    """
+    if job.status not in ExecutionJob.ACTIVE_STATUSES or (
+            job.heartbeat_at is not None and job.heartbeat_at >= _stale_before()):
+        return job
+    finished_at = timezone.now()
+    failed = ExecutionJob.objects.filter(pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at).update(
+        status=ExecutionJob.FAILED, error=STALE_JOB_ERROR, finished_at=finished_at)
+    if failed:
+        job.status, job.error, job.finished_at = ExecutionJob.FAILED, STALE_JOB_ERROR, finished_at
+    else:
+        job.refresh_from_db()
+    return job
+
+
+def submit_job(computer):
+    """
+    Creates an `ExecutionJob` for `computer` and schedules it in the local pool of workers.
+
+    If `settings.COMPUTER_JOB_WORKERS` is 0 the job is run right away instead.
+
+    :param computer: The `Computer` to execute
+    :return: ExecutionJob
+    """
+    job = ExecutionJob.objects.create(computer=computer, owner=_owner(), heartbeat_at=timezone.now())
+    if settings.COMPUTER_JOB_WORKERS:
+        transaction.on_commit(lambda: _get_pool().apply_async(_run_job_in_worker, (job.pk,)))
+    else:
+        run_job(job.pk)
+        job.refresh_from_db()
+    return job
+
+
+def _run_job_in_worker(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Workers don't go through the request cycle, which is what usually closes connections
+        connection.close()
+
+
+def run_job(job_id):
+    """
+    Executes the program of the `Computer` of a job, writing its progress along the way.
+
+    :param job_id: The ID of the `ExecutionJob` to run
+    :return: None
+    """
+    claimed = ExecutionJob.objects.filter(pk=job_id, status=ExecutionJob.PENDING).update(
+        status=ExecutionJob.RUNNING, owner=_owner(), heartbeat_at=timezone.now())
+    if not claimed:
+        # It was failed as left behind in the meantime
+        return
+    job = ExecutionJob.objects.select_related('computer').get(pk=job_id)
+    last_saved = [time.time()]
+
+    def progress(state):
+        job.steps = state.steps
+        if not state.halted and time.time() - last_saved[0] >= PROGRESS_INTERVAL:
+            last_saved[0] = time.time()
+            job.program_output = state.output
+            # Saving its progress keeps the job alive as well, even if no heartbeat runs in this process
+            job.heartbeat_at = timezone.now()
+            job.save(update_fields=['program_output', 'steps', 'heartbeat_at'])
+
+    try:
+        job.program_output = job.computer.execute(
+            max_steps=settings.COMPUTER_JOB_MAX_STEPS, timeout=settings.COMPUTER_JOB_TIMEOUT, progress=progress)
+        job.status = ExecutionJob.FINISHED
+    except ComputerExecutionLimitExceeded as e:
+        job.program_output = e.state.output
+        job.steps = e.state.steps
+        job.status = ExecutionJob.FAILED
+        job.error = '{}'.format(e)
+    except Exception as e:
+        job.status = ExecutionJob.FAILED
+        job.error = 'Unexpected error when executing the program: {}'.format(e)
+    job.finished_at = timezone.now()
+    job.save()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from computer.assembler import assemble
+from computer.exceptions import ComputerAssemblyError
+from computer.models import Computer
+
+
+class Command(BaseCommand):
+    """
+    Assembles the source of a program (see `computer.assembler`) and inserts it in a `Computer` at once.
+    """
+    help = 'Assembles the source of a program and inserts it in a computer at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Path of the source to assemble, or - to read it from the standard input.')
+        parser.add_argument(
+            '--computer', default=None,
+            help='ID of the computer to insert the program in; a new one is created if none is given.')
+        parser.add_argument(
+            '--stack', type=int, default=None,
+            help='Size of the program stack of the new computer; just enough for the program by default.')
+
+    def handle(self, *args, **options):
+        computer = None
+        size = options['stack'] if options['stack'] is not None else Computer.MAX_ADDRESS
+        if options['computer'] is not None:
+            try:
+                computer = Computer.objects.get(pk=options['computer'])
+            except Computer.DoesNotExist:
+                raise CommandError('There is no computer {}'.format(options['computer']))
+            size = computer.program_stack_size
+
+        try:
+            if options['source'] == '-':
+                program, labels = assemble(sys.stdin, size=size)
+            else:
+                with io.open(options['source'], 'rb') as source:
+                    program, labels = assemble(source, size=size)
+        except ComputerAssemblyError as e:
+            raise CommandError('\n'.join(ComputerAssemblyError.messages_of(e.errors)))
+
+        with transaction.atomic():
+            if computer is None:
+                computer = Computer(
+                    program_stack_size=size if options['stack'] is not None else max([0] + [
+                        address for address, _, _ in program]))
+                computer.save()
+            computer.load_program(program, save=True)
+        self.stdout.write('Inserted {} instructions in computer {}'.format(len(program), computer.pk))
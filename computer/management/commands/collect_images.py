@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from computer.images import collect_images
+from computer.models import Computer
+
+
+class Command(BaseCommand):
+    """
+    Removes the published program images (see `computer.images`) no `Computer` refers to anymore.
+    """
+    help = 'Removes the published program images no computer refers to anymore.'
+
+    def handle(self, *args, **options):
+        removed_refs, removed_images = collect_images(computer_ids={
+            '{}'.format(computer_id) for computer_id in Computer.objects.values_list('pk', flat=True).iterator()})
+        self.stdout.write('Removed {} refs and {} images'.format(removed_refs, removed_images))
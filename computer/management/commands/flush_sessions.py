@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from computer.sessions import EditingSession, flush_if_idle
+
+
+class Command(BaseCommand):
+    """
+    Commits the editing sessions (see `EditingSession`) that have been idle for
+    `settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT` seconds, whichever process they were changed by.
+    """
+    help = 'Commits the editing sessions that have been idle for long enough.'
+
+    def handle(self, *args, **options):
+        if not settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT:
+            self.stdout.write('Editing sessions are only committed on request')
+            return
+        committed = 0
+        for session_id in EditingSession.open_ids():
+            if flush_if_idle(session_id, reschedule=False) is not None:
+                committed += 1
+        self.stdout.write('Committed {} sessions'.format(committed))
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from computer.models import ExecutionSnapshot
+
+
+class Command(BaseCommand):
+    """
+    Deletes the suspended executions (see `ExecutionSnapshot`) that expired.
+    """
+    help = 'Deletes the suspended executions that expired.'
+
+    def handle(self, *args, **options):
+        deleted, _ = ExecutionSnapshot.expired().delete()
+        self.stdout.write('Deleted {} snapshots'.format(deleted))
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import threading
+
+from computer.enums import ComputerOpcode
+
+
+class ExecutionMetrics(object):
+    """
+    Process-wide aggregation of the `ExecutionProfile`s of profiled executions, rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.executions = 0
+            self.opcode_counts = [0] * (ComputerOpcode.FAULT + 1)
+            self.steps = 0
+            self.memory_high_water = 0
+            self.output_size = 0
+            self.wall_time = 0.0
+
+    def record(self, profile):
+        """
+        Adds `profile` to the aggregated metrics.
+
+        :param profile: The `ExecutionProfile` of a finished execution
+        :return: None
+        """
+        with self._lock:
+            self.executions += 1
+            self.opcode_counts = [total + count for total, count in zip(self.opcode_counts, profile.opcode_counts)]
+            self.steps += profile.steps
+            self.memory_high_water = max(self.memory_high_water, profile.memory_high_water)
+            self.output_size += profile.output_size
+            self.wall_time += profile.wall_time
+
+    def render(self):
+        """
+        Returns the aggregated metrics in the Prometheus text exposition format.
+
+        :return: str
+        """
+        with self._lock:
+            lines = [
+                '# HELP computer_profiled_executions_total Profiled executions of programs.',
+                '# TYPE computer_profiled_executions_total counter',
+                'computer_profiled_executions_total {}'.format(self.executions),
+                '# HELP computer_instructions_executed_total Instructions executed by profiled executions.',
+                '# TYPE computer_instructions_executed_total counter',
+            ]
+            for opcode, instruction in ComputerOpcode.CHOICES:
+                lines.append('computer_instructions_executed_total{{instruction="{}"}} {}'.format(
+                    instruction, self.opcode_counts[opcode]))
+            lines += [
+                '# HELP computer_empty_addresses_total Empty addresses walked over by profiled executions.',
+                '# TYPE computer_empty_addresses_total counter',
+                'computer_empty_addresses_total {}'.format(self.opcode_counts[ComputerOpcode.NOP]),
+                '# HELP computer_execution_steps_total Steps (instructions and empty addresses) of profiled executions.',
+                '# TYPE computer_execution_steps_total counter',
+                'computer_execution_steps_total {}'.format(self.steps),
+                '# HELP computer_memory_high_water Highest number of values held in memory by a profiled execution.',
+                '# TYPE computer_memory_high_water gauge',
+                'computer_memory_high_water {}'.format(self.memory_high_water),
+                '# HELP computer_output_values_total Values printed by profiled executions.',
+                '# TYPE computer_output_values_total counter',
+                'computer_output_values_total {}'.format(self.output_size),
+                '# HELP computer_execution_seconds_total Wall time spent in profiled executions.',
+                '# TYPE computer_execution_seconds_total counter',
+                'computer_execution_seconds_total {!r}'.format(self.wall_time),
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+execution_metrics = ExecutionMetrics()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 09:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from computer.enums import ComputerOpcode
+
+
+def move_program_stacks_to_instructions(apps, schema_editor):
+    """
+    Creates one `Instruction` per address stored in the JSON program stack of every `Computer`.
+    """
+    Computer = apps.get_model('computer', 'Computer')
+    Instruction = apps.get_model('computer', 'Instruction')
+    for computer in Computer.objects.all().iterator():
+        instructions = []
+        for addr, (instruction, instruction_arg) in sorted((int(a), i) for a, i in computer.program_stack.items()):
+            opcode = ComputerOpcode.get_value(instruction)
+            if opcode != ComputerOpcode.NOP:
+                instructions.append(Instruction(
+                    computer=computer, addr=addr, opcode=opcode,
+                    arg=int(instruction_arg) if instruction_arg else instruction_arg))
+        Instruction.objects.bulk_create(instructions)
+
+
+def move_instructions_to_program_stacks(apps, schema_editor):
+    """
+    Rebuilds the JSON program stack of every `Computer` from its instructions.
+    """
+    Computer = apps.get_model('computer', 'Computer')
+    Instruction = apps.get_model('computer', 'Instruction')
+    for computer in Computer.objects.all().iterator():
+        computer.program_stack = {
+            addr: (ComputerOpcode.get_instruction(opcode), arg)
+            for addr, opcode, arg in Instruction.objects.filter(computer=computer).values_list('addr', 'opcode', 'arg')
+        }
+        computer.save(update_fields=['program_stack'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0003_auto_20171018_1724'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Instruction',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('addr', models.PositiveSmallIntegerField(verbose_name='Address in the program stack')),
+                ('opcode', models.PositiveSmallIntegerField(choices=[(1, 'PUSH'), (2, 'PRINT'), (3, 'MULT'), (4, 'CALL'), (5, 'RET'), (6, 'STOP')])),
+                ('arg', models.BigIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ('addr',),
+            },
+        ),
+        migrations.AddField(
+            model_name='instruction',
+            name='computer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='instructions', to='computer.Computer'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='instruction',
+            unique_together=set([('computer', 'addr')]),
+        ),
+        migrations.RunPython(move_program_stacks_to_instructions, move_instructions_to_program_stacks),
+        migrations.RemoveField(
+            model_name='computer',
+            name='program_stack',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 09:42
+from __future__ import unicode_literals
+
+import computer.utils
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0004_instruction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionJob',
+            fields=[
+                ('id', models.CharField(default=computer.utils.generate_job_id, editable=False, max_length=16, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('program_output', jsonfield.fields.JSONField(default=[], verbose_name='Output printed so far')),
+                ('steps', models.PositiveIntegerField(default=0, verbose_name='Instructions executed so far')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('computer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='computer.Computer')),
+            ],
+        ),
+    ]
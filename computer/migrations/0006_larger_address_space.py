@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 09:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0005_executionjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='computer',
+            name='program_counter',
+            field=models.PositiveIntegerField(default=0, verbose_name='Program counter (PC)'),
+        ),
+        migrations.AlterField(
+            model_name='computer',
+            name='program_stack_pointer',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='computer',
+            name='program_stack_size',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='instruction',
+            name='addr',
+            field=models.PositiveIntegerField(verbose_name='Address in the program stack'),
+        ),
+    ]
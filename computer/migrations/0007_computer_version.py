@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 10:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0006_larger_address_space'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='computer',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 10:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0007_computer_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='computer',
+            name='checkpoint',
+            field=jsonfield.fields.JSONField(default=None, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='computer',
+            name='dirty_from',
+            field=models.PositiveIntegerField(default=None, editable=False, null=True),
+        ),
+    ]
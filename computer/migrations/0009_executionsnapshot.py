@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 10:15
+from __future__ import unicode_literals
+
+import computer.utils
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0008_execution_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionSnapshot',
+            fields=[
+                ('id', models.CharField(default=computer.utils.generate_snapshot_id, editable=False, max_length=16, primary_key=True, serialize=False)),
+                ('version', models.PositiveIntegerField(verbose_name='Version of the program being executed')),
+                ('program_counter', models.BigIntegerField(default=0, verbose_name='Program counter (PC)')),
+                ('memory', models.BinaryField(default=b'')),
+                ('output_cursor', models.BigIntegerField(default=0, verbose_name='Values printed so far')),
+                ('steps', models.BigIntegerField(default=0, verbose_name='Instructions executed so far')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('computer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='computer.Computer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 11:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0009_executionsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='executionjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='executionjob',
+            name='owner',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Process running the job'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-18 11:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('computer', '0010_executionjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='executionsnapshot',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Last time the execution was suspended'),
+        ),
+    ]
@@ -3,15 +3,31 @@
 
 from __future__ import print_function, unicode_literals
 
+import json
+import numbers
+import struct
+from datetime import timedelta
+
 from jsonfield import JSONField
 
-from django.db import models
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, models, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
 
-from computer.enums import ComputerInstruction
-from computer.utils import ComputerException, generate_computer_id
+from computer.cache import execution_cache, program_cache
+from computer.core import MAX_ADDRESS, MAX_ARG, MIN_ARG, ComputerCore
+from computer.engine import ExecutionState
+from computer.enums import ComputerEngine, ComputerInstruction, ComputerOpcode
+from computer.exceptions import (
+    ComputerException, ComputerExecutionLimitExceeded, ComputerInfiniteLoop, ComputerSnapshotConflict,
+    ComputerSnapshotExpired)
+from computer.images import find_image, publish_image
+from computer.utils import generate_computer_id, generate_job_id, generate_snapshot_id
 
 
-class Computer(models.Model):
+class Computer(ComputerCore, models.Model):
     """
     Model that implements a 'Computer Simulator'.
 
@@ -22,19 +38,188 @@ class Computer(models.Model):
     - CALL(addr): Sets the program counter (PC) to the given addr
     - RET: Pops address from stack and set PC to address
     - STOP: Exits the program
+
+    Programs are executed by `ComputerCore`, which imports no Django code; the model only persists them (and
+    whatever is derived from them, so it's reused across requests and workers).
+
+    Instructions are stored as one `Instruction` per address; they are only loaded when `program_stack` is accessed,
+    and only the addresses changed since the last save are written back. Every save that changes them bumps `version`,
+    so loaded (and compiled) programs can be reused across requests for as long as it stays the same.
+
+    Executions that run past the last instruction keep their state as of that point as a `checkpoint`, and every save
+    lowers `dirty_from` to the lowest address it changed, so the next execution resumes from the checkpoint as long as
+    the program only changed from there on (i.e. it was only appended to).
     """
+    MAX_ADDRESS = MAX_ADDRESS
+
     id = models.CharField(primary_key=True, default=generate_computer_id, max_length=7, editable=False)
-    program_counter = models.PositiveSmallIntegerField('Program counter (PC)', default=0)
-    program_stack = JSONField('Data of the program stack', default={})
-    program_stack_size = models.PositiveSmallIntegerField()
-    program_stack_pointer = models.PositiveSmallIntegerField(default=0)
+    program_counter = models.PositiveIntegerField('Program counter (PC)', default=0)
+    program_stack_size = models.PositiveIntegerField()
+    program_stack_pointer = models.PositiveIntegerField(default=0)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    checkpoint = JSONField(null=True, default=None, editable=False)
+    dirty_from = models.PositiveIntegerField(null=True, default=None, editable=False)
 
     def __init__(self, *args, **kwargs):
         """
-        Small helper method to make sure addresses in the program stack are ints.
+        Small helper method to set up the lazily loaded program stack.
         """
         super(Computer, self).__init__(*args, **kwargs)
-        self.program_stack = {int(addr): inst for addr, inst in self.program_stack.items()}
+        self._program_stack = None
+        self._program_entry = None
+        self._pending_instructions = {}
+
+    @property
+    def program_stack(self):
+        """
+        Dict of address -> (instruction, instruction_arg), loaded the first time it's needed, either from the cache of
+        programs or with a single query.
+
+        :return: dict
+        """
+        if self._program_stack is None:
+            if self._state.adding:
+                self._program_stack = {}
+            else:
+                entry = program_cache.get(self.pk, self.version)
+                if entry is None:
+                    entry = program_cache.set(self.pk, self.version, {
+                        addr: (ComputerOpcode.get_instruction(opcode), arg)
+                        for addr, opcode, arg in self.instructions.values_list('addr', 'opcode', 'arg')
+                    })
+                self._load_program_stack(entry)
+            self._program_stack.update(self._pending_instructions)
+        return self._program_stack
+
+    def _load_program_stack(self, entry):
+        """
+        Sets up the program stack from a `ProgramCacheEntry`, copying it since entries are shared.
+        """
+        self._program_stack = dict(entry.program_stack)
+        self._program_entry = entry
+        compiled_program = entry.compiled_program
+        if (compiled_program is not None and compiled_program.size == self.program_stack_size and
+                not self._pending_instructions):
+            self._compiled_program = compiled_program
+
+    @classmethod
+    def load_programs(cls, computers):
+        """
+        Loads the program stacks of many `Computer`s at once, with a single query for the ones that are not cached.
+
+        :param computers: Iterable of `Computer`s whose program stacks are not loaded yet
+        :return: None
+        """
+        computers = {computer.pk: computer for computer in computers}
+        entries = {pk: program_cache.get(pk, computer.version) for pk, computer in computers.items()}
+        program_stacks = {pk: {} for pk, entry in entries.items() if entry is None}
+        if program_stacks:
+            instructions = Instruction.objects.filter(computer__in=list(program_stacks)).values_list(
+                'computer_id', 'addr', 'opcode', 'arg')
+            for computer_id, addr, opcode, arg in instructions:
+                program_stacks[computer_id][addr] = (ComputerOpcode.get_instruction(opcode), arg)
+            for pk, program_stack in program_stacks.items():
+                entries[pk] = program_cache.set(pk, computers[pk].version, program_stack)
+        for pk, computer in computers.items():
+            computer._load_program_stack(entries[pk])
+            computer._program_stack.update(computer._pending_instructions)
+
+    @property
+    def pending_instructions(self):
+        """
+        Dict of address -> (instruction, instruction_arg) of the instructions inserted since the last save.
+
+        :return: dict
+        """
+        return dict(self._pending_instructions)
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the `Computer` along with the instructions inserted since the last save, bumping its version and
+        extending its dirty range if there are any.
+
+        The program as saved is cached for its new version (from the program cached for the previous one, along with
+        the inserted instructions), so it doesn't need to be loaded back.
+        """
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # The checkpoint and the dirty range are only written along with each other (see `_save_checkpoint`), or
+            # through expressions, so stale copies of them never overwrite newer ones
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('checkpoint', 'dirty_from')
+            ]
+        adding = self._state.adding
+        changes = self._pending_instructions
+        if changes and not adding:
+            self._save_changes(kwargs['update_fields'])
+            return
+        if changes:
+            # Within a transaction already (i.e. the one of a request), failing rolls back the whole of it anyway
+            with transaction.atomic(savepoint=False):
+                super(Computer, self).save(*args, **kwargs)
+                self._save_instructions()
+        else:
+            super(Computer, self).save(*args, **kwargs)
+        if adding:
+            self._program_entry = program_cache.set(self.pk, self.version, dict(changes))
+
+    def _save_changes(self, update_fields):
+        """
+        Saves `update_fields` along with the pending instructions, as of the version they were inserted at, so the new
+        version is known without reading it back. If someone else changed the program in the meantime, the changes are
+        saved on top of theirs and the new version is read back instead.
+        """
+        changes = self._pending_instructions
+        previous_version = self.version
+        lowest_address = Value(min(changes), output_field=models.PositiveIntegerField())
+        values = {
+            field.attname: getattr(self, field.attname)
+            for field in map(self._meta.get_field, update_fields) if field.name not in ('version', 'dirty_from')}
+        values['dirty_from'] = Least(Coalesce(F('dirty_from'), lowest_address), lowest_address)
+        computers = Computer.objects.filter(pk=self.pk)
+        with transaction.atomic(savepoint=False):
+            updated = computers.filter(version=previous_version).update(version=previous_version + 1, **values)
+            if not updated and not computers.update(version=F('version') + 1, **values):
+                raise DatabaseError('Save with update_fields did not affect any rows.')
+            self._save_instructions()
+        if not updated:
+            self.refresh_from_db(fields=['version', 'checkpoint', 'dirty_from'])
+            # Whatever is loaded might be missing changes saved by others in the meantime, so it's not cached
+            self._program_entry = None
+            return
+        self.version = previous_version + 1
+        self.dirty_from = min(changes) if self.dirty_from is None else min(self.dirty_from, min(changes))
+        entry = self._program_entry
+        if entry is None or entry.version != previous_version:
+            entry = program_cache.get(self.pk, previous_version)
+        if entry is not None:
+            # Entries are shared, so the new one is a copy of the previous one
+            program_stack = dict(entry.program_stack)
+            program_stack.update(changes)
+        elif self._program_stack is not None:
+            program_stack = dict(self._program_stack)
+        else:
+            self._program_entry = None
+            return
+        self._program_entry = program_cache.set(self.pk, self.version, program_stack)
+
+    def _save_instructions(self):
+        """
+        Writes the pending instructions: a single one is upserted, while several ones are replaced in bulk.
+        """
+        if not self._pending_instructions:
+            return
+        if len(self._pending_instructions) == 1:
+            (addr, (instruction, instruction_arg)), = self._pending_instructions.items()
+            Instruction.upsert(self, addr, instruction, instruction_arg)
+        else:
+            self.instructions.filter(addr__in=list(self._pending_instructions)).delete()
+            Instruction.objects.bulk_create([
+                Instruction(
+                    computer=self, addr=addr, opcode=ComputerOpcode.get_value(instruction), arg=instruction_arg)
+                for addr, (instruction, instruction_arg) in sorted(self._pending_instructions.items())
+            ])
+        self._pending_instructions = {}
 
     def set_address(self, address_index, save=False):
         """
@@ -45,8 +230,9 @@ class Computer(models.Model):
         """
         if address_index <= self.program_stack_size:
             self.program_stack_pointer = address_index
+            self._invalidate()
             if save:
-                self.save()
+                self.save(update_fields=None if self._state.adding else ['program_stack_pointer'])
             return self
         raise ComputerException(
             "You cannot set the address of Computer to {} since it only supports {} address(es)".format(
@@ -62,71 +248,499 @@ class Computer(models.Model):
         """
         instruction = ComputerInstruction.get_value(possible_instruction)
         if instruction:
-            self.program_stack[int(self.program_stack_pointer)] = (instruction, instruction_arg)
+            addr = int(self.program_stack_pointer)
+            self._pending_instructions[addr] = (instruction, instruction_arg)
+            self.dirty_from = addr if self.dirty_from is None else min(self.dirty_from, addr)
+            if self._program_stack is not None:
+                self._program_stack[addr] = (instruction, instruction_arg)
             self.program_stack_pointer += 1
+            self._invalidate()
             if save:
-                self.save()
+                self.save(update_fields=None if self._state.adding else ['program_stack_pointer'])
         return self
 
-    def execute(self):
+    def load_program(self, program, save=False):
         """
-        Executes the stored set of instructions (inside the program stack) starting by the address hold by the program
-        counter. It uses local memory to store temporary data that might result from instructions.
+        Inserts every instruction of `program` at its own address, saving the `Computer` only once at the end.
 
-        :return: None
+        :param program: Iterable of (address, possible_instruction, instruction_arg)
+        :return: Computer
         """
-        program_output_data = []
-        memory = []
-        initial_program_counter = self.program_counter
+        for address_index, possible_instruction, instruction_arg in program:
+            self.set_address(address_index).insert(possible_instruction, instruction_arg=instruction_arg)
+        if save:
+            self.save()
+        return self
 
-        while self.program_counter <= self.program_stack_size:
-            instruction, instruction_arg = self.program_stack.get(self.program_counter, (None, None))
-            # Making sure args are ints
-            if instruction_arg:
-                instruction_arg = int(instruction_arg)
+    def compile(self):
+        """
+        Returns the compiled version of the program stack, compiling it only if it changed since the last call, and
+        sharing it through the cache of programs.
 
-            if instruction == ComputerInstruction.PUSH:
-                memory.append(instruction_arg)
+        :return: CompiledProgram, or None if the program can only be run by the reference engine
+        """
+        # Loading the program stack from the cache of programs may bring its compiled version along
+        self.program_stack
+        if self._compiled_program is None:
+            super(Computer, self).compile()
+            if self._program_entry is not None and not self._pending_instructions:
+                self._program_entry.compiled_program = self._compiled_program
+        return self._compiled_program
+
+    def optimize(self):
+        """
+        Returns the optimized version of the compiled program for the current program counter, optimizing it only if
+        either of them changed since the last call, and sharing it through the cache of programs, so the calls its
+        subroutines memoized carry over to every later execution of the same version.
+
+        :return: CompiledProgram, or None if the program can only be run by the reference engine
+        """
+        self.program_stack
+        entry = self._program_entry if not self._pending_instructions else None
+        if self._optimized_program is None and entry is not None and entry.optimized_program is not None:
+            program_counter, program_stack_size, optimized_program = entry.optimized_program
+            if program_stack_size == self.program_stack_size:
+                self._optimized_program = (program_counter, optimized_program)
+        optimized_program = super(Computer, self).optimize()
+        if entry is not None:
+            entry.optimized_program = (self.program_counter, self.program_stack_size, optimized_program)
+        return optimized_program
+
+    def _is_saved(self):
+        """
+        Whether the program stack is the one saved for the current version (i.e. nothing was inserted since then).
+        """
+        return not self._state.adding and not self._pending_instructions and (
+            self._program_stack is None or self._program_entry is not None)
+
+    def image(self):
+        """
+        Returns the image of the program stack shared by every worker, publishing it if no one did yet.
+
+        Images of programs as saved are also found by the ID and version of the `Computer`, so its program stack
+        doesn't even need to be loaded to execute them.
+
+        :return: ProgramImage, or None if the program can only be run by the other engines
+        """
+        if (self._image is None or self._image.closed) and self._is_saved():
+            self._image = find_image(self.pk, self.version, self.program_stack_size)
+        return super(Computer, self).image()
+
+    def _open_image(self, data):
+        saved = self._is_saved()
+        return publish_image(data, computer_id=self.pk if saved else None, version=self.version if saved else None)
+
+    def _resume_state(self, max_steps=None):
+        """
+        Returns the `ExecutionState` to execute the program from: its checkpoint, as long as the program didn't change
+        before the address it was taken at and it's within `max_steps`, or its very beginning otherwise.
+
+        :param max_steps: Optional budget of instructions of the execution
+        :return: ExecutionState
+        """
+        checkpoint = self.checkpoint
+        if (checkpoint is not None and checkpoint['program_counter'] == self.program_counter and
+                checkpoint['program_stack_size'] == self.program_stack_size and
+                (max_steps is None or checkpoint['steps'] <= max_steps) and
+                (self.dirty_from is None or self.dirty_from >= checkpoint['tail'])):
+            return ExecutionState(
+                checkpoint['tail'], memory=list(checkpoint['memory']), output=list(checkpoint['output']),
+                steps=checkpoint['steps'])
+        return ExecutionState(self.program_counter)
 
-            elif instruction == ComputerInstruction.PRINT:
-                value_to_print = memory.pop()
-                program_output_data.append(value_to_print)
+    def _save_checkpoint(self, state):
+        """
+        Keeps the state of an execution that ran past the last instruction as the checkpoint to resume from, as of the
+        address it entered the empty region at the end of the program stack at (everything it did before that can't
+        depend on what is appended from there on).
 
-            elif instruction == ComputerInstruction.CALL:
-                self.program_counter = instruction_arg
+        Checkpoints of saved programs are saved too, unless the program changed in the meantime.
 
-            elif instruction == ComputerInstruction.MULT:
-                operand1 = memory.pop()
-                operand2 = memory.pop()
-                if operand1 and operand2:
-                    memory.append(operand1 * operand2)
+        :param state: The `ExecutionState` the execution finished with
+        :return: None
+        """
+        if state.tail is None or not state.halted or state.program_counter <= self.program_stack_size:
+            return
+        if len(state.memory) + len(state.output) > settings.COMPUTER_CHECKPOINT_MAX_VALUES:
+            return
+        checkpoint = {
+            'program_counter': self.program_counter,
+            'program_stack_size': self.program_stack_size,
+            'tail': state.tail,
+            # Every address from the tail on was walked over one step at a time
+            'steps': state.steps - (state.program_counter - state.tail),
+            'memory': list(state.memory),
+            'output': list(state.output),
+        }
+        if checkpoint == self.checkpoint and self.dirty_from is None:
+            return
+        if not self._state.adding and not self._pending_instructions:
+            updated = Computer.objects.filter(pk=self.pk, version=self.version).update(
+                checkpoint=checkpoint, dirty_from=None)
+            if not updated:
+                return
+        self.checkpoint, self.dirty_from = checkpoint, None
 
-            elif instruction == ComputerInstruction.RET:
-                value_to_ret_to = memory.pop()
-                if value_to_ret_to:
-                    self.program_counter = value_to_ret_to
+    def execute(
+            self, engine=ComputerEngine.COMPILED, use_cache=False, max_steps=None, timeout=None, progress=None,
+            profile=None, state=None):
+        """
+        Executes the program (see `ComputerCore.execute`), resuming it from its checkpoint if it can.
 
-            elif instruction == ComputerInstruction.STOP:
-                break
+        :param engine: The `ComputerEngine` to use; all of them produce the same output
+        :param use_cache: Whether to reuse (and store) the output of executing the very same program before, as long
+            as it took no more than `max_steps`; profiled and resumed executions skip the cache
+        :param max_steps: Optional budget of instructions to execute
+        :param timeout: Optional budget of seconds to execute for
+        :param progress: Optional callable that receives the `ExecutionState` after every slice of instructions
+        :param profile: Optional `ExecutionProfile` to record the execution into
+        :param state: Optional `ExecutionState` to resume from, updated along the way
+        :return: list
+        """
+        if use_cache and profile is None and state is None:
+            program_output = execution_cache.get(self.execution_key, max_steps=max_steps)
+            if program_output is None:
+                state = self._execute(engine=engine, max_steps=max_steps, timeout=timeout, progress=progress)
+                program_output = state.output
+                execution_cache.set(self.execution_key, program_output, state.steps)
+            return program_output
+        return super(Computer, self).execute(
+            engine=engine, max_steps=max_steps, timeout=timeout, progress=progress, profile=profile, state=state)
 
-            # Moving forward with our program execution
-            if instruction not in (ComputerInstruction.RET, ComputerInstruction.CALL):
-                self.program_counter += 1
+    def execute_suspendable(self, snapshot=None, engine=ComputerEngine.COMPILED, max_steps=None, timeout=None):
+        """
+        Executes the program from the beginning, or continues the execution suspended into `snapshot`, suspending it
+        into an `ExecutionSnapshot` once it runs out of its budget instead of failing, so any worker can continue it
+        later on.
 
-        self.program_counter = initial_program_counter
-        return program_output_data
+        :param snapshot: Optional `ExecutionSnapshot` to continue the execution from
+        :param engine: The `ComputerEngine` to use; the reference one can't be suspended, so the compiled one is used
+        :param max_steps: Optional budget of instructions to execute before suspending
+        :param timeout: Optional budget of seconds to execute for before suspending
+        :return: tuple of (values printed by this call, `ExecutionSnapshot` to continue from, or None if it finished)
+        :raises ComputerSnapshotExpired: If `snapshot` expired, in which case it's deleted
+        """
+        if snapshot is None:
+            state = ExecutionState(self.program_counter)
+        elif snapshot.is_expired():
+            snapshot.delete()
+            raise ComputerSnapshotExpired('The execution expired, since it was not continued for too long')
+        elif snapshot.version != self.version or self._pending_instructions:
+            raise ComputerSnapshotConflict('The program changed since its execution was suspended')
+        else:
+            state = snapshot.restore()
+        previous_steps = state.steps
+        try:
+            self.execute(
+                engine=engine, max_steps=None if max_steps is None else previous_steps + max_steps, timeout=timeout,
+                state=state)
+        except ComputerExecutionLimitExceeded as e:
+            # Programs that never finish are not worth continuing
+            if isinstance(e, ComputerInfiniteLoop) or not ExecutionSnapshot.can_capture(state):
+                if snapshot is not None:
+                    snapshot.finish(previous_steps)
+                raise e
+            if snapshot is None:
+                # Executions of this computer that were abandoned are dropped along the way
+                ExecutionSnapshot.expired().filter(computer=self).delete()
+                snapshot = ExecutionSnapshot(computer=self, version=self.version)
+                snapshot.capture(state)
+                snapshot.save()
+            else:
+                snapshot.capture(state)
+                snapshot.save_continued(previous_steps)
+            return state.output, snapshot
+        except Exception as e:
+            # Failed executions can't be continued either
+            if snapshot is not None:
+                snapshot.finish(previous_steps)
+            raise e
+        if snapshot is not None:
+            snapshot.finish(previous_steps)
+        return state.output, None
 
-    def debug(self):
+    def debug(self, optimized=False):
         """
         Returns data about the internals of the current `Computer`.
 
+        Both listings of the program are rendered once per version of the program (and program counter, for the
+        optimized one) and shared through the cache of programs, so debugging an unchanged `Computer` doesn't go
+        through the whole program stack again.
+
+        :param optimized: Whether to include the program as rewritten by the optimizer
         :return: str
         """
-        program_stack_data = {addr: inst for addr, inst in self.program_stack.items() if inst[0] is not None}
-        program_stack_data = sorted(program_stack_data.items(), key=lambda x: x[0])
-        return {
+        program_stack = self.program_stack
+        # Only what was loaded and not changed since then can be shared
+        entry = self._program_entry if not self._pending_instructions else None
+        program_stack_data = entry.program_stack_data if entry is not None else None
+        if program_stack_data is None:
+            program_stack_data = {addr: inst for addr, inst in program_stack.items() if inst[0] is not None}
+            program_stack_data = sorted(program_stack_data.items(), key=lambda x: x[0])
+            if entry is not None:
+                entry.program_stack_data = program_stack_data
+        debug_data = {
             'program_counter': '{}'.format(self.program_counter),
             'program_stack': program_stack_data,
             'program_stack_size': '{}'.format(self.program_stack_size),
             'program_stack_pointer': '{}'.format(self.program_stack_pointer),
         }
+        if optimized:
+            optimized_program_stack_data = entry.optimized_program_stack_data if entry is not None else None
+            if optimized_program_stack_data is None or optimized_program_stack_data[0] != self.program_counter:
+                optimized_program_stack_data = (self.program_counter, self._optimized_program_stack())
+                if entry is not None:
+                    entry.optimized_program_stack_data = optimized_program_stack_data
+            if optimized_program_stack_data[1] is not None:
+                debug_data['optimized_program_stack'] = optimized_program_stack_data[1]
+        return debug_data
+
+    def _optimized_program_stack(self):
+        """
+        Returns the program as rewritten by the optimizer, as a list of (address, instruction), or None if it can't be
+        optimized.
+        """
+        optimized_program = self.optimize()
+        if optimized_program is None:
+            return None
+        optimized_program_stack = []
+        for addr in optimized_program.addresses:
+            opcode, arg = optimized_program.opcodes[addr], optimized_program.args[addr]
+            if opcode == ComputerOpcode.FUSED:
+                optimized_program_stack.append((addr, ('fused', arg.describe())))
+            elif opcode == ComputerOpcode.MEMO:
+                optimized_program_stack.append((addr, ('memoized', arg.describe())))
+            elif opcode != ComputerOpcode.FAULT:
+                optimized_program_stack.append((addr, (ComputerOpcode.get_instruction(opcode), arg)))
+        return optimized_program_stack
+
+    def etag(self, optimized=False):
+        """
+        Returns the entity tag of the debug data of the `Computer` as saved, which only depends on its row (the program
+        only changes along with its version), so it can be told without loading the program.
+
+        :param optimized: Whether the debug data includes the program as rewritten by the optimizer
+        :return: str
+        """
+        return '{}-{}-{}-{}-{}{}'.format(
+            self.pk, self.version, self.program_counter, self.program_stack_pointer, self.program_stack_size,
+            '-optimized' if optimized else '')
+
+
+class Instruction(models.Model):
+    """
+    Model that stores the instruction held by a single address of the program stack of a `Computer`.
+    """
+    MIN_ARG = MIN_ARG
+    MAX_ARG = MAX_ARG
+
+    computer = models.ForeignKey(Computer, related_name='instructions', on_delete=models.CASCADE)
+    addr = models.PositiveIntegerField('Address in the program stack')
+    opcode = models.PositiveSmallIntegerField(choices=ComputerOpcode.CHOICES)
+    arg = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('addr',)
+        unique_together = ('computer', 'addr')
+
+    @classmethod
+    def _supports_upsert(cls, connection):
+        """
+        Whether `connection` can upsert with `INSERT ... ON CONFLICT DO UPDATE` (PostgreSQL 9.5+ and SQLite 3.24+).
+        """
+        if connection.vendor == 'postgresql':
+            return connection.pg_version >= 90500
+        if connection.vendor == 'sqlite':
+            return connection.Database.sqlite_version_info >= (3, 24, 0)
+        return False
+
+    @classmethod
+    def upsert(cls, computer, addr, instruction, instruction_arg):
+        """
+        Writes `instruction` into `addr`, touching only that row, with a single query where the database supports it.
+        Otherwise, it's inserted first, and only updated if it was already there.
+
+        :return: None
+        """
+        values = {'opcode': ComputerOpcode.get_value(instruction), 'arg': instruction_arg}
+        connection = connections[router.db_for_write(cls)]
+        if cls._supports_upsert(connection):
+            quote_name = connection.ops.quote_name
+            columns = [cls._meta.get_field(name).column for name in ('computer', 'addr', 'opcode', 'arg')]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s) ON CONFLICT ({computer}, {addr}) '
+                    'DO UPDATE SET {opcode} = EXCLUDED.{opcode}, {arg} = EXCLUDED.{arg}'.format(
+                        table=quote_name(cls._meta.db_table), columns=', '.join(quote_name(c) for c in columns),
+                        computer=quote_name(columns[0]), addr=quote_name(columns[1]),
+                        opcode=quote_name(columns[2]), arg=quote_name(columns[3])),
+                    [computer.pk, addr, values['opcode'], values['arg']])
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(computer=computer, addr=addr, **values)
+        except IntegrityError:
+            cls.objects.filter(computer=computer, addr=addr).update(**values)
+
+
+class ExecutionJob(models.Model):
+    """
+    Model that tracks the asynchronous execution of the program of a `Computer`.
+
+    Jobs run in a pool of the process they were submitted to (their `owner`), which keeps them alive through
+    `heartbeat_at` for as long as they are pending or running, so the ones left behind by a process that stopped (i.e.
+    a restarted worker) can be told apart and failed (see `computer.jobs.fail_stale_jobs`).
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FINISHED, 'Finished'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.CharField(primary_key=True, default=generate_job_id, max_length=16, editable=False)
+    computer = models.ForeignKey(Computer, related_name='jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    program_output = JSONField('Output printed so far', default=[])
+    steps = models.PositiveIntegerField('Instructions executed so far', default=0)
+    error = models.TextField(blank=True)
+    owner = models.CharField('Process running the job', max_length=64, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    ACTIVE_STATUSES = (PENDING, RUNNING)
+
+
+class ExecutionSnapshot(models.Model):
+    """
+    Model that stores a suspended execution of the program of a `Computer`, so it can be continued by any worker: its
+    program counter, its memory packed as an array of 64-bit ints (or as JSON, if it holds anything else) and how many
+    values it printed so far, since they are handed out as they are printed.
+
+    Snapshots that aren't continued within `settings.COMPUTER_SNAPSHOT_TTL` seconds of being suspended expire: they
+    can't be continued anymore, and are deleted by `prune_snapshots` (or along with the next one of their `Computer`).
+    """
+    MIN_PROGRAM_COUNTER = -2 ** 63
+    MAX_PROGRAM_COUNTER = 2 ** 63 - 1
+
+    PACKED_INTS = b'q'
+    PACKED_JSON = b'j'
+
+    id = models.CharField(primary_key=True, default=generate_snapshot_id, max_length=16, editable=False)
+    computer = models.ForeignKey(Computer, related_name='snapshots', on_delete=models.CASCADE)
+    version = models.PositiveIntegerField('Version of the program being executed')
+    program_counter = models.BigIntegerField('Program counter (PC)', default=0)
+    memory = models.BinaryField(default=b'')
+    output_cursor = models.BigIntegerField('Values printed so far', default=0)
+    steps = models.BigIntegerField('Instructions executed so far', default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField('Last time the execution was suspended', auto_now=True, db_index=True)
+
+    @staticmethod
+    def _expired_before():
+        return timezone.now() - timedelta(seconds=settings.COMPUTER_SNAPSHOT_TTL)
+
+    @classmethod
+    def expired(cls):
+        """
+        Returns the snapshots that expired.
+
+        :return: QuerySet
+        """
+        return cls.objects.filter(updated_at__lt=cls._expired_before())
+
+    def is_expired(self):
+        """
+        Whether the snapshot expired, since it was suspended more than `settings.COMPUTER_SNAPSHOT_TTL` seconds ago.
+
+        :return: bool
+        """
+        return self.updated_at < self._expired_before()
+
+    @classmethod
+    def pack_memory(cls, memory):
+        """
+        Packs `memory` as an array of little-endian 64-bit ints, unless it holds anything else.
+
+        :param memory: List of values
+        :return: bytes
+        """
+        if all(isinstance(value, numbers.Integral) and Instruction.MIN_ARG <= value <= Instruction.MAX_ARG
+               for value in memory):
+            return cls.PACKED_INTS + struct.pack(str('<{}q'.format(len(memory))), *memory)
+        return cls.PACKED_JSON + json.dumps(memory, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def unpack_memory(cls, data):
+        """
+        Unpacks memory packed by `pack_memory`.
+
+        :param data: bytes
+        :return: list
+        """
+        data = bytes(data)
+        if not data:
+            return []
+        if data[:1] == cls.PACKED_INTS:
+            return list(struct.unpack(str('<{}q'.format((len(data) - 1) // 8)), data[1:]))
+        return json.loads(data[1:].decode('utf-8'))
+
+    @classmethod
+    def can_capture(cls, state):
+        """
+        Whether `state` fits into a snapshot: it only doesn't after a RET to an address way out of bounds.
+
+        :param state: The `ExecutionState` to capture
+        :return: bool
+        """
+        return cls.MIN_PROGRAM_COUNTER <= state.program_counter <= cls.MAX_PROGRAM_COUNTER
+
+    def capture(self, state):
+        """
+        Updates the snapshot with `state`, whose output holds the values printed since the snapshot was restored.
+
+        :param state: The `ExecutionState` to capture
+        :return: None
+        """
+        self.program_counter = state.program_counter
+        self.memory = self.pack_memory(state.memory)
+        self.output_cursor += len(state.output)
+        self.steps = state.steps
+
+    def restore(self):
+        """
+        Returns the `ExecutionState` to continue the execution from, without the values printed so far.
+
+        :return: ExecutionState
+        """
+        return ExecutionState(self.program_counter, memory=self.unpack_memory(self.memory), steps=self.steps)
+
+    def save_continued(self, previous_steps):
+        """
+        Saves the snapshot after continuing its execution from `previous_steps`, unless someone else continued it in
+        the meantime.
+
+        :param previous_steps: The steps the snapshot had when it was restored
+        :return: None
+        """
+        updated = ExecutionSnapshot.objects.filter(pk=self.pk, steps=previous_steps).update(
+            program_counter=self.program_counter, memory=self.memory, output_cursor=self.output_cursor,
+            steps=self.steps, updated_at=timezone.now())
+        if not updated:
+            raise ComputerSnapshotConflict('The execution was continued by someone else in the meantime')
+
+    def finish(self, previous_steps):
+        """
+        Deletes the snapshot once its execution is over, unless someone else continued it in the meantime.
+
+        :param previous_steps: The steps the snapshot had when it was restored
+        :return: None
+        """
+        deleted, _ = ExecutionSnapshot.objects.filter(pk=self.pk, steps=previous_steps).delete()
+        if not deleted:
+            raise ComputerSnapshotConflict('The execution was continued by someone else in the meantime')
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import print_function, unicode_literals
+
+import threading
+
+from computer.engine import CompiledProgram
+from computer.enums import ComputerOpcode
+
+# Longest run of instructions fused into a single superinstruction
+MAX_TRACE_STEPS = 128
+
+# Largest set of possible RET targets worth tracking; past it every address is assumed to be one
+MAX_RET_TARGETS = 4096
+
+# Least operations a subroutine must run for a lookup to be cheaper than running them
+MIN_MEMOIZED_OPERATIONS = 8
+
+# Number of calls remembered per memoized subroutine
+MAX_MEMOIZED_CALLS = 1024
+
+_STRAIGHT_LINE = (ComputerOpcode.PUSH, ComputerOpcode.PRINT, ComputerOpcode.MULT)
+
+
+class Superinstruction(object):
+    """
+    The effect of running a straight line of instructions (following static CALLs) from the address it replaces.
+
+    `operations` is a list of (opcode, values): `PUSH` pushes all of `values`, `PRINT` prints all of `values` (or pops
+    and prints a single value when `values` is None) and `MULT` multiplies the 2 values on top of the memory (or the
+    value on top of the memory by the single one in `values`). Once they're done, the execution goes on at `next_pc`,
+    `steps` instructions later.
+    """
+    __slots__ = ('operations', 'next_pc', 'steps')
+
+    def __init__(self, operations, next_pc, steps):
+        self.operations = operations
+        self.next_pc = next_pc
+        self.steps = steps
+
+    def describe(self):
+        """
+        Returns a readable version of the superinstruction.
+
+        :return: dict
+        """
+        operations = []
+        for opcode, values in self.operations:
+            instruction = ComputerOpcode.get_instruction(opcode)
+            operations.append([instruction] if values is None else [instruction, list(values)])
+        return {'operations': operations, 'next': self.next_pc, 'steps': self.steps}
+
+
+class Subroutine(Superinstruction):
+    """
+    A straight line of instructions from a CALL target up to the RET it ends with (included in its `steps`), whose
+    whole effect only depends on the `inputs` values on top of the memory when it's called (as long as all of its MULTs
+    push their product), and maybe on the one right below them, which it may return to.
+
+    That effect (the values to replace them with, the values printed and the address returned to) is memoized by those
+    values in a bounded LRU, so calling it again with the same ones skips its body, even from another caller. The LRU
+    is approximated with two generations of plain dicts, so that hits cost a single lookup: once the recent one holds
+    half of `MAX_MEMOIZED_CALLS` calls it becomes the old one, whose calls are forgotten unless they're made again.
+    """
+    __slots__ = ('inputs', 'recent_calls', 'old_calls', 'lock')
+
+    def __init__(self, operations, next_pc, steps):
+        super(Subroutine, self).__init__(operations, next_pc, steps)
+        # The deepest the operations read into the memory
+        depth = lowest = 0
+        for opcode, values in operations:
+            if opcode == ComputerOpcode.PUSH:
+                depth += len(values)
+            elif opcode == ComputerOpcode.MULT:
+                depth -= 2 if values is None else 1
+                lowest = min(lowest, depth)
+                depth += 1
+            elif values is None:
+                depth -= 1
+                lowest = min(lowest, depth)
+        self.inputs = -lowest
+        self.recent_calls = {}
+        self.old_calls = {}
+        self.lock = threading.Lock()
+
+    def describe(self):
+        description = super(Subroutine, self).describe()
+        description['inputs'] = self.inputs
+        return description
+
+    def call(self, values):
+        """
+        Returns the effect of calling the subroutine with `values` on top of the memory, running it only if it wasn't
+        called with them lately.
+
+        :param values: The `inputs` values on top of the memory
+        :return: tuple of (values to replace them with, printed values, address to return to), or None if that can't
+            be told from `values` alone (a MULT doesn't push its product) or it doesn't return (it RETs to a falsy
+            address); the address is None if it's the value right below `values`
+        """
+        key = tuple(values)
+        try:
+            return self.recent_calls[key]
+        except KeyError:
+            pass
+        effect = self.old_calls.get(key, self)
+        if effect is self:
+            effect = self._run(list(values))
+        with self.lock:
+            if len(self.recent_calls) >= MAX_MEMOIZED_CALLS // 2:
+                self.old_calls = self.recent_calls
+                self.recent_calls = {}
+            self.recent_calls[key] = effect
+        return effect
+
+    def _run(self, memory):
+        push = memory.append
+        pop = memory.pop
+        printed = []
+        for opcode, values in self.operations:
+            if opcode == ComputerOpcode.PUSH:
+                memory.extend(values)
+            elif opcode == ComputerOpcode.MULT:
+                operand1 = pop() if values is None else values[0]
+                operand2 = pop()
+                if not (operand1 and operand2):
+                    return None
+                push(operand1 * operand2)
+            elif values is None:
+                printed.append(pop())
+            else:
+                printed.extend(values)
+        if not memory:
+            return (), tuple(printed), None
+        value_to_ret_to = pop()
+        if not value_to_ret_to:
+            return None
+        return tuple(memory), tuple(printed), value_to_ret_to
+
+
+def _possible_ret_targets(program):
+    """
+    Returns every address a RET may jump to, or None if there are too many of them to tell. Programs without RETs
+    have none.
+
+    Values in memory are either PUSH constants or products of them, so the only targets are the ones in the closure of
+    the constants under multiplication. Products leaving the address space never come back into it, since the only
+    way to shrink a product is a falsy operand, which MULT doesn't push. Negative targets just walk up to 0.
+    """
+    if ComputerOpcode.RET not in program.opcodes.values():
+        return set()
+    size = program.size
+    values = set()
+    negative = False
+    for address, opcode in program.opcodes.items():
+        arg = program.args[address]
+        if opcode == ComputerOpcode.PUSH and arg:
+            negative = negative or arg < 0
+            if abs(arg) <= size:
+                values.add(arg)
+    pending = list(values)
+    while pending:
+        value = pending.pop()
+        for other in list(values):
+            product = value * other
+            if abs(product) <= size and product not in values:
+                if len(values) >= MAX_RET_TARGETS:
+                    return None
+                values.add(product)
+                pending.append(product)
+    targets = {value for value in values if value > 0}
+    if negative:
+        targets.add(0)
+    return targets
+
+
+def _reachable_addresses(program, entry, ret_targets):
+    """
+    Returns every populated address that may be reached when executing from `entry`.
+    """
+    opcodes, args, size = program.opcodes, program.args, program.size
+    if ret_targets is None and ComputerOpcode.RET in opcodes.values():
+        return set(opcodes)
+    reachable = set()
+    pending = [max(entry, 0)]
+    ret_reached = False
+    while pending:
+        address = pending.pop()
+        if address not in opcodes:
+            address = program.next_address(address)
+        if address > size or address in reachable:
+            continue
+        reachable.add(address)
+        opcode = opcodes[address]
+        if opcode in _STRAIGHT_LINE:
+            pending.append(address + 1)
+        elif opcode == ComputerOpcode.CALL:
+            pending.append(args[address])
+        elif opcode == ComputerOpcode.RET and not ret_reached:
+            ret_reached = True
+            pending.extend(ret_targets)
+    return reachable
+
+
+def _flush(operations, opcode, values):
+    """
+    Appends (opcode, values) to `operations`, merging it into the last operation if it does the same.
+    """
+    if operations and operations[-1][0] == opcode and operations[-1][1] is not None:
+        operations[-1] = (opcode, operations[-1][1] + tuple(values))
+    else:
+        operations.append((opcode, tuple(values)))
+
+
+def _build_superinstruction(program, start, subroutines=None, followed=None):
+    """
+    Follows the straight line of instructions from `start`, folding everything that only depends on values pushed
+    along the way, until it reaches a RET, STOP, a fault, an address it already went through, the end of the program
+    or a CALL to one of the memoized `subroutines` whose inputs are not all known (otherwise folding its body beats
+    looking it up). The targets of the CALLs it follows are added to `followed`.
+
+    :return: Superinstruction
+    """
+    opcodes, args, size = program.opcodes, program.args, program.size
+    operations = []
+    constants = []  # Values pushed along the way that are still known at this point
+    visited = set()
+    steps = 0
+    pc = start
+    while pc <= size and steps < MAX_TRACE_STEPS and pc not in visited:
+        opcode = opcodes.get(pc)
+        if opcode is None:
+            empty = program.next_address(pc) - pc
+            if steps + empty > MAX_TRACE_STEPS:
+                break
+            steps += empty
+            pc += empty
+            continue
+        if opcode not in _STRAIGHT_LINE and opcode != ComputerOpcode.CALL:
+            break
+        visited.add(pc)
+        steps += 1
+        if opcode == ComputerOpcode.CALL:
+            pc = args[pc]
+            if subroutines and pc in subroutines and len(constants) < subroutines[pc].inputs:
+                break
+            if followed is not None:
+                followed.append(pc)
+            continue
+        if opcode == ComputerOpcode.PUSH:
+            constants.append(args[pc])
+        elif opcode == ComputerOpcode.PRINT:
+            if constants:
+                _flush(operations, ComputerOpcode.PRINT, [constants.pop()])
+            else:
+                operations.append((ComputerOpcode.PRINT, None))
+        elif opcode == ComputerOpcode.MULT:
+            if len(constants) >= 2:
+                operand1 = constants.pop()
+                operand2 = constants.pop()
+                if operand1 and operand2:
+                    constants.append(operand1 * operand2)
+            elif constants:
+                operations.append((ComputerOpcode.MULT, (constants.pop(),)))
+            else:
+                operations.append((ComputerOpcode.MULT, None))
+        pc += 1
+    if constants:
+        _flush(operations, ComputerOpcode.PUSH, constants)
+    return Superinstruction(operations, pc, steps)
+
+
+def optimize_program(program, entry):
+    """
+    Returns an optimized copy of a `CompiledProgram` to be executed from `entry`.
+
+    - Addresses that can never be reached are dropped (left empty).
+    - CALL targets whose straight line of instructions ends with a RET, after enough operations, are replaced by a
+      memoized `Subroutine`.
+    - Every other address execution can start at (the entry, CALL targets, possible RET targets) is replaced by a
+      `Superinstruction` that runs the whole straight line of instructions starting there at once, with constant MULTs
+      folded, PUSH/PRINT pairs fused, static CALLs (but the ones to subroutines with unknown inputs) inlined and short
+      empty regions skipped.
+
+    Instructions replaced by superinstructions are kept in place, so jumping into the middle of one still works.
+
+    :param program: The `CompiledProgram` to optimize
+    :param entry: The address executions start at
+    :return: CompiledProgram
+    """
+    ret_targets = _possible_ret_targets(program)
+    reachable = _reachable_addresses(program, entry, ret_targets)
+    opcodes = {address: program.opcodes[address] for address in reachable}
+    args = {address: program.args[address] for address in reachable}
+
+    call_targets = {args[address] for address in reachable if opcodes[address] == ComputerOpcode.CALL}
+    lines = {}
+    subroutines = {}
+    for target in call_targets:
+        if not 0 <= target <= program.size:
+            continue
+        followed = []
+        line = _build_superinstruction(program, target, followed=followed)
+        lines[target] = (line, followed)
+        if (program.opcodes.get(line.next_pc) == ComputerOpcode.RET and line.next_pc <= program.size and
+                len(line.operations) >= MIN_MEMOIZED_OPERATIONS):
+            subroutines[target] = Subroutine(line.operations, line.next_pc, line.steps + 1)
+
+    leaders = {entry} | call_targets
+    if ret_targets is not None and ComputerOpcode.RET in opcodes.values():
+        leaders.update(ret_targets)
+    superinstructions = {}
+    pending = list(leaders)
+    while pending:
+        leader = pending.pop()
+        if leader in superinstructions or leader in subroutines or leader > program.size:
+            continue
+        line, followed = lines.get(leader, (None, None))
+        if line is not None and not any(target in subroutines for target in followed):
+            superinstruction = line
+        else:
+            superinstruction = _build_superinstruction(program, leader, subroutines=subroutines)
+        superinstructions[leader] = superinstruction
+        # A long straight line is cut in several superinstructions
+        if superinstruction.steps == MAX_TRACE_STEPS:
+            pending.append(superinstruction.next_pc)
+
+    for address, superinstruction in superinstructions.items():
+        if superinstruction.steps > 1:
+            opcodes[address] = ComputerOpcode.FUSED
+            args[address] = superinstruction
+    for address, subroutine in subroutines.items():
+        opcodes[address] = ComputerOpcode.MEMO
+        args[address] = subroutine
+    return CompiledProgram(opcodes, args, program.size, base=program)
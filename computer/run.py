@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a program straight from a file, without setting Django up, writing every value it prints to the standard output:
+
+    python -m computer.run program.asm      # assembly source (see `computer.assembler`), or - for the standard input
+    python -m computer.run program.img      # image (see `computer.images`), as published by a `Computer`
+
+Only the execution core (`computer.core`) is imported, so it starts several times faster than `manage.py` does (see
+the `cli.cold_start` benchmarks).
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import sys
+
+from computer.assembler import assemble
+from computer.core import MAX_ADDRESS, Program
+from computer.enums import ComputerEngine
+from computer.exceptions import ComputerAssemblyError, ComputerExecutionLimitExceeded
+
+ENGINES = (
+    ComputerEngine.COMPILED, ComputerEngine.OPTIMIZED, ComputerEngine.GENERATED, ComputerEngine.IMAGE,
+    ComputerEngine.REFERENCE)
+
+
+def load_program(path, program_stack_size=None, program_counter=0):
+    """
+    Reads the program stored in `path`: an image if it ends with `.img`, or assembly source otherwise.
+
+    :param path: The path of the program, or - to read assembly source from the standard input
+    :param program_stack_size: Optional size of the program stack of assembled programs; just enough for the program by
+        default
+    :param program_counter: The address to execute the program from
+    :return: Program
+    :raises ComputerAssemblyError: If the source can't be assembled
+    """
+    if path.endswith('.img'):
+        return Program.from_image(path, program_counter=program_counter)
+    size = program_stack_size if program_stack_size is not None else MAX_ADDRESS
+    if path == '-':
+        instructions, _ = assemble(sys.stdin, size=size)
+    else:
+        with io.open(path, 'rb') as source:
+            instructions, _ = assemble(source, size=size)
+    if program_stack_size is None:
+        program_stack_size = max([0] + [address for address, _, _ in instructions])
+    return Program.from_instructions(
+        instructions, program_stack_size=program_stack_size, program_counter=program_counter)
+
+
+def _write_output(output, stream):
+    stream.write(''.join('{}\n'.format(value) for value in output))
+    stream.flush()
+
+
+def main(argv=None, stdout=None, stderr=None):
+    """
+    Runs the program given in `argv`.
+
+    :return: int, the exit status: 0 if the program finished, 1 if it couldn't be read or failed, 2 if it ran out of
+        its budget
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    parser = argparse.ArgumentParser(
+        prog='python -m computer.run', description='Runs a program without setting Django up.')
+    parser.add_argument('program', help='Path of the program: an image (.img), assembly source, or - for the latter '
+                                        'from the standard input.')
+    parser.add_argument(
+        '--engine', choices=ENGINES, default=None,
+        help='Engine to execute the program with; image for images and compiled for assembly source by default.')
+    parser.add_argument('--pc', type=int, default=0, help='Address to execute the program from.')
+    parser.add_argument(
+        '--stack', type=int, default=None,
+        help='Size of the program stack of assembly source; just enough for the program by default.')
+    parser.add_argument('--max-steps', type=int, default=None, help='Budget of instructions to execute.')
+    parser.add_argument('--timeout', type=float, default=None, help='Budget of seconds to execute for.')
+    options = parser.parse_args(argv)
+
+    try:
+        program = load_program(options.program, program_stack_size=options.stack, program_counter=options.pc)
+    except ComputerAssemblyError as e:
+        stderr.write(''.join('{}\n'.format(message) for message in ComputerAssemblyError.messages_of(e.errors)))
+        return 1
+    except (IOError, OSError, ValueError) as e:
+        stderr.write('{}\n'.format(e))
+        return 1
+
+    engine = options.engine or (
+        ComputerEngine.IMAGE if options.program.endswith('.img') else ComputerEngine.COMPILED)
+    try:
+        output = program.execute(engine=engine, max_steps=options.max_steps, timeout=options.timeout)
+    except ComputerExecutionLimitExceeded as e:
+        _write_output(e.state.output, stdout)
+        stderr.write('{}\n'.format(e))
+        return 2
+    except Exception as e:
+        stderr.write('The program failed: {!r}\n'.format(e))
+        return 1
+    _write_output(output, stdout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
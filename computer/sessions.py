@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind editing sessions: the changes made to the program of a `Computer` within a session (setting its pointer
+and inserting instructions) are buffered in the cache set by `settings.COMPUTER_EDITING_SESSION_CACHE` instead of being
+written one at a time, and written at once when the session is committed, or once it's been idle for
+`settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT` seconds: by a timer of the process that last changed it, by the first
+request that finds it idle, or by the `flush_sessions` command, whichever comes first.
+
+Requests of the same session may be served by different workers at once, so every change is written under a lock
+taken with `cache.add` (atomic in every shared backend), on top of whatever the session holds by then.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+
+from computer.exceptions import ComputerSessionConflict
+from computer.models import Computer
+from computer.utils import generate_session_id
+
+# Seconds a session stays locked at most, in case the process holding the lock dies, and seconds to wait for it
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5
+
+# Cache key of the IDs of the sessions that are open, so they can be found (and committed once idle) by any process
+INDEX_KEY = 'computer-editing-sessions'
+
+_timers = {}
+_timers_lock = threading.Lock()
+
+
+class EditingSession(object):
+    """
+    Changes made to the program of a `Computer` since the session was opened at `version`: the instructions inserted
+    (address -> (instruction, instruction_arg)) and where the pointer was left.
+    """
+    def __init__(self, computer_id, version, program_stack_pointer, instructions=None, session_id=None,
+                 touched_at=None):
+        self.id = session_id or generate_session_id()
+        self.computer_id = computer_id
+        self.version = version
+        self.program_stack_pointer = program_stack_pointer
+        self.instructions = instructions or {}
+        self.touched_at = touched_at or time.time()
+
+    @staticmethod
+    def _cache():
+        return caches[settings.COMPUTER_EDITING_SESSION_CACHE]
+
+    @staticmethod
+    def _key(session_id):
+        return 'computer-editing-session:{}'.format(session_id)
+
+    @classmethod
+    def open(cls, computer):
+        """
+        Opens a session to edit the program of `computer` as saved.
+
+        :param computer: The `Computer` to edit
+        :return: EditingSession
+        """
+        session = cls(computer.pk, computer.version, computer.program_stack_pointer)
+        session.save()
+        with cls._locked(INDEX_KEY):
+            session_ids = cls.open_ids()
+            session_ids.add(session.id)
+            cls._cache().set(INDEX_KEY, session_ids, None)
+        return session
+
+    @classmethod
+    def open_ids(cls):
+        """
+        Returns the IDs of the sessions that are open, in any process.
+
+        :return: set
+        """
+        return cls._cache().get(INDEX_KEY) or set()
+
+    @classmethod
+    def _lock(cls, session_id):
+        """
+        Holds the lock of the session with the given ID for as long as the block runs.
+
+        :raises ComputerSessionConflict: If the session stays locked for longer than `LOCK_WAIT` seconds
+        """
+        return cls._locked(cls._key(session_id))
+
+    @classmethod
+    @contextmanager
+    def _locked(cls, key):
+        cache = cls._cache()
+        key = '{}:lock'.format(key)
+        token = generate_session_id()
+        give_up_at = time.time() + LOCK_WAIT
+        while not cache.add(key, token, LOCK_TIMEOUT):
+            if time.time() > give_up_at:
+                raise ComputerSessionConflict('The editing session is busy with other changes, try again later')
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if cache.get(key) == token:
+                cache.delete(key)
+
+    @classmethod
+    def get(cls, session_id, computer=None):
+        """
+        Returns the session with the given ID, or None if there is none (or it belongs to another `Computer`). Sessions
+        that have been idle for long enough are committed instead, in case the timer that should have done it is gone
+        along with its process.
+
+        :param session_id: The ID of the session
+        :param computer: Optional `Computer` the session must belong to
+        :return: EditingSession
+        """
+        session = cls._load(session_id)
+        if session is None or (computer is not None and session.computer_id != computer.pk):
+            return None
+        if session.is_idle():
+            flush_if_idle(session_id, reschedule=False)
+            return None
+        return session
+
+    @classmethod
+    def _load(cls, session_id):
+        data = cls._cache().get(cls._key(session_id))
+        if data is None:
+            return None
+        return cls(session_id=session_id, **data)
+
+    def idle_remaining(self):
+        """
+        Returns the seconds left until the session has been idle for `settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT`
+        seconds (0 or less once it has), or None if sessions are only committed on request.
+
+        :return: float
+        """
+        if not settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT:
+            return None
+        return self.touched_at + settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT - time.time()
+
+    def is_idle(self):
+        """
+        Returns whether the session has been idle for long enough to be committed on its own.
+
+        :return: bool
+        """
+        remaining = self.idle_remaining()
+        return remaining is not None and remaining <= 0
+
+    def save(self):
+        """
+        Stores the session in the cache and schedules it to be committed once it's been idle for long enough.
+        """
+        self.touched_at = time.time()
+        self._cache().set(self._key(self.id), {
+            'computer_id': self.computer_id,
+            'version': self.version,
+            'program_stack_pointer': self.program_stack_pointer,
+            'instructions': self.instructions,
+            'touched_at': self.touched_at,
+        })
+        if settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT:
+            _schedule_flush(self.id, settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT)
+
+    def close(self):
+        """
+        Drops the session, along with whatever it didn't commit.
+        """
+        self._cache().delete(self._key(self.id))
+        self.forget(self.id)
+
+    @classmethod
+    def forget(cls, session_id):
+        """
+        Drops the given ID from the IDs of the sessions that are open.
+        """
+        with cls._locked(INDEX_KEY):
+            session_ids = cls.open_ids()
+            if session_id in session_ids:
+                session_ids.discard(session_id)
+                cls._cache().set(INDEX_KEY, session_ids, None)
+
+    def apply(self, computer):
+        """
+        Makes the changes of the session on `computer`, without saving them, so it shows the program as edited.
+
+        :param computer: The `Computer` the session belongs to, as saved
+        :return: Computer
+        """
+        computer.load_program(
+            (addr, instruction, instruction_arg) for addr, (instruction, instruction_arg) in
+            sorted(self.instructions.items()))
+        return computer.set_address(self.program_stack_pointer)
+
+    def update(self, computer):
+        """
+        Takes the changes made to `computer` since the session was applied on it into the session, and stores it, on
+        top of the changes made within the session by others in the meantime.
+
+        :param computer: The `Computer` the session was applied on
+        :return: None
+        :raises ComputerSessionConflict: If the session was committed or closed in the meantime, or stays locked
+        """
+        changes = {
+            address: instruction for address, instruction in computer.pending_instructions.items()
+            if self.instructions.get(address) != instruction}
+        with self._lock(self.id):
+            session = self._load(self.id)
+            if session is None:
+                raise ComputerSessionConflict('The editing session was committed or closed in the meantime')
+            self.instructions = session.instructions
+            self.instructions.update(changes)
+            self.program_stack_pointer = computer.program_stack_pointer
+            self.save()
+
+    def commit(self):
+        """
+        Writes the changes of the session into its `Computer` at once, with a single bump of its version, and closes
+        the session.
+
+        :return: Computer
+        :raises ComputerSessionConflict: If the program of the `Computer` changed since the session was opened, in which
+            case the session is closed as well, or if the session was committed or closed in the meantime
+        """
+        with self._lock(self.id):
+            session = self._load(self.id)
+            if session is None:
+                raise ComputerSessionConflict('The editing session was committed or closed in the meantime')
+            with transaction.atomic():
+                # Writing the pointer locks the row until the changes are written, so commits never overlap
+                if not Computer.objects.filter(pk=session.computer_id, version=session.version).update(
+                        program_stack_pointer=session.program_stack_pointer):
+                    session.close()
+                    raise ComputerSessionConflict(
+                        'The program of the computer changed since the session was opened, so it cannot be committed')
+                computer = session.apply(Computer.objects.get(pk=session.computer_id))
+                computer.save()
+            session.close()
+        return computer
+
+
+def _schedule_flush(session_id, delay):
+    """
+    Checks whether the session is idle after `delay` seconds, unless this process is already going to.
+    """
+    with _timers_lock:
+        if session_id in _timers:
+            return
+        timer = _timers[session_id] = threading.Timer(delay, _flush_in_timer, (session_id,))
+    timer.daemon = True
+    timer.start()
+
+
+def _flush_in_timer(session_id):
+    with _timers_lock:
+        _timers.pop(session_id, None)
+    try:
+        flush_if_idle(session_id)
+    finally:
+        # Timers don't go through the request cycle, which is what usually closes connections
+        connection.close()
+
+
+def flush_if_idle(session_id, reschedule=True):
+    """
+    Commits the session if it's been idle for `settings.COMPUTER_EDITING_SESSION_IDLE_TIMEOUT` seconds (right away if
+    it's 0), or checks it again once it may be. Sessions that can't be committed anymore are dropped.
+
+    :param session_id: The ID of the session
+    :param reschedule: Whether to check the session again in this process if it isn't idle yet
+    :return: Computer, or None if the session wasn't committed
+    """
+    session = EditingSession._load(session_id)
+    if session is None:
+        EditingSession.forget(session_id)
+        return None
+    remaining = session.idle_remaining()
+    if remaining is not None and remaining > 0:
+        if reschedule:
+            _schedule_flush(session_id, remaining)
+        return None
+    try:
+        return session.commit()
+    except ComputerSessionConflict:
+        return None
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps: the same program executed once per row of a matrix of PUSH arguments.
+
+With NumPy installed, every variant is a lane of a group that runs in lockstep: each stack slot and printed value is an
+array holding the value of every lane, so an instruction is executed once for all of them. Groups are split whenever
+their lanes disagree on where to go (a RET to different addresses, a MULT with a falsy operand in some of them), and
+MULTs that may overflow int64 are computed on arbitrary-precision ints instead. NumPy is a requirement; only if it
+can't be imported is every variant executed by the compiled engine on its own.
+"""
+
+
+from __future__ import print_function, unicode_literals
+
+import time
+
+from computer.engine import SLICE_STEPS, CompiledProgram, execute_compiled
+from computer.enums import ComputerOpcode
+from computer.exceptions import ComputerExecutionLimitExceeded, ComputerInfiniteLoop
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAX_INT64 = 2 ** 63 - 1
+
+
+def _error_detail(e):
+    if isinstance(e, ComputerExecutionLimitExceeded):
+        return '{}'.format(e)
+    return 'Unexpected error when executing the program: {}'.format(e)
+
+
+class _LaneGroup(object):
+    """
+    Lanes that share their program counter, steps and the depth of their memory.
+    """
+    __slots__ = ('lanes', 'program_counter', 'memory', 'output', 'steps')
+
+    def __init__(self, lanes, program_counter, memory, output, steps):
+        self.lanes = lanes
+        self.program_counter = program_counter
+        self.memory = memory
+        self.output = output
+        self.steps = steps
+
+    def split(self, mask, program_counter):
+        """
+        Returns a new group with the lanes selected by `mask`, going on at `program_counter`.
+        """
+        return _LaneGroup(
+            self.lanes[mask], program_counter, [column[mask] for column in self.memory],
+            [column[mask] for column in self.output], self.steps)
+
+
+def _constant_column(value, count):
+    """
+    Returns a column holding `value` in `count` lanes.
+    """
+    if value is None or not -MAX_INT64 - 1 <= value <= MAX_INT64:
+        column = numpy.empty(count, dtype=object)
+        column.fill(value)
+        return column
+    return numpy.full(count, value, dtype=numpy.int64)
+
+
+def _truthy(column):
+    if column.dtype == object:
+        return numpy.array([bool(value) for value in column], dtype=bool)
+    return column != 0
+
+
+def _multiply(column1, column2):
+    """
+    Multiplies two columns of truthy values, switching to arbitrary-precision ints if int64 may overflow.
+    """
+    if column1.dtype != object and column2.dtype != object:
+        bound1 = max(abs(int(column1.min())), abs(int(column1.max())))
+        bound2 = max(abs(int(column2.min())), abs(int(column2.max())))
+        if bound1 * bound2 <= MAX_INT64:
+            return column1 * column2
+    return column1.astype(object) * column2.astype(object)
+
+
+def _same_memory(memory, saved_memory):
+    return len(memory) == len(saved_memory) and all(
+        numpy.array_equal(column, saved_column) for column, saved_column in zip(memory, saved_memory))
+
+
+def _run_group(program, group, columns, max_steps, deadline, timeout):
+    """
+    Runs a group of lanes until it halts, fails or splits.
+
+    Just like `run_compiled`, back-edges are checked with Brent's algorithm, so groups whose lanes all reach the very
+    same state twice are stopped right away.
+
+    :return: tuple of (list of groups it split into, error detail if it failed)
+    """
+    opcodes, args, size = program.opcodes, program.args, program.size
+    memory = group.memory
+    count = len(group.lanes)
+    pc = group.program_counter
+    steps = group.steps
+    next_check = steps + SLICE_STEPS
+    saved_pc, saved_memory, power, countdown = None, None, 1, 1
+    try:
+        while pc <= size:
+            if max_steps is not None and steps >= max_steps:
+                raise ComputerExecutionLimitExceeded(
+                    'The program did not finish within {} steps'.format(max_steps), None)
+            if steps >= next_check:
+                next_check = steps + SLICE_STEPS
+                if deadline is not None and time.time() > deadline:
+                    raise ComputerExecutionLimitExceeded(
+                        'The program did not finish within {} seconds'.format(timeout), None)
+            opcode = opcodes.get(pc)
+            if opcode is None:
+                # Walking over a whole empty region, as far as the budget goes
+                empty = program.next_address(pc) - pc
+                if max_steps is not None:
+                    empty = min(empty, max_steps - steps)
+                steps += empty
+                pc += empty
+                continue
+            steps += 1
+            if opcode == ComputerOpcode.PUSH:
+                column = columns.get(pc)
+                memory.append(column[group.lanes] if column is not None else _constant_column(args[pc], count))
+                pc += 1
+            elif opcode == ComputerOpcode.PRINT:
+                group.output.append(memory.pop())
+                pc += 1
+            elif opcode == ComputerOpcode.MULT:
+                operand1 = memory.pop()
+                operand2 = memory.pop()
+                truthy = _truthy(operand1) & _truthy(operand2)
+                pc += 1
+                if truthy.all():
+                    memory.append(_multiply(operand1, operand2))
+                elif truthy.any():
+                    # Only some lanes push the product, so their memory doesn't have the same depth anymore
+                    group.steps = steps
+                    multiplied = group.split(truthy, pc)
+                    multiplied.memory.append(_multiply(operand1[truthy], operand2[truthy]))
+                    return [multiplied, group.split(~truthy, pc)], None
+            elif opcode == ComputerOpcode.CALL:
+                target = args[pc]
+                if target <= pc:
+                    if target == saved_pc and _same_memory(memory, saved_memory):
+                        raise ComputerInfiniteLoop(
+                            'The program never finishes: it loops back to address {} with the same memory'.format(
+                                target), None)
+                    countdown -= 1
+                    if not countdown:
+                        power *= 2
+                        countdown = power
+                        saved_pc, saved_memory = target, list(memory)
+                pc = target
+            elif opcode == ComputerOpcode.RET:
+                value_to_ret_to = memory.pop()
+                truthy = _truthy(value_to_ret_to)
+                if value_to_ret_to.dtype == object:
+                    targets = numpy.array(
+                        [value if is_truthy else pc for value, is_truthy in zip(value_to_ret_to, truthy)], dtype=object)
+                    unique_targets = set(targets)
+                else:
+                    targets = numpy.where(truthy, value_to_ret_to, pc)
+                    unique_targets = numpy.unique(targets).tolist()
+                if len(unique_targets) > 1:
+                    group.steps = steps
+                    return [group.split(targets == target, target) for target in unique_targets], None
+                target = unique_targets.pop() if isinstance(unique_targets, set) else unique_targets[0]
+                if target <= pc:
+                    if target == saved_pc and _same_memory(memory, saved_memory):
+                        raise ComputerInfiniteLoop(
+                            'The program never finishes: it loops back to address {} with the same memory'.format(
+                                target), None)
+                    countdown -= 1
+                    if not countdown:
+                        power *= 2
+                        countdown = power
+                        saved_pc, saved_memory = target, list(memory)
+                pc = target
+            elif opcode == ComputerOpcode.STOP:
+                break
+            else:
+                raise args[pc]
+    except Exception as e:
+        return [], _error_detail(e)
+    finally:
+        group.program_counter = pc
+        group.steps = steps
+    return [], None
+
+
+def _sweep_lanes(program, program_counter, addresses, rows, max_steps, timeout):
+    """
+    Executes every row as a lane of groups that run in lockstep with NumPy.
+    """
+    matrix = numpy.array(rows, dtype=object).reshape(len(rows), len(addresses))
+    columns = {}
+    for index, address in enumerate(addresses):
+        column = matrix[:, index]
+        if all(value is not None and -MAX_INT64 - 1 <= value <= MAX_INT64 for value in column):
+            column = column.astype(numpy.int64)
+        columns[address] = column
+
+    deadline = time.time() + timeout if timeout else None
+    outputs = [None] * len(rows)
+    details = [None] * len(rows)
+    pending = [_LaneGroup(numpy.arange(len(rows)), program_counter, [], [], 0)]
+    while pending:
+        group = pending.pop()
+        groups, detail = _run_group(program, group, columns, max_steps, deadline, timeout)
+        if groups:
+            pending.extend(groups)
+            continue
+        if detail is not None:
+            for lane in group.lanes:
+                details[lane] = detail
+            continue
+        lane_outputs = zip(*[column.tolist() for column in group.output]) if group.output else None
+        for position, lane in enumerate(group.lanes):
+            outputs[lane] = list(lane_outputs[position]) if lane_outputs is not None else []
+    return outputs, details
+
+
+def execute_sweep(program, program_counter, addresses, rows, max_steps=None, timeout=None):
+    """
+    Executes a `CompiledProgram` once per row of `rows`, with the args of the PUSHes at `addresses` replaced by the
+    values of the row.
+
+    :param program: The `CompiledProgram` to execute
+    :param program_counter: The address to start every execution at
+    :param addresses: The addresses of the PUSHes whose args are swept, one per column of `rows`
+    :param rows: List of rows of PUSH args, one per execution
+    :param max_steps: Optional budget of instructions to execute, per row
+    :param timeout: Optional budget of seconds to execute for, for the whole sweep
+    :return: tuple of (list of outputs, list of error details), with one item per row and None where they don't apply
+    """
+    if not rows:
+        return [], []
+    if numpy is not None:
+        return _sweep_lanes(program, program_counter, addresses, rows, max_steps, timeout)
+
+    deadline = time.time() + timeout if timeout else None
+    outputs = []
+    details = []
+    for row in rows:
+        args = dict(program.args)
+        args.update(zip(addresses, row))
+        try:
+            remaining = None if deadline is None else max(deadline - time.time(), 0.001)
+            outputs.append(execute_compiled(
+                CompiledProgram(program.opcodes, args, program.size), program_counter, max_steps=max_steps,
+                timeout=remaining))
+            details.append(None)
+        except Exception as e:
+            outputs.append(None)
+            details.append(_error_detail(e))
+    return outputs, details
@@ -3,9 +3,29 @@
 
 from __future__ import print_function, unicode_literals
 
-from django.test import TestCase
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 
-from computer.models import Computer
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from computer import batch, images, run
+from computer.assembler import assemble
+from computer.cache import LRUMemCache, ProgramCache, execution_cache
+from computer.enums import ComputerEngine, ComputerInstruction, ComputerOpcode
+from computer.exceptions import ComputerAssemblyError, ComputerExecutionLimitExceeded, ComputerInfiniteLoop
+from computer.models import Computer, Instruction
+
+
+def _exit_process(payload):
+    """
+    Stands in for `computer.batch._execute` in processes that die while executing a batch.
+    """
+    os._exit(1)
 
 
 class ComputerTestCase(TestCase):
@@ -56,3 +76,446 @@ class ComputerTestCase(TestCase):
         computer.set_address(0)
         program_output_data = computer.execute()
         self.assertEqual(program_output_data, [49, 49])
+
+    def test_engines_match(self):
+        """
+        The compiled engine produces the same output as the reference one, including the edge cases of `MULT` with a
+        falsy operand, `RET` to a falsy or negative address and changes made after a first execution.
+        """
+        computer = Computer(program_stack_size=40)
+        computer.insert('PRINT').insert('PRINT')
+        computer.set_address(20).insert('PUSH', 3).insert('PUSH', 0).insert('MULT').insert('PUSH', 5).insert('PRINT')
+        computer.insert('PUSH', 30).insert('PUSH', 0).insert('RET')
+        computer.set_address(30).insert('PUSH', 2).insert('PUSH', -4).insert('RET')
+        computer.program_counter = 20
+        for engine in (ComputerEngine.REFERENCE, ComputerEngine.COMPILED):
+            self.assertRaises(IndexError, computer.execute, engine=engine)
+        computer.set_address(1).insert('STOP')
+        self.assertEqual(computer.execute(engine=ComputerEngine.REFERENCE), [5, 2])
+        self.assertEqual(computer.execute(engine=ComputerEngine.COMPILED), [5, 2])
+
+    def test_optimized_engine(self):
+        """
+        The optimizer folds constant MULTs and fuses straight lines of instructions (following CALLs) starting where
+        execution may begin, without changing the output, even when a RET jumps into the middle of one of them.
+        """
+        computer = Computer(program_stack_size=100)
+        computer.set_address(50).insert('MULT').insert('PRINT').insert('RET')
+        computer.set_address(0).insert('PUSH', 1009).insert('PRINT').insert('PUSH', 6)
+        computer.insert('PUSH', 101).insert('PUSH', 10).insert('CALL', 50).insert('STOP')
+        computer.set_address(8).insert('PRINT')
+        computer.set_address(0)
+        self.assertEqual(computer.execute(engine=ComputerEngine.OPTIMIZED), [1009, 1010])
+        optimized_program_stack = dict(computer.debug(optimized=True)['optimized_program_stack'])
+        self.assertEqual(optimized_program_stack[0], ('fused', {
+            'operations': [['print', [1009, 1010]], ['push', [6]]], 'next': 52, 'steps': 8}))
+        self.assertNotIn(8, optimized_program_stack)
+
+        computer.set_address(6).insert('PUSH', 0).insert('PUSH', 3).insert('MULT').insert('PUSH', 21).insert('RET')
+        computer.set_address(20).insert('PUSH', 5).insert('PRINT').insert('RET')
+        computer.set_address(0)
+        for engine in (ComputerEngine.REFERENCE, ComputerEngine.OPTIMIZED):
+            self.assertRaises(IndexError, computer.execute, engine=engine)
+        computer.set_address(9).insert('PUSH', 7).insert('PUSH', 21).insert('RET').set_address(22).insert('STOP')
+        computer.set_address(0)
+        self.assertEqual(computer.execute(engine=ComputerEngine.REFERENCE), [1009, 1010, 7])
+        self.assertEqual(computer.execute(engine=ComputerEngine.OPTIMIZED), [1009, 1010, 7])
+
+    def test_memoized_subroutine(self):
+        """
+        CALL targets running enough operations up to a RET are memoized by the values they read, so calling them again
+        with the same ones skips their body, while the ones called with known values are still inlined and folded.
+        """
+        computer = Computer(program_stack_size=100)
+        for begin, value in ((0, 2), (5, 2), (10, 3)):
+            computer.set_address(begin).insert('PUSH', begin + 5).insert('PUSH', value).insert('PUSH', begin + 4)
+            computer.insert('CALL', 80).insert('CALL', 50)
+        computer.insert('PUSH', 100).insert('PUSH', 4).insert('CALL', 50)
+        computer.set_address(50)
+        for value in range(2, 10):
+            computer.insert('PUSH', value).insert('MULT')
+        computer.insert('PRINT').insert('RET')
+        computer.set_address(80).insert('PUSH', 0).insert('PRINT').insert('RET')
+        computer.set_address(0)
+        self.assertEqual(computer.execute(engine=ComputerEngine.REFERENCE), [0, 725760, 0, 725760, 0, 1088640, 1451520])
+        self.assertEqual(computer.execute(engine=ComputerEngine.OPTIMIZED), [0, 725760, 0, 725760, 0, 1088640, 1451520])
+        optimized_program_stack = dict(computer.debug(optimized=True)['optimized_program_stack'])
+        self.assertEqual(optimized_program_stack[50][0], 'memoized')
+        self.assertEqual(optimized_program_stack[50][1]['inputs'], 1)
+        self.assertEqual(optimized_program_stack[15], ('fused', {
+            'operations': [['print', [1451520]], ['push', [100]]], 'next': 67, 'steps': 20}))
+        self.assertEqual(set(computer.optimize().args[50].recent_calls), {(2,), (3,)})
+
+        # The optimized program, along with the calls it memoized, is shared by every later instance of the same
+        # version, as long as it's optimized for the same program counter
+        computer.save()
+        optimized_program = Computer.objects.get(pk=computer.pk).optimize()
+        other_computer = Computer.objects.get(pk=computer.pk)
+        self.assertIs(other_computer.optimize(), optimized_program)
+        other_computer.insert('PUSH', 1, save=True)
+        self.assertIsNot(Computer.objects.get(pk=computer.pk).optimize(), optimized_program)
+        other_computer = Computer.objects.get(pk=computer.pk)
+        other_computer.program_counter = 5
+        self.assertIsNot(other_computer.optimize(), Computer.objects.get(pk=computer.pk).optimize())
+
+    def test_generated_engine(self):
+        """
+        Programs are translated into one Python function per basic block, starting at the program counter, CALL targets
+        and possible RET targets, with the same output and steps as the compiled engine; programs whose RET targets
+        can't be told beforehand are run by the compiled engine instead.
+        """
+        computer = Computer(program_stack_size=100)
+        computer.set_address(50).insert('MULT').insert('PRINT').insert('RET')
+        computer.set_address(0).insert('PUSH', 1009).insert('PRINT').insert('PUSH', 6)
+        computer.insert('PUSH', 101).insert('PUSH', 10).insert('CALL', 50).insert('STOP')
+        computer.set_address(8).insert('PRINT')
+        computer.set_address(0)
+        self.assertEqual(computer.execute(engine=ComputerEngine.GENERATED), [1009, 1010])
+        self.assertEqual(set(computer.generate().blocks), {0, 6, 10, 36, 50, 60, 100})
+        computer.set_address(6).insert('PUSH', 0)
+        computer.set_address(0)
+        for max_steps in (3, 50):
+            states = []
+            for engine in (ComputerEngine.COMPILED, ComputerEngine.GENERATED):
+                with self.assertRaises(ComputerExecutionLimitExceeded) as context:
+                    computer.execute(engine=engine, max_steps=max_steps)
+                states.append((context.exception.state.output, context.exception.state.steps))
+            self.assertEqual(states[0], states[1])
+
+        computer = Computer(program_stack_size=Computer.MAX_ADDRESS)
+        for value in (2, 3, 5, 7, 11, 13, 9):
+            computer.insert('PUSH', value)
+        computer.insert('RET').set_address(9).insert('PRINT').insert('STOP')
+        computer.set_address(0)
+        self.assertIsNone(computer.generate())
+        self.assertEqual(computer.execute(engine=ComputerEngine.GENERATED), [13])
+
+    def test_sparse_program(self):
+        """
+        Empty regions are walked over at once, so a few instructions spread over the largest address space run right
+        away, while still counting every empty address against the budget.
+        """
+        computer = Computer(program_stack_size=Computer.MAX_ADDRESS)
+        computer.insert('PUSH', 1).insert('PRINT')
+        computer.set_address(Computer.MAX_ADDRESS - 1).insert('PUSH', 2).insert('PRINT')
+        computer.set_address(0)
+        computer.save()
+        computer = Computer.objects.get(pk=computer.pk)
+        self.assertEqual(computer.execute(), [1, 2])
+        self.assertEqual(computer.execute(engine=ComputerEngine.OPTIMIZED), [1, 2])
+        with self.assertRaises(ComputerExecutionLimitExceeded) as context:
+            computer.execute(max_steps=10 ** 6)
+        self.assertEqual((context.exception.state.output, context.exception.state.steps), ([1], 10 ** 6))
+
+    def test_infinite_loop(self):
+        """
+        Programs that reach the same state twice are stopped right away by every engine but the reference one, while
+        loops that keep changing their memory run until they run out of their budget.
+        """
+        computer = Computer(program_stack_size=100)
+        computer.insert('PUSH', 7).insert('PRINT').insert('PUSH', 2).insert('PUSH', 10).insert('CALL', 50)
+        computer.set_address(50).insert('PUSH', 3).insert('PRINT').insert('RET')
+        computer.set_address(0)
+        for engine in (ComputerEngine.COMPILED, ComputerEngine.OPTIMIZED):
+            with self.assertRaises(ComputerInfiniteLoop) as context:
+                computer.execute(engine=engine, max_steps=10 ** 6)
+            self.assertLess(context.exception.state.steps, 100)
+            self.assertEqual(context.exception.state.output[:3], [7, 3, 3])
+        with self.assertRaises(ComputerExecutionLimitExceeded) as context:
+            computer.execute(engine=ComputerEngine.REFERENCE, max_steps=100)
+        self.assertEqual(context.exception.state.steps, 100)
+
+        computer.set_address(4).insert('CALL', 0)
+        with self.assertRaises(ComputerExecutionLimitExceeded) as context:
+            computer.execute(max_steps=1000)
+        self.assertNotIsInstance(context.exception, ComputerInfiniteLoop)
+
+    def test_instruction_storage(self):
+        """
+        Every address is stored as its own `Instruction`, so inserts made through different instances of the same
+        `Computer` don't overwrite each other and the program is loaded back with a single query.
+        """
+        computer = Computer(program_stack_size=100)
+        computer.save()
+        other_computer = Computer.objects.get(pk=computer.pk)
+        computer.set_address(50).insert('MULT', save=True).insert('PRINT', save=True).insert('RET', save=True)
+        other_computer.insert('PUSH', 1009, save=True).insert('PRINT', save=True).insert('PUSH', 6, save=True)
+        other_computer.load_program([(3, 'PUSH', 101), (4, 'PUSH', 10), (5, 'CALL', 50), (6, 'STOP', None)], save=True)
+        self.assertEqual(Instruction.objects.filter(computer=computer).count(), 10)
+
+        computer = Computer.objects.get(pk=computer.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(computer.program_stack[50], ('mult', None))
+            self.assertEqual(computer.execute(), [1009, 1010])
+
+        # Addresses are upserted with a single query, whether they were already there or not
+        for addr in (6, 7):
+            with self.assertNumQueries(1):
+                Instruction.upsert(computer, addr, ComputerInstruction.PRINT, None)
+        self.assertEqual(
+            list(Instruction.objects.filter(computer=computer, addr__in=(6, 7)).values_list('addr', 'opcode')),
+            [(6, ComputerOpcode.PRINT), (7, ComputerOpcode.PRINT)])
+
+    def test_execution_cache(self):
+        """
+        Outputs are cached by program content, so a change to the program is never served a stale output, and the
+        least recently used outputs are evicted first.
+        """
+        cache = LRUMemCache('test-executions', {'OPTIONS': {'MAX_ENTRIES': 2}})
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+        execution_cache.cache.clear()
+        computer = Computer(program_stack_size=10)
+        computer.insert('PUSH', 7).insert('PRINT').insert('STOP')
+        hits, misses = execution_cache.hits, execution_cache.misses
+        self.assertEqual(computer.execute(use_cache=True), [7])
+        self.assertEqual(computer.execute(use_cache=True), [7])
+        self.assertEqual((execution_cache.hits - hits, execution_cache.misses - misses), (1, 1))
+        computer.set_address(0).insert('PUSH', 8)
+        self.assertEqual(computer.execute(use_cache=True), [8])
+        self.assertEqual(execution_cache.misses - misses, 2)
+
+        # Cached outputs are only reused by executions whose budget they fit, so they fail the same way either way
+        computer.save()
+        with self.assertRaises(ComputerExecutionLimitExceeded) as context:
+            computer.execute(use_cache=True, max_steps=2)
+        self.assertEqual((context.exception.state.output, context.exception.state.steps), ([8], 2))
+        self.assertEqual(computer.execute(use_cache=True, max_steps=3), [8])
+        self.assertEqual(batch.execute_batch([computer.pk], max_steps=2)[computer.pk]['detail'][:33],
+                         'The program did not finish within')
+        self.assertEqual(batch.execute_batch([computer.pk], max_steps=3)[computer.pk], {'program_output': [8]})
+
+    @override_settings(COMPUTER_BATCH_WORKERS=2)
+    def test_batch_timeout(self):
+        """
+        Programs of a batch that didn't finish by the time it runs out of its budget (i.e. since their processes died)
+        are reported as timed out, and the next batch runs in a new pool of processes.
+        """
+        computer_ids = []
+        for arg in (7001, 7002):
+            computer = Computer(program_stack_size=10).insert('PUSH', arg).insert('PRINT')
+            computer.save()
+            computer_ids.append(computer.pk)
+        execute = batch._execute
+        if batch._pool is not None:
+            batch._discard_pool(batch._pool)
+        try:
+            batch._execute = _exit_process
+            results = batch.execute_batch(computer_ids, timeout=0.1, batch_timeout=0.5)
+        finally:
+            batch._execute = execute
+        self.assertEqual(results[computer_ids[0]], {'detail': batch.BATCH_TIMEOUT_ERROR})
+        results = batch.execute_batch(computer_ids, timeout=0.1, batch_timeout=5)
+        self.assertEqual(results[computer_ids[1]], {'program_output': [7002]})
+        batch._discard_pool(batch._pool)
+
+        computer = Computer(program_stack_size=10).insert('PUSH', 7003).insert('PRINT')
+        computer.save()
+        with override_settings(COMPUTER_BATCH_WORKERS=0):
+            results = batch.execute_batch([computer.pk, computer_ids[0]], batch_timeout=0)
+        self.assertEqual(results, {
+            computer.pk: {'detail': batch.BATCH_TIMEOUT_ERROR}, computer_ids[0]: {'program_output': [7001]}})
+
+    def test_program_cache(self):
+        """
+        Loaded and compiled programs are reused by later instances of the same `Computer` for as long as its version
+        stays the same, and changes saved through any instance bump it.
+        """
+        computer = Computer(program_stack_size=10)
+        computer.load_program([(0, 'PUSH', 7), (1, 'PRINT', None), (2, 'STOP', None)], save=True)
+        self.assertEqual(Computer.objects.get(pk=computer.pk).execute(), [7])
+        computer = Computer.objects.get(pk=computer.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(computer.execute(), [7])
+        self.assertIs(computer.compile(), Computer.objects.get(pk=computer.pk).compile())
+
+        # Saving changes neither reads the version back nor loads the program again: it's just the UPDATE of the
+        # computer and the upsert of the instruction
+        computer = Computer.objects.get(pk=computer.pk)
+        with self.assertNumQueries(2):
+            computer.set_address(0).insert('PUSH', 8, save=True)
+            self.assertEqual(computer.debug()['program_stack'][0], (0, ('push', 8)))
+        self.assertEqual(computer.version, 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(Computer.objects.get(pk=computer.pk).execute(), [8])
+
+        cache = ProgramCache()
+        with override_settings(COMPUTER_PROGRAM_CACHE_MAX_INSTRUCTIONS=5):
+            cache.set('a', 0, {0: ('print', None), 1: ('stop', None)})
+            cache.set('b', 0, {0: ('print', None), 1: ('stop', None)})
+            cache.get('a', 0)
+            cache.set('c', 0, {0: ('print', None), 1: ('stop', None)})
+        self.assertEqual([cache.get(pk, 0) is not None for pk in 'abc'], [True, False, True])
+        self.assertIsNone(cache.get('a', 1))
+
+    def test_program_image(self):
+        """
+        Programs are published once as images shared by every worker, found by later instances without loading the
+        program stack, and produce the same output as the other engines.
+        """
+        image_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_dir)
+        with override_settings(COMPUTER_PROGRAM_IMAGE_DIR=image_dir):
+            computer = Computer(program_stack_size=Computer.MAX_ADDRESS)
+            computer.set_address(50).insert('MULT').insert('PRINT').insert('RET')
+            computer.set_address(0).insert('PUSH', 1009).insert('PRINT').insert('PUSH', 6)
+            computer.insert('PUSH', 101).insert('PUSH', 10).insert('CALL', 50).insert('STOP')
+            computer.set_address(Computer.MAX_ADDRESS).insert('PRINT')
+            computer.set_address(0)
+            computer.save()
+            self.assertEqual(computer.execute(engine=ComputerEngine.IMAGE), [1009, 1010])
+
+            other_computer = Computer.objects.get(pk=computer.pk)
+            with self.assertNumQueries(0):
+                self.assertEqual(other_computer.execute(engine=ComputerEngine.IMAGE), [1009, 1010])
+            self.assertIs(other_computer.image(), computer.image())
+
+            computer.set_address(6).insert('CALL', save=True).set_address(0)
+            for engine in (ComputerEngine.REFERENCE, ComputerEngine.IMAGE):
+                self.assertRaises(TypeError, computer.execute, engine=engine)
+            self.assertIsNot(computer.image(), other_computer.image())
+
+            # Only the image of the latest version is referenced, and the others are collected once they're old enough
+            self.assertEqual(os.listdir(os.path.join(image_dir, 'refs')), ['{}'.format(computer.pk)])
+            self.addCleanup(setattr, images, 'IMAGE_GRACE_PERIOD', images.IMAGE_GRACE_PERIOD)
+            self.assertEqual(images.collect_images(), (0, 0))
+            images.IMAGE_GRACE_PERIOD = -1
+            self.assertEqual(images.collect_images(), (0, 1))
+            output = StringIO()
+            call_command('collect_images', stdout=output)
+            self.assertEqual(output.getvalue(), 'Removed 0 refs and 0 images\n')
+            Computer.objects.filter(pk=computer.pk).delete()
+            output = StringIO()
+            call_command('collect_images', stdout=output)
+            self.assertEqual(output.getvalue(), 'Removed 1 refs and 1 images\n')
+            self.assertEqual(os.listdir(image_dir), ['refs'])
+
+            # Processes only keep so many images mapped, and the ones they closed are opened again when needed
+            self.addCleanup(setattr, images, 'MAX_OPEN_IMAGES', images.MAX_OPEN_IMAGES)
+            images.MAX_OPEN_IMAGES = 1
+            computer = Computer(program_stack_size=10).insert('PUSH', 3).insert('PRINT')
+            image = computer.image()
+            Computer(program_stack_size=10).insert('PUSH', 4).insert('PRINT').image()
+            self.assertTrue(image.closed)
+            self.assertEqual(computer.execute(engine=ComputerEngine.IMAGE), [3])
+            self.assertIsNot(computer.image(), image)
+
+    def test_incremental_execution(self):
+        """
+        Executions that run past the last instruction are resumed from there once more instructions are appended, but
+        start over as soon as anything before it changes, even through another instance of the same `Computer`.
+        """
+        computer = Computer(program_stack_size=100)
+        computer.insert('PUSH', 2).insert('PUSH', 3).insert('MULT').insert('PRINT')
+        self.assertEqual(computer.execute(), [6])
+        computer.insert('PUSH', 5).insert('PRINT')
+        self.assertEqual(computer._resume_state().program_counter, 4)
+        self.assertEqual(computer.execute(), [6, 5])
+        computer.save()
+
+        computer = Computer.objects.get(pk=computer.pk)
+        self.assertEqual(computer.checkpoint['output'], [6, 5])
+        computer.insert('PUSH', 7, save=True).insert('PRINT', save=True)
+        self.assertEqual(computer._resume_state().program_counter, 6)
+        for engine in (ComputerEngine.COMPILED, ComputerEngine.OPTIMIZED):
+            self.assertEqual(Computer.objects.get(pk=computer.pk).execute(engine=engine), [6, 5, 7])
+
+        other_computer = Computer.objects.get(pk=computer.pk)
+        other_computer.set_address(0).insert('PUSH', 4, save=True)
+        computer = Computer.objects.get(pk=computer.pk)
+        self.assertEqual(computer._resume_state().program_counter, 0)
+        self.assertEqual(computer.execute(), [12, 5, 7])
+
+    def test_assembler(self):
+        """
+        Programs written as text are assembled with their labels resolved, even the ones referenced before they're
+        defined, reporting every error along with its line, and can be inserted in a computer from the command line.
+        """
+        source = [
+            '; The program given originally by the test description\n',
+            '.org 50\n',
+            'print_tenten: MULT\n',
+            '  PRINT\n',
+            '  RET\n',
+            '.org 0\n',
+            'PUSH 1009  # Printed first\n',
+            'PRINT\n',
+            'PUSH after\n',
+            'PUSH 0x65\n',
+            'PUSH 10\n',
+            'CALL print_tenten\n',
+            'after:\n',
+            '  STOP\n',
+        ]
+        program, labels = assemble(source, size=100)
+        self.assertEqual(labels, {'print_tenten': 50, 'after': 6})
+        self.assertEqual(program[3:6], [(0, 'push', 1009), (1, 'print', None), (2, 'push', 6)])
+        computer = Computer(program_stack_size=100)
+        computer.load_program(program)
+        self.assertEqual(computer.execute(), [1009, 1010])
+
+        with self.assertRaises(ComputerAssemblyError) as context:
+            assemble([
+                'zero: PUSH\n', 'JUMP 3\n', 'CALL nowhere\n', '.org 20\n', 'STOP\n', 'PRINT 1\n', '.org 1\n', 'RET\n',
+                '.org 3\n', 'PUSH 0x0\n', 'CALL zero\n',
+            ], size=10)
+        self.assertEqual(ComputerAssemblyError.messages_of(context.exception.errors), [
+            'Line 1: PUSH takes an arg',
+            'Line 2: Unknown instruction JUMP',
+            'Line 3: Unknown label nowhere',
+            'Line 4: .org needs an address between 0 and 10',
+            'Line 6: PRINT takes no arg',
+            'Line 8: Address 1 already holds the instruction of line 5',
+            'Line 10: You must provide this value when using PUSH.',
+            'Line 11: You must provide this value when using CALL.',
+        ])
+
+        source_file = tempfile.NamedTemporaryFile(suffix='.asm')
+        self.addCleanup(source_file.close)
+        source_file.write(''.join(source).encode('utf-8'))
+        source_file.flush()
+        output = StringIO()
+        call_command('assemble', source_file.name, stdout=output)
+        computer = Computer.objects.get(pk=output.getvalue().split()[-1])
+        self.assertEqual(computer.program_stack_size, 52)
+        self.assertEqual(computer.execute(), [1009, 1010])
+
+    def test_run(self):
+        """
+        Programs are run from their source or from the image published by a computer without importing Django.
+        """
+        source_file = tempfile.NamedTemporaryFile(suffix='.asm')
+        self.addCleanup(source_file.close)
+        source_file.write(b'.org 50\nMULT\nPRINT\nRET\n.org 0\nPUSH 1009\nPRINT\nPUSH 6\nPUSH 101\nPUSH 10\nCALL 50\nSTOP\n')
+        source_file.flush()
+        output = StringIO()
+        self.assertEqual(run.main([source_file.name], stdout=output), 0)
+        self.assertEqual(output.getvalue(), '1009\n1010\n')
+
+        output, errors = StringIO(), StringIO()
+        self.assertEqual(run.main([source_file.name, '--max-steps', '3'], stdout=output, stderr=errors), 2)
+        self.assertEqual(output.getvalue(), '1009\n')
+        self.assertEqual(errors.getvalue(), 'The program did not finish within 3 steps\n')
+
+        image_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_dir)
+        with override_settings(COMPUTER_PROGRAM_IMAGE_DIR=image_dir):
+            program = run.load_program(source_file.name)
+            computer = Computer(program_stack_size=program.program_stack_size)
+            computer.load_program([
+                (address, instruction, instruction_arg)
+                for address, (instruction, instruction_arg) in sorted(program.program_stack.items())], save=True)
+            image_path = computer.image().path
+        for engine in (ComputerEngine.IMAGE, ComputerEngine.OPTIMIZED):
+            output = StringIO()
+            self.assertEqual(run.main([image_path, '--engine', engine], stdout=output), 0)
+            self.assertEqual(output.getvalue(), '1009\n1010\n')
+
+        modules = subprocess.check_output(
+            [sys.executable, '-c', 'import sys, computer.run; print(sorted(sys.modules))'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertNotIn(b"'django", modules)
@@ -6,15 +6,29 @@ from __future__ import print_function, unicode_literals
 from django.utils.crypto import get_random_string
 
 
-class ComputerException(Exception):
+def generate_computer_id():
     """
-    Class that just to customize exceptions generated by `Computer` if needed.
+    Just to make more friendly IDs.
     """
-    pass
+    return get_random_string(7).lower()
 
 
-def generate_computer_id():
+def generate_job_id():
     """
-    Just to make more friendly IDs.
+    Just to make IDs of jobs hard to guess.
     """
-    return get_random_string(7).lower()
+    return get_random_string(16).lower()
+
+
+def generate_snapshot_id():
+    """
+    Just to make IDs of snapshots hard to guess.
+    """
+    return get_random_string(16).lower()
+
+
+def generate_session_id():
+    """
+    Just to make IDs of editing sessions hard to guess.
+    """
+    return get_random_string(16).lower()
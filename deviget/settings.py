@@ -9,7 +9,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
+import multiprocessing
 import os
+import tempfile
 import dj_database_url
 
 
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -103,6 +106,82 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Caches
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'executions': {
+        'BACKEND': os.environ.get('COMPUTER_EXECUTION_CACHE_BACKEND', 'computer.cache.LRUMemCache'),
+        'LOCATION': os.environ.get('COMPUTER_EXECUTION_CACHE_LOCATION', 'computer-executions'),
+        'TIMEOUT': int(os.environ.get('COMPUTER_EXECUTION_CACHE_TIMEOUT', 60 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('COMPUTER_EXECUTION_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+    # Shared by every worker: the database by default (see `python manage.py createcachetable`), or memcached or redis
+    'editing': {
+        'BACKEND': os.environ.get(
+            'COMPUTER_EDITING_SESSION_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.environ.get('COMPUTER_EDITING_SESSION_CACHE_LOCATION', 'computer_editing_sessions'),
+        'TIMEOUT': int(os.environ.get('COMPUTER_EDITING_SESSION_CACHE_TIMEOUT', 60 * 60)),
+    },
+}
+
+# Cache used to store the outputs of `Computer.execute`
+COMPUTER_EXECUTION_CACHE = 'executions'
+
+# Cache used to buffer the changes made within editing sessions (`POST /computers/{id}/session`), which must be shared
+# by every worker (Django refuses to start otherwise), and seconds a session can be idle before its changes are
+# committed on their own (0 to only commit them on request)
+COMPUTER_EDITING_SESSION_CACHE = 'editing'
+COMPUTER_EDITING_SESSION_IDLE_TIMEOUT = float(os.environ.get('COMPUTER_EDITING_SESSION_IDLE_TIMEOUT', 60))
+
+# Maximum number of instructions held by the in-process cache of loaded and compiled programs of every worker
+COMPUTER_PROGRAM_CACHE_MAX_INSTRUCTIONS = int(os.environ.get('COMPUTER_PROGRAM_CACHE_MAX_INSTRUCTIONS', 10 ** 6))
+
+# Directory where program images are published, to be memory-mapped by every worker (`Computer.execute(engine='image')`)
+COMPUTER_PROGRAM_IMAGE_DIR = os.environ.get(
+    'COMPUTER_PROGRAM_IMAGE_DIR', os.path.join(tempfile.gettempdir(), 'computer-program-images'))
+
+# Maximum number of values (in memory and printed) of the checkpoints executions are resumed from after instructions are
+# appended to their programs
+COMPUTER_CHECKPOINT_MAX_VALUES = int(os.environ.get('COMPUTER_CHECKPOINT_MAX_VALUES', 10 ** 4))
+
+# Budgets of instructions and seconds for programs executed within a request (`POST /exec`), which can also be lowered
+# per request through the `max_steps` and `timeout` query params
+COMPUTER_EXECUTION_MAX_STEPS = int(os.environ.get('COMPUTER_EXECUTION_MAX_STEPS', 10 ** 6))
+COMPUTER_EXECUTION_TIMEOUT = float(os.environ.get('COMPUTER_EXECUTION_TIMEOUT', 5))
+
+# Budgets and number of worker threads for programs executed as jobs (`POST /exec?async=1`); with 0 workers jobs are
+# executed right away within the request
+COMPUTER_JOB_MAX_STEPS = int(os.environ.get('COMPUTER_JOB_MAX_STEPS', 10 ** 8))
+COMPUTER_JOB_TIMEOUT = float(os.environ.get('COMPUTER_JOB_TIMEOUT', 10 * 60))
+COMPUTER_JOB_WORKERS = int(os.environ.get('COMPUTER_JOB_WORKERS', 2))
+
+# Seconds between the heartbeats every process writes to its pending and running jobs; jobs that miss a few of them in a
+# row were left behind by a process that stopped, and are failed
+COMPUTER_JOB_HEARTBEAT_INTERVAL = float(os.environ.get('COMPUTER_JOB_HEARTBEAT_INTERVAL', 10))
+
+# Seconds a suspended execution (`POST /exec?suspend=1`) can wait to be continued before it expires
+COMPUTER_SNAPSHOT_TTL = float(os.environ.get('COMPUTER_SNAPSHOT_TTL', 24 * 60 * 60))
+
+# Number of worker processes, maximum number of computers and budget of seconds of the whole batch for batches
+# (`POST /computers/exec-batch`); with 0 workers batches are executed right away within the request
+COMPUTER_BATCH_WORKERS = int(os.environ.get('COMPUTER_BATCH_WORKERS', multiprocessing.cpu_count()))
+COMPUTER_BATCH_MAX_SIZE = int(os.environ.get('COMPUTER_BATCH_MAX_SIZE', 1000))
+COMPUTER_BATCH_TIMEOUT = float(os.environ.get('COMPUTER_BATCH_TIMEOUT', 10))
+
+# Maximum number of rows of PUSH args of sweeps (`POST /computers/{id}/exec/sweep`), which run in lockstep with NumPy
+# when it's installed
+COMPUTER_SWEEP_MAX_ROWS = int(os.environ.get('COMPUTER_SWEEP_MAX_ROWS', 10000))
+
+# Number of the latest requests to every view whose SQL queries, DB time, serialization time and latency are kept by
+# every worker for `GET /stats` (0 to not keep track of them)
+COMPUTER_REQUEST_STATS_WINDOW = int(os.environ.get('COMPUTER_REQUEST_STATS_WINDOW', 1000))
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.11/topics/i18n/
 
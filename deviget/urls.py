@@ -8,9 +8,12 @@ from rest_framework.documentation import include_docs_urls
 from django.conf.urls import include, url
 
 from api.urls import router
+from api.views import metrics, stats
 
 
 urlpatterns = [
     url(r'^v1/', include(router.urls)),
-    url(r'^docs/', include_docs_urls(title='Computer API'))
+    url(r'^docs/', include_docs_urls(title='Computer API')),
+    url(r'^metrics$', metrics, name='metrics'),
+    url(r'^stats$', stats, name='stats'),
 ]